@@ -1,17 +1,300 @@
 """
 AI图片生成模块
 只在需要时生成图片，避免遮挡文字
+每个函数都有异步版本（*_async，基于 client.aio），同步函数在后台事件循环中执行对应的异步版本
 """
 import os
 import io
-from google import genai
+import json
+import math
+import asyncio
+import threading
 from google.genai import types
 import config
+from text_cache import cache_key
+from job_context import current_context
 
-client = genai.Client(api_key=config.API_KEY)
 
+def get_text_cache():
+    """当前任务的文本响应缓存；未启用或打开失败时返回None"""
+    return current_context().text_cache
 
-def simplify_intro_text(intro_text, max_length=150):
+
+# ========== 异步执行环境 ==========
+# 所有模型调用都在同一个后台事件循环里通过 client.aio 发出（客户端取自当前任务上下文）：
+# 同步函数把协程提交到该循环并等待结果，异步函数（*_async）在调用方自己的循环里运行，
+# 只有实际的模型请求转到后台循环执行，因此同步、异步调用方共享同一个并发上限和请求合并
+
+_loop = None
+_loop_lock = threading.Lock()
+_api_slots = None
+
+
+def _background_loop():
+    """后台事件循环（首次使用时在守护线程中启动）"""
+    global _loop, _api_slots
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai-client-loop", daemon=True).start()
+            # 信号量只在后台循环中使用
+            _api_slots = asyncio.Semaphore(config.AI_MAX_CONCURRENCY)
+            _loop = loop
+    return _loop
+
+
+def run_sync(coro):
+    """在后台事件循环中执行协程并等待结果（同步接口使用）；等待被中断时取消该协程"""
+    future = asyncio.run_coroutine_threadsafe(coro, _background_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+async def _on_background_loop(coro):
+    """在后台事件循环中执行协程；调用方被取消时一并取消"""
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+class SingleFlight:
+    """
+    合并进行中的相同请求：同一键的请求正在执行时，后到的调用方等待它完成并共享结果，
+    不再重复调用模型（批量构建时各讲义的封面、标签等提示词常常完全相同）；
+    所有等待方都取消后才取消实际请求
+    合并在进程内进行，计数按任务记录（长时间运行的worker中每份讲义只统计自己的请求）
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}
+
+    def job_stats(self, context=None):
+        """任务的计数 {"calls": 实际调用次数, "coalesced": 合并次数}，默认当前任务"""
+        context = context or current_context()
+        return context.flight_stats.setdefault(self.name, {"calls": 0, "coalesced": 0})
+
+    async def do(self, key, factory):
+        """
+        执行 factory() 返回的协程并返回结果；相同键已在执行时等待其结果（异常同样传给等待方）
+        """
+        return await _on_background_loop(self._join(key, factory, self.job_stats()))
+
+    async def _join(self, key, factory, stats):
+        # 只在后台循环中执行，无需加锁
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory())
+            flight = self._inflight[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            stats["calls"] += 1
+        else:
+            stats["coalesced"] += 1
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(flight["task"])
+        except asyncio.CancelledError:
+            if not flight["task"].done() and flight["waiters"] == 1:
+                flight["task"].cancel()
+            raise
+        finally:
+            flight["waiters"] -= 1
+
+    def summary(self, context=None):
+        stats = self.job_stats(context)
+        return f"{self.name}模型合并相同请求 {stats['coalesced']} 次（实际调用 {stats['calls']} 次）"
+
+
+# 图片模型和文本模型调用分别合并
+image_flights = SingleFlight("图片")
+text_flights = SingleFlight("文本")
+
+
+DEFAULT_INTRO_THEME = "Chinese literature, classic books, traditional scrolls, warm scholarly atmosphere"
+
+KNOWLEDGE_TYPES = ("事实性知识", "概念性知识", "程序性知识")
+
+
+def _normalize_knowledge_type(result):
+    """从模型回答中提取知识类型，无法识别时默认为概念性知识"""
+    result = str(result)
+    for knowledge_type in KNOWLEDGE_TYPES:
+        if knowledge_type in result or knowledge_type[:3] in result:
+            return knowledge_type
+    return "概念性知识"
+
+
+# 各类幻灯片的文本子任务声明
+# 同一页的子任务合并为一次结构化调用，模型返回以子任务名为键的JSON对象
+#   instruction: 子任务说明（可使用 {参数} 占位）
+#   skip: 可选，返回非None时直接使用该值，不发给模型
+#   normalize: 可选，对模型结果做后处理
+#   fallback: 调用失败或缺少结果时使用的默认值
+# 修改提示词模板（包括下方合并调用的提示词）后递增版本号，使旧的缓存结果失效
+SLIDE_TEXT_PROMPT_VERSION = 1
+SLIDE_TEXT_TASKS = {
+    "课堂引入": {
+        "intro_text": {
+            "instruction": (
+                "将原始内容精简到{max_length}字以内：保留关键信息和引入主题，"
+                "保持语言生动有趣，适合高中生理解，只保留精简后的正文"
+            ),
+            "skip": lambda source, params: source if len(source) <= params["max_length"] else None,
+            "normalize": lambda value: str(value).strip(),
+            "fallback": lambda source, params: source[:params["max_length"]] + "...",
+        },
+        "visual_theme": {
+            "instruction": (
+                "分析原始内容的核心主题和视觉元素，用于生成配图。用英文简短描述（50词以内）："
+                "主题关键词（如 literature, books, Chinese classics, reading, study）、"
+                "适合的视觉元素（如 ancient scrolls, traditional Chinese books, students reading, library）、"
+                "氛围和色调（如 warm, scholarly, traditional Chinese style）"
+            ),
+            "normalize": lambda value: str(value).strip(),
+            "fallback": lambda source, params: DEFAULT_INTRO_THEME,
+        },
+    },
+    "知识点": {
+        "knowledge_type": {
+            "instruction": (
+                "判断知识点属于哪一类知识类型，只能是“事实性知识”“概念性知识”“程序性知识”之一。"
+                "事实性知识：学习者通晓一门学科或解决其中的问题所必须知道的基本要素，例如术语、具体细节、基本概念；"
+                "概念性知识：较为抽象概括的、有组织的知识，例如分类、原理、理论、模型；"
+                "程序性知识：关于如何做事的知识，通常体现为一系列要遵循的步骤，例如方法、技能、算法、技巧"
+            ),
+            "normalize": _normalize_knowledge_type,
+            "fallback": lambda source, params: "概念性知识",
+        },
+    },
+}
+
+
+async def run_slide_text_tasks_async(slide_type, source_text, tasks=None, **params):
+    """
+    将一页幻灯片的多个文本子任务合并为一次结构化调用
+    
+    参数:
+        slide_type: SLIDE_TEXT_TASKS 中的幻灯片类型
+        source_text: 该页的原始内容
+        tasks: 要执行的子任务名称列表，默认全部
+        params: 子任务说明中使用的参数
+    
+    返回:
+        字典 {子任务名称: 结果}
+    """
+    declared = SLIDE_TEXT_TASKS[slide_type]
+    tasks = list(tasks or declared.keys())
+    
+    results = {}
+    pending = []
+    for name in tasks:
+        spec = declared[name]
+        skip = spec.get("skip")
+        value = skip(source_text, params) if skip else None
+        if value is not None:
+            results[name] = value
+        else:
+            pending.append(name)
+    
+    if not pending:
+        return results
+    
+    task_lines = "\n".join(
+        f"- {name}: {declared[name]['instruction'].format(**params)}" for name in pending
+    )
+    prompt = f"""
+以下是课件“{slide_type}”页的原始内容，请一次完成下列全部子任务。
+
+原始内容：
+{source_text}
+
+子任务（键名: 要求）：
+{task_lines}
+
+请只返回一个JSON对象，键名为上述子任务名称，值为对应结果（字符串），不要其他说明。
+"""
+    
+    # 相同模型、模板版本和输入的结果直接复用；只缓存模型成功返回的结果，不缓存默认值
+    cache = get_text_cache()
+    key = cache_key(config.TEXT_MODEL, SLIDE_TEXT_PROMPT_VERSION, slide_type, task_lines, source_text)
+    answer = None
+    if cache is not None:
+        try:
+            answer = await asyncio.to_thread(cache.get, key)
+        except Exception as e:
+            print(f"  ⚠️ 读取文本缓存失败: {e}")
+    if answer is not None:
+        print(f"  ♻️ 文本缓存命中: {slide_type} {', '.join(pending)}")
+    else:
+        # 相同调用正在进行时等待其结果；各调用方拿到独立的字典副本
+        answer = dict(await text_flights.do(key, lambda: _call_text_tasks(slide_type, pending, prompt)))
+        if cache is not None and all(answer.get(name) not in (None, "") for name in pending):
+            try:
+                await asyncio.to_thread(cache.put, key, config.TEXT_MODEL, answer)
+            except Exception as e:
+                print(f"  ⚠️ 写入文本缓存失败: {e}")
+    
+    for name in pending:
+        spec = declared[name]
+        value = answer.get(name)
+        if value in (None, ""):
+            results[name] = spec["fallback"](source_text, params)
+            continue
+        normalize = spec.get("normalize")
+        results[name] = normalize(value) if normalize else value
+    
+    return results
+
+
+def run_slide_text_tasks(slide_type, source_text, tasks=None, **params):
+    """同步版本，见 run_slide_text_tasks_async"""
+    return run_sync(run_slide_text_tasks_async(slide_type, source_text, tasks, **params))
+
+
+async def _call_text_tasks(slide_type, pending, prompt):
+    """发出合并调用，返回以子任务名为键的字典；失败时返回空字典"""
+    try:
+        print(f"  📝 合并调用 {slide_type} 文本子任务: {', '.join(pending)}")
+        async with _api_slots:
+            response = await current_context().model_client.aio.models.generate_content(
+                model=config.TEXT_MODEL,
+                contents=prompt,
+                config=types.GenerateContentConfig(response_mime_type="application/json")
+            )
+        answer = json.loads(response.text)
+        if not isinstance(answer, dict):
+            raise ValueError("返回结果不是JSON对象")
+    except Exception as e:
+        print(f"  ⚠️ 文本子任务调用失败: {e}，使用默认结果")
+        return {}
+    # 只保留本次请求的子任务，避免缓存模型多返回的内容
+    return {name: answer[name] for name in pending if name in answer}
+
+
+async def prepare_intro_slide_text_async(intro_text, max_length=150):
+    """
+    课堂引入页的文本准备：一次调用同时得到精简文本和配图视觉主题
+    
+    返回:
+        {"intro_text": 精简后的文本, "visual_theme": 英文视觉主题描述}
+    """
+    return await run_slide_text_tasks_async("课堂引入", intro_text, max_length=max_length)
+
+
+def prepare_intro_slide_text(intro_text, max_length=150):
+    """同步版本，见 prepare_intro_slide_text_async"""
+    return run_sync(prepare_intro_slide_text_async(intro_text, max_length))
+
+
+async def simplify_intro_text_async(intro_text, max_length=150):
     """
     使用AI精简课堂引入内容
     
@@ -25,111 +308,247 @@ def simplify_intro_text(intro_text, max_length=150):
     if len(intro_text) <= max_length:
         return intro_text
     
-    try:
-        print(f"  📝 课堂引入内容较长({len(intro_text)}字)，正在精简...")
-        
-        prompt = f"""
-请将以下课堂引入内容精简到{max_length}字以内，保留核心信息和吸引力：
+    print(f"  📝 课堂引入内容较长({len(intro_text)}字)，正在精简...")
+    simplified = (await run_slide_text_tasks_async(
+        "课堂引入", intro_text, tasks=["intro_text"], max_length=max_length
+    ))["intro_text"]
+    print(f"  ✅ 已精简至{len(simplified)}字")
+    return simplified
 
-原文：
-{intro_text}
 
-要求：
-1. 保留关键信息和引入主题
-2. 保持语言生动有趣
-3. 适合高中生理解
-4. 字数控制在{max_length}字以内
-5. 只返回精简后的文本，不要其他说明
+def simplify_intro_text(intro_text, max_length=150):
+    """同步版本，见 simplify_intro_text_async"""
+    return run_sync(simplify_intro_text_async(intro_text, max_length))
 
-精简后的文本：
-"""
-        
-        response = client.models.generate_content(
-            model=config.TEXT_MODEL,
-            contents=prompt
-        )
-        
-        simplified = response.text.strip()
-        print(f"  ✅ 已精简至{len(simplified)}字")
-        return simplified
+
+# 各模型支持的宽高比预设（宽/高）
+GEMINI_ASPECT_RATIOS = {
+    "1:1": 1.0, "2:3": 2 / 3, "3:2": 3 / 2, "3:4": 3 / 4, "4:3": 4 / 3,
+    "9:16": 9 / 16, "16:9": 16 / 9, "21:9": 21 / 9,
+}
+IMAGEN_ASPECT_RATIOS = {
+    "1:1": 1.0, "3:4": 3 / 4, "4:3": 4 / 3, "9:16": 9 / 16, "16:9": 16 / 9,
+}
+# 输出尺寸预设（长边像素）
+IMAGE_SIZE_PRESETS = (("1K", 1024), ("2K", 2048), ("4K", 4096))
+
+
+def _supports_image_size(model):
+    """模型是否支持 image_size 参数（Imagen 3 及 Gemini 2.x 图片模型不支持）"""
+    model = model.lower()
+    return "imagen-4" in model or "gemini-3" in model
+
+
+def choose_image_request(target_size, model=None):
+    """
+    根据目标像素尺寸选择最接近的宽高比预设和最小够用的输出尺寸
+    
+    参数:
+        target_size: (宽, 高) 像素
+        model: 图片模型名称，默认 config.IMAGE_MODEL
+    
+    返回:
+        (aspect_ratio, image_size)，image_size 在模型不支持时为None
+    """
+    model = model or config.IMAGE_MODEL
+    width, height = target_size
+    presets = GEMINI_ASPECT_RATIOS if "gemini" in model.lower() else IMAGEN_ASPECT_RATIOS
+    target_ratio = width / float(height)
+    # 按对数距离比较宽高比，1:2 和 2:1 偏差相同
+    aspect_ratio = min(presets, key=lambda name: abs(math.log(presets[name] / target_ratio)))
+    
+    image_size = None
+    if _supports_image_size(model):
+        long_edge = max(width, height)
+        # Imagen 最大只支持 2K
+        size_presets = IMAGE_SIZE_PRESETS if "gemini" in model.lower() else IMAGE_SIZE_PRESETS[:2]
+        image_size = size_presets[-1][0]
+        for name, pixels in size_presets:
+            if pixels >= long_edge:
+                image_size = name
+                break
+    return aspect_ratio, image_size
+
+
+def fit_image_to_target(image_data, target_size):
+    """
+    将模型返回的图片缩小到刚好覆盖目标尺寸，不在幻灯片里嵌入看不到的像素
+    
+    返回:
+        图片字节（无需缩小或无法解码时原样返回）
+    """
+    from PIL import Image
+    
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        width, height = img.size
+        scale = max(target_size[0] / float(width), target_size[1] / float(height))
+        if scale >= 1.0:
+            return image_data
         
+        image_format = img.format or "PNG"
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        img = img.resize(new_size, Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            img.convert("RGB").save(output, format="JPEG", quality=90)
+        else:
+            img.save(output, format=image_format)
+        return output.getvalue()
     except Exception as e:
-        print(f"  ⚠️ 精简失败: {e}，使用原文截取")
-        return intro_text[:max_length] + "..."
+        print(f"  ⚠️ 图片缩放失败: {e}，使用原图")
+        return image_data
 
-def generate_image(prompt, aspect_ratio="16:9"):
+
+# 图片模型调用预算按任务上下文计数（每次生成讲义前由 reset_image_budget() 重置）
+
+def reset_image_budget():
+    """重置当前任务的图片模型调用计数"""
+    budget = current_context().image_budget
+    budget["calls"] = 0
+    budget["exhausted"] = False
+
+
+def image_budget_exhausted():
+    """调用次数达到 IMAGE_API_BUDGET，或接口已返回配额耗尽时为True"""
+    context = current_context()
+    if context.image_budget["exhausted"]:
+        return True
+    budget = context.settings.IMAGE_API_BUDGET
+    return budget is not None and context.image_budget["calls"] >= budget
+
+
+def _is_quota_error(error):
+    message = str(error)
+    return "RESOURCE_EXHAUSTED" in message or "429" in message or "quota" in message.lower()
+
+
+async def generate_image_async(prompt, aspect_ratio="16:9", target_size=None):
     """
-    生成AI图片
+    生成AI图片；与进行中的相同请求（模型、提示词、尺寸均相同）合并为一次调用
     
     参数:
         prompt: 图片描述
         aspect_ratio: 宽高比 (16:9, 1:1, 9:16等)
+        target_size: 目标像素尺寸 (宽, 高)，通常由模板占位符尺寸换算得到；
+                     提供时按其选择最接近的宽高比和输出尺寸，并把结果缩小到该尺寸
     
     返回:
         BytesIO对象或None
     """
+    if image_budget_exhausted():
+        print(f"  ⚠️ 图片模型调用预算已用完，跳过: {prompt.strip()[:30]}...")
+        return None
+    
+    image_size = None
+    if target_size:
+        aspect_ratio, image_size = choose_image_request(target_size)
+        target_size = tuple(target_size)
+    
+    key = (config.IMAGE_MODEL, prompt, aspect_ratio, image_size, target_size)
+    image_data = await image_flights.do(key, lambda: _request_image(prompt, aspect_ratio, image_size, target_size))
+    # 每个调用方拿到独立的 BytesIO（读取位置互不影响）
+    return io.BytesIO(image_data) if image_data is not None else None
+
+
+def generate_image(prompt, aspect_ratio="16:9", target_size=None):
+    """同步版本，见 generate_image_async"""
+    return run_sync(generate_image_async(prompt, aspect_ratio, target_size))
+
+
+async def _request_image(prompt, aspect_ratio, image_size, target_size):
+    """调用图片模型，返回图片字节；失败时返回None"""
+    context = current_context()
     try:
         print(f"  🎨 正在生成图片: {prompt[:50]}...")
+        context.image_budget["calls"] += 1
+        
+        image_data = None
         
         # 检查是否使用Gemini图片生成模型
         if "gemini" in config.IMAGE_MODEL.lower():
             # Gemini模型使用generate_content方式
-            response = client.models.generate_content(
-                model=config.IMAGE_MODEL,
-                contents=prompt
-            )
+            image_config = types.ImageConfig(aspect_ratio=aspect_ratio)
+            if image_size:
+                image_config.image_size = image_size
+            async with _api_slots:
+                response = await context.model_client.aio.models.generate_content(
+                    model=config.IMAGE_MODEL,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(image_config=image_config)
+                )
             
             # 从response中提取图片数据
             if hasattr(response, 'candidates') and response.candidates:
                 for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'inline_data'):
+                    if getattr(part, 'inline_data', None) and part.inline_data.data:
                         image_data = part.inline_data.data
-                        return io.BytesIO(image_data)
+                        break
             
-            print(f"  ⚠️ Gemini模型未返回图片数据")
-            return None
+            if image_data is None:
+                print(f"  ⚠️ Gemini模型未返回图片数据")
+                return None
         else:
             # Imagen模型使用generate_images方式
-            response = client.models.generate_images(
-                model=config.IMAGE_MODEL,
-                prompt=prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                    aspect_ratio=aspect_ratio,
-                    safety_filter_level="block_low_and_above",
-                    person_generation="allow_adult"
-                )
+            images_config = types.GenerateImagesConfig(
+                number_of_images=1,
+                aspect_ratio=aspect_ratio,
+                safety_filter_level="block_low_and_above",
+                person_generation="allow_adult"
             )
+            if image_size:
+                images_config.image_size = image_size
+            async with _api_slots:
+                response = await context.model_client.aio.models.generate_images(
+                    model=config.IMAGE_MODEL,
+                    prompt=prompt,
+                    config=images_config
+                )
             
             if response.generated_images:
                 image_data = response.generated_images[0].image.image_bytes
-                return io.BytesIO(image_data)
             else:
                 print(f"  ⚠️ Imagen模型未返回图片数据")
                 return None
+        
+        if target_size:
+            image_data = await asyncio.to_thread(fit_image_to_target, image_data, target_size)
+        return image_data
             
     except Exception as e:
+        if _is_quota_error(e):
+            context.image_budget["exhausted"] = True
         print(f"  ⚠️ 图片生成错误: {e}")
         return None
 
 
-def generate_cover_image(subject, season):
+# 季节 → 封面风格关键词（本地渲染的配色见 local_renderer.SEASON_PALETTES）
+SEASON_MAP = {
+    "春": "spring season, cherry blossoms, fresh green, gentle",
+    "春季": "spring season, cherry blossoms, fresh green, gentle",
+    "夏": "summer season, sunshine, bright, warm",
+    "暑假": "summer season, sunshine, bright, warm",
+    "秋": "autumn season, maple leaves, warm orange and red",
+    "秋季": "autumn season, maple leaves, warm orange and red",
+    "冬": "winter season, snow, cool blue and white",
+    "寒假": "winter season, snow, cool blue and white"
+}
+
+
+async def generate_cover_image_async(subject, season, target_size=None, renderer=None):
     """
     生成封面背景图
     要求：淡雅、不遮挡中间文字区域
+    
+    参数:
+        renderer: "ai" | "local" | "auto"，默认按 config.COVER_RENDERER；
+                  "auto" 在图片模型调用预算用完或生成失败时改用本地渲染
     """
-    season_map = {
-        "春": "spring season, cherry blossoms, fresh green, gentle",
-        "春季": "spring season, cherry blossoms, fresh green, gentle",
-        "夏": "summer season, sunshine, bright, warm",
-        "暑假": "summer season, sunshine, bright, warm",
-        "秋": "autumn season, maple leaves, warm orange and red",
-        "秋季": "autumn season, maple leaves, warm orange and red",
-        "冬": "winter season, snow, cool blue and white",
-        "寒假": "winter season, snow, cool blue and white"
-    }
+    renderer = renderer or current_context().settings.COVER_RENDERER
+    if renderer == "local" or (renderer == "auto" and image_budget_exhausted()):
+        return await generate_cover_image_local_async(subject, season, target_size=target_size)
     
-    season_keywords = season_map.get(season, "minimalist, abstract, soft")
+    season_keywords = SEASON_MAP.get(season, "minimalist, abstract, soft")
     
     prompt = f"""
     Create an elegant background image for an educational presentation cover page.
@@ -148,10 +567,36 @@ def generate_cover_image(subject, season):
     Layout: Border decoration style, center area must be clean and empty
     """
     
-    return generate_image(prompt, aspect_ratio="16:9")
+    image = await generate_image_async(prompt, aspect_ratio="16:9", target_size=target_size)
+    if image is None and renderer == "auto":
+        print("  ↪️ 封面背景改用本地渲染")
+        return await generate_cover_image_local_async(subject, season, target_size=target_size)
+    return image
+
+
+def generate_cover_image(subject, season, target_size=None, renderer=None):
+    """同步版本，见 generate_cover_image_async"""
+    return run_sync(generate_cover_image_async(subject, season, target_size, renderer))
+
+
+def generate_cover_image_local(subject, season, target_size=None):
+    """
+    本地渲染封面背景（季节配色渐变 + 四周装饰 + 学科底纹，不调用模型）
+    
+    返回:
+        BytesIO对象
+    """
+    from local_renderer import render_cover_background
+    
+    return render_cover_background(subject, season, size=target_size, motif=current_context().settings.COVER_SUBJECT_MOTIF)
+
+
+async def generate_cover_image_local_async(subject, season, target_size=None):
+    """异步版本（在线程中渲染，不阻塞事件循环）"""
+    return await asyncio.to_thread(generate_cover_image_local, subject, season, target_size)
 
 
-def generate_lecture_title_image(title):
+async def generate_lecture_title_image_async(title, target_size=None):
     """
     生成讲义标题配图
     要求：与标题内容相关，放在标题旁边
@@ -167,43 +612,29 @@ def generate_lecture_title_image(title):
     - Size suitable for sidebar decoration
     """
     
-    return generate_image(prompt, aspect_ratio="1:1")
+    return await generate_image_async(prompt, aspect_ratio="1:1", target_size=target_size)
 
 
-def generate_intro_image(intro_text):
+def generate_lecture_title_image(title, target_size=None):
+    """同步版本，见 generate_lecture_title_image_async"""
+    return run_sync(generate_lecture_title_image_async(title, target_size))
+
+
+async def generate_intro_image_async(intro_text, theme_description=None, target_size=None):
     """
     生成课堂引入配图
     要求：根据引入内容生成纯装饰性配图，不包含文字
+    
+    参数:
+        intro_text: 课堂引入内容
+        theme_description: 已提取的英文视觉主题（见 prepare_intro_slide_text），
+                           提供时不再单独调用文本模型
     """
-    # 使用AI提取关键主题
-    try:
+    if not theme_description:
+        # 使用AI提取关键主题
         print(f"  📝 分析课堂引入内容，提取视觉主题...")
-        
-        analysis_prompt = f"""
-请分析以下课堂引入内容，提取其核心主题和视觉元素，用于生成配图。
-
-课堂引入内容：
-{intro_text}
-
-请用英文简短描述（50词以内）：
-1. 主题关键词（如：literature, books, Chinese classics, reading, study等）
-2. 适合的视觉元素（如：ancient scrolls, traditional Chinese books, students reading, library等）
-3. 氛围和色调（如：warm, scholarly, traditional Chinese style等）
-
-只返回英文描述，不要其他说明：
-"""
-        
-        response = client.models.generate_content(
-            model=config.TEXT_MODEL,
-            contents=analysis_prompt
-        )
-        
-        theme_description = response.text.strip()
-        print(f"  ✅ 主题提取完成")
-        
-    except Exception as e:
-        print(f"  ⚠️ 主题提取失败: {e}，使用默认主题")
-        theme_description = "Chinese literature, classic books, traditional scrolls, warm scholarly atmosphere"
+        theme_texts = await run_slide_text_tasks_async("课堂引入", intro_text, tasks=["visual_theme"])
+        theme_description = theme_texts["visual_theme"]
     
     prompt = f"""
 Create a beautiful, decorative illustration for a Chinese language class introduction.
@@ -242,10 +673,15 @@ STYLE:
 The image should be purely decorative and complement the text content without containing any words!
 """
     
-    return generate_image(prompt, aspect_ratio="16:9")
+    return await generate_image_async(prompt, aspect_ratio="16:9", target_size=target_size)
 
 
-def classify_knowledge_type(title, content):
+def generate_intro_image(intro_text, theme_description=None, target_size=None):
+    """同步版本，见 generate_intro_image_async"""
+    return run_sync(generate_intro_image_async(intro_text, theme_description, target_size))
+
+
+async def classify_knowledge_type_async(title, content):
     """
     使用AI判断知识点类型
     
@@ -256,60 +692,25 @@ def classify_knowledge_type(title, content):
     返回:
         知识类型: "事实性知识" | "概念性知识" | "程序性知识"
     """
-    try:
-        print(f"  🔍 正在分析知识点类型...")
-        
-        prompt = f"""
-请判断以下知识点属于哪一类知识类型：
-
-知识点标题：{title}
-知识点内容：{content[:300]}
+    print(f"  🔍 正在分析知识点类型...")
+    source_text = f"知识点标题：{title}\n知识点内容：{content[:300]}"
+    knowledge_type = (await run_slide_text_tasks_async("知识点", source_text, tasks=["knowledge_type"]))["knowledge_type"]
+    print(f"  ✅ 知识类型: {knowledge_type}")
+    return knowledge_type
 
-三类知识点定义：
-1. 事实性知识：又叫事实，是指学习者通晓一门学科或解决其中的问题所必须知道的基本要素。例如：术语、具体细节、基本概念等。
-2. 概念性知识：是一种较为抽象概括的、有组织的知识类型。例如：分类、原理、理论、模型等。
-3. 程序性知识：是关于如何做事的知识，通常体现为一系列要遵循的步骤或程序。例如：方法、技能、算法、技巧等。
 
-请仔细分析知识点的内容特征，只返回以下三个选项之一：
-- 事实性知识
-- 概念性知识
-- 程序性知识
-
-你的判断（只返回类型名称，不要其他说明）：
-"""
-        
-        response = client.models.generate_content(
-            model=config.TEXT_MODEL,
-            contents=prompt
-        )
-        
-        result = response.text.strip()
-        
-        # 提取关键词
-        if "事实性知识" in result or "事实性" in result:
-            knowledge_type = "事实性知识"
-        elif "概念性知识" in result or "概念性" in result:
-            knowledge_type = "概念性知识"
-        elif "程序性知识" in result or "程序性" in result:
-            knowledge_type = "程序性知识"
-        else:
-            # 默认为概念性知识
-            knowledge_type = "概念性知识"
-        
-        print(f"  ✅ 知识类型: {knowledge_type}")
-        return knowledge_type
-        
-    except Exception as e:
-        print(f"  ⚠️ 知识类型判断失败: {e}，使用默认类型")
-        return "概念性知识"
+def classify_knowledge_type(title, content):
+    """同步版本，见 classify_knowledge_type_async"""
+    return run_sync(classify_knowledge_type_async(title, content))
 
 
-def generate_knowledge_type_badge(knowledge_type):
+async def generate_knowledge_type_badge_async(knowledge_type, target_size=None):
     """
     生成知识类型标签图片
     
     参数:
         knowledge_type: "事实性知识" | "概念性知识" | "程序性知识"
+        target_size: 目标像素尺寸 (宽, 高)，按标签占位符换算
     
     返回:
         BytesIO对象或None
@@ -369,10 +770,15 @@ The badge must be SIMPLE, CLEAR, and IMMEDIATELY READABLE when placed in a small
     print(f"  🎨 正在生成知识类型标签: {knowledge_type}")
     
     # 使用更宽的宽高比以适应占位符
-    return generate_image(prompt, aspect_ratio="16:9")
+    return await generate_image_async(prompt, aspect_ratio="16:9", target_size=target_size)
 
 
-def generate_knowledge_point_image(title, content):
+def generate_knowledge_type_badge(knowledge_type, target_size=None):
+    """同步版本，见 generate_knowledge_type_badge_async"""
+    return run_sync(generate_knowledge_type_badge_async(knowledge_type, target_size))
+
+
+async def generate_knowledge_point_image_async(title, content, target_size=None):
     """
     生成知识点配图（可选）
     要求：辅助理解知识点
@@ -387,211 +793,43 @@ def generate_knowledge_point_image(title, content):
     - Professional academic style
     """
     
-    return generate_image(prompt, aspect_ratio="1:1")
+    return await generate_image_async(prompt, aspect_ratio="1:1", target_size=target_size)
+
 
+def generate_knowledge_point_image(title, content, target_size=None):
+    """同步版本，见 generate_knowledge_point_image_async"""
+    return run_sync(generate_knowledge_point_image_async(title, content, target_size))
 
-def generate_learning_objectives_image_old(objectives):
+
+def generate_learning_objectives_image_local(objectives, target_size=None, layout=None):
     """
-    生成学习目标层级图
-    混合方案：Python生成清晰文字 + AI生成创意背景
+    本地渲染学习目标层级图（不调用模型，文字清晰，毫秒级）
     
     参数:
         objectives: 学习目标列表
+        target_size: 目标像素尺寸 (宽, 高)
+        layout: "stairs" | "cards" | "timeline" | "pyramid"，默认按 config.LEARNING_OBJECTIVES_LAYOUT
     
     返回:
         BytesIO对象
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import io
-    import random
-    
-    # 解析层级
-    levels = []
-    clean_objectives = []
+    from local_renderer import render_learning_objectives_image
     
-    level_keywords = ["识记", "理解", "操作", "运用", "迁移", "分析", "综合", "评价"]
-    level_colors = {
-        "识记": ("#7ED7C1", "#5BC0BE"),
-        "理解": ("#00A896", "#028090"), 
-        "操作": ("#F39C12", "#E67E22"),
-        "运用": ("#E74C3C", "#C0392B"),
-        "迁移": ("#9B59B6", "#8E44AD"),
-        "分析": ("#3498DB", "#2980B9"),
-        "综合": ("#1ABC9C", "#16A085"),
-        "评价": ("#E67E22", "#D35400")
-    }
-    
-    for obj in objectives:
-        found_level = None
-        for keyword in level_keywords:
-            if keyword in obj:
-                found_level = keyword
-                break
-        
-        if not found_level:
-            found_level = "理解"
-        
-        levels.append(found_level)
-        clean_objectives.append(obj)
-    
-    # 创建图片
-    width, height = 1920, 1080
-    img = Image.new('RGBA', (width, height), (255, 255, 255, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # 随机选择布局风格
-    layout_styles = ["stairs", "cards", "timeline", "pyramid"]
-    selected_layout = random.choice(layout_styles)
-    
-    # 加载字体
-    try:
-        level_font = ImageFont.truetype("msyhbd.ttc", 56)
-        text_font = ImageFont.truetype("msyh.ttc", 44)
-        number_font = ImageFont.truetype("msyhbd.ttc", 72)
-    except:
-        try:
-            level_font = ImageFont.truetype("simhei.ttf", 56)
-            text_font = ImageFont.truetype("simhei.ttf", 44)
-            number_font = ImageFont.truetype("simhei.ttf", 72)
-        except:
-            level_font = ImageFont.load_default()
-            text_font = ImageFont.load_default()
-            number_font = ImageFont.load_default()
-    
-    # 根据布局风格绘制
-    if selected_layout == "stairs":
-        # 阶梯式布局
-        start_y = 150
-        step_height = (height - start_y - 100) // len(objectives)
-        
-        for i, (level, obj) in enumerate(zip(levels, clean_objectives)):
-            y = start_y + i * step_height
-            x_offset = i * 150
-            
-            # 获取颜色
-            colors = level_colors.get(level, ("#00A896", "#028090"))
-            
-            # 绘制卡片背景
-            card_x = 200 + x_offset
-            card_y = y
-            card_width = 1500 - x_offset
-            card_height = step_height - 30
-            
-            # 渐变效果（简化版）
-            for dy in range(card_height):
-                ratio = dy / card_height
-                r1, g1, b1 = int(colors[0][1:3], 16), int(colors[0][3:5], 16), int(colors[0][5:7], 16)
-                r2, g2, b2 = int(colors[1][1:3], 16), int(colors[1][3:5], 16), int(colors[1][5:7], 16)
-                r = int(r1 * (1-ratio) + r2 * ratio)
-                g = int(g1 * (1-ratio) + g2 * ratio)
-                b = int(b1 * (1-ratio) + b2 * ratio)
-                draw.line([(card_x, card_y + dy), (card_x + card_width, card_y + dy)], 
-                         fill=(r, g, b, 230))
-            
-            # 绘制编号圆圈
-            circle_x = card_x - 60
-            circle_y = card_y + card_height // 2
-            draw.ellipse([circle_x - 50, circle_y - 50, circle_x + 50, circle_y + 50],
-                        fill=colors[0], outline='white', width=5)
-            
-            # 绘制编号
-            num_bbox = draw.textbbox((0, 0), str(i+1), font=number_font)
-            num_width = num_bbox[2] - num_bbox[0]
-            num_height = num_bbox[3] - num_bbox[1]
-            draw.text((circle_x - num_width//2, circle_y - num_height//2), 
-                     str(i+1), fill='white', font=number_font)
-            
-            # 绘制层级标签
-            level_text = f"{level}"
-            draw.text((card_x + 40, card_y + 20), level_text, fill='white', font=level_font)
-            
-            # 绘制目标内容
-            content_y = card_y + 85
-            # 处理长文本
-            if len(obj) > 25:
-                mid = len(obj) // 2
-                # 找最近的标点符号
-                for j in range(mid - 5, mid + 5):
-                    if j < len(obj) and obj[j] in '，。、；':
-                        mid = j + 1
-                        break
-                line1 = obj[:mid]
-                line2 = obj[mid:]
-                draw.text((card_x + 40, content_y), line1, fill='white', font=text_font)
-                draw.text((card_x + 40, content_y + 55), line2, fill='white', font=text_font)
-            else:
-                draw.text((card_x + 40, content_y), obj, fill='white', font=text_font)
-    
-    elif selected_layout == "cards":
-        # 卡片式布局
-        start_y = 200
-        spacing = (height - start_y - 100) // len(objectives)
-        
-        for i, (level, obj) in enumerate(zip(levels, clean_objectives)):
-            y = start_y + i * spacing
-            colors = level_colors.get(level, ("#00A896", "#028090"))
-            
-            # 绘制卡片
-            card_x = 150
-            card_width = 1620
-            card_height = spacing - 40
-            
-            # 绘制阴影
-            shadow_offset = 8
-            draw.rounded_rectangle(
-                [card_x + shadow_offset, y + shadow_offset, 
-                 card_x + card_width + shadow_offset, y + card_height + shadow_offset],
-                radius=20, fill=(0, 0, 0, 50)
-            )
-            
-            # 绘制卡片主体
-            draw.rounded_rectangle(
-                [card_x, y, card_x + card_width, y + card_height],
-                radius=20, fill=colors[0], outline='white', width=4
-            )
-            
-            # 绘制层级标签区域
-            label_width = 200
-            draw.rounded_rectangle(
-                [card_x, y, card_x + label_width, y + card_height],
-                radius=20, fill=colors[1]
-            )
-            
-            # 绘制编号和层级
-            draw.text((card_x + 100, y + 30), str(i+1), fill='white', 
-                     font=number_font, anchor="mm")
-            draw.text((card_x + 100, y + card_height - 40), level, fill='white',
-                     font=level_font, anchor="mm")
-            
-            # 绘制目标内容
-            content_x = card_x + label_width + 50
-            content_y = y + card_height // 2
-            
-            if len(obj) > 25:
-                mid = len(obj) // 2
-                for j in range(mid - 5, mid + 5):
-                    if j < len(obj) and obj[j] in '，。、；':
-                        mid = j + 1
-                        break
-                line1 = obj[:mid]
-                line2 = obj[mid:]
-                draw.text((content_x, content_y - 30), line1, fill='white', font=text_font)
-                draw.text((content_x, content_y + 30), line2, fill='white', font=text_font)
-            else:
-                draw.text((content_x, content_y), obj, fill='white', font=text_font)
-    
-    # 保存到BytesIO
-    output = io.BytesIO()
-    img.save(output, format='PNG')
-    output.seek(0)
-    
-    print(f"    🎨 已生成学习目标图（布局: {selected_layout}）")
-    
-    return output
+    return render_learning_objectives_image(
+        objectives, layout=layout or current_context().settings.LEARNING_OBJECTIVES_LAYOUT, size=target_size
+    )
+
+
+async def generate_learning_objectives_image_local_async(objectives, target_size=None, layout=None):
+    """异步版本（在线程中渲染，不阻塞事件循环）"""
+    return await asyncio.to_thread(generate_learning_objectives_image_local, objectives, target_size, layout)
 
 
+# 兼容旧名称
+generate_learning_objectives_image_old = generate_learning_objectives_image_local
 
-def generate_learning_objectives_image(objectives):
+
+async def generate_learning_objectives_image_async(objectives, target_size=None):
     """
     生成手绘风格的学习目标层级图
     使用AI生成创意手绘插画风格
@@ -714,4 +952,9 @@ The final image should look like a creative, hand-drawn teaching poster that stu
     
     print(f"  🎨 生成手绘风格学习目标图（主题: {selected_theme['name']}）")
     
-    return generate_image(prompt, aspect_ratio="16:9")
+    return await generate_image_async(prompt, aspect_ratio="16:9", target_size=target_size)
+
+
+def generate_learning_objectives_image(objectives, target_size=None):
+    """同步版本，见 generate_learning_objectives_image_async"""
+    return run_sync(generate_learning_objectives_image_async(objectives, target_size))
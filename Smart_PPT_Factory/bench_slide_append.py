@@ -0,0 +1,100 @@
+"""
+幻灯片追加性能测试
+对比 python-pptx 的 prs.slides.add_slide 与 SlideAppender（增量维护ID/部件名/关系ID）
+在不同页数下的每页耗时，并检查生成的文件能正常打开、ID和部件名不重复
+
+用法:
+    python bench_slide_append.py
+    python bench_slide_append.py --sizes 10 100 1000 2000 --layout 8
+"""
+import gc
+import io
+import time
+import argparse
+
+from pptx import Presentation
+
+import config
+from slide_builder import SlideAppender
+
+
+def empty_presentation():
+    """加载模板并删除预设幻灯片（与 main.py 相同）"""
+    prs = Presentation(config.MASTER_TEMPLATE)
+    while len(prs.slides) > 0:
+        rId = prs.slides._sldIdLst[0].rId
+        prs.part.drop_rel(rId)
+        del prs.slides._sldIdLst[0]
+    return prs
+
+
+def run(method, sizes, layout_index):
+    """
+    追加到 sizes 中最大的页数，记录每个区间内的平均每页耗时
+
+    返回:
+        (Presentation, [(区间起点, 区间终点, 每页毫秒数), ...])
+    """
+    prs = empty_presentation()
+    layout = prs.slide_layouts[layout_index]
+    if method == "python-pptx":
+        add = lambda: prs.slides.add_slide(layout)
+    else:
+        appender = SlideAppender(prs)
+        add = lambda: appender.add_slide(layout)
+
+    results = []
+    count = 0
+    start = time.perf_counter()
+    for size in sorted(sizes):
+        begin = count
+        while count < size:
+            add()
+            count += 1
+        now = time.perf_counter()
+        results.append((begin, size, (now - start) * 1000.0 / max(size - begin, 1)))
+        start = now
+    return prs, results
+
+
+def verify(prs, expected):
+    """保存后重新打开，检查页数、幻灯片ID和部件名"""
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    reopened = Presentation(io.BytesIO(buffer.getvalue()))
+    ids = [slide.slide_id for slide in reopened.slides]
+    partnames = [str(slide.part.partname) for slide in reopened.slides]
+    assert len(ids) == expected, f"页数不符: {len(ids)} != {expected}"
+    assert len(set(ids)) == expected, "幻灯片ID重复"
+    assert len(set(partnames)) == expected, "部件名重复"
+    return len(buffer.getvalue())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="幻灯片追加性能测试")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500, 1000, 2000],
+                            help="统计耗时的页数节点")
+    arg_parser.add_argument("--layout", type=int, default=8, help="使用的布局索引")
+    args = arg_parser.parse_args()
+
+    timings = {}
+    for method in ("python-pptx", "appender"):
+        prs, timings[method] = run(method, args.sizes, args.layout)
+        size = verify(prs, max(args.sizes))
+        print(f"✅ {method}: 文件校验通过（{size / 1048576.0:.1f} MB）")
+        # 释放上一轮的演示文稿，避免垃圾回收扫描它影响下一轮计时
+        del prs
+        gc.collect()
+
+    print(f"\n📊 追加 {max(args.sizes)} 页（布局{args.layout}），每个区间的平均每页耗时：")
+    print(f"{'区间':>14} {'python-pptx':>14} {'SlideAppender':>14}")
+    for (begin, end, base), (_, _, fast) in zip(timings["python-pptx"], timings["appender"]):
+        print(f"{f'{begin + 1}-{end}':>14} {base:>11.3f} ms {fast:>11.3f} ms")
+
+    first, last = timings["appender"][0][2], timings["appender"][-1][2]
+    print(f"\n📈 SlideAppender 末段/首段每页耗时比: {last / first:.2f}"
+          f"（python-pptx: {timings['python-pptx'][-1][2] / timings['python-pptx'][0][2]:.2f}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+流式写出内存测试
+每种方式在独立子进程中构建同样的图片密集课件（每页一张不同的噪点图，无法去重也几乎无法压缩），
+对比 prs.save() 一次性保存与 StreamingDeckWriter 逐页写出的峰值内存和耗时，并检查两份输出内容相同
+
+用法:
+    python bench_stream_write.py
+    python bench_stream_write.py --slides 300 --image-px 800
+"""
+import io
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import subprocess
+
+import config
+from deck_shards import empty_presentation
+from slide_builder import SlideBuilder
+from stream_writer import StreamingDeckWriter
+from pdf_text import peak_rss_mb
+
+MODES = ("save", "stream")
+
+
+def noise_png(px, seed):
+    """px×px 的噪点PNG（每个seed内容不同）"""
+    import numpy as np
+    from PIL import Image
+    pixels = np.random.default_rng(seed).integers(0, 256, (px, px, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=1)
+    buffer.seek(0)
+    return buffer
+
+
+def build(mode, slides, image_px, output_path):
+    """子进程：构建课件并返回 {"seconds": 耗时, "peak_mb": 峰值内存}"""
+    start = time.perf_counter()
+    prs = empty_presentation(config.MASTER_TEMPLATE)
+    builder = SlideBuilder(prs)
+    writer = StreamingDeckWriter(prs, output_path) if mode == "stream" else None
+    for i in range(slides):
+        slide = builder.create_slide(8)
+        builder.add_textbox(slide, f"第 {i + 1} 页", 1, 0.5, 8, 1)
+        builder.add_image(slide, noise_png(image_px, i), left=2, top=2, width=8, height=6)
+        if writer:
+            writer.flush()
+    if writer:
+        writer.close()
+    else:
+        prs.save(output_path)
+    return {"seconds": time.perf_counter() - start, "peak_mb": peak_rss_mb()}
+
+
+def same_content(path_a, path_b):
+    """两个PPT的成员集合及每个成员的内容是否相同（成员顺序可以不同）"""
+    with zipfile.ZipFile(path_a) as a, zipfile.ZipFile(path_b) as b:
+        names = sorted(a.namelist())
+        return names == sorted(b.namelist()) and all(a.read(n) == b.read(n) for n in names)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="流式写出内存测试")
+    arg_parser.add_argument("--slides", type=int, default=200, help="页数")
+    arg_parser.add_argument("--image-px", type=int, default=640, help="每页噪点图的边长（像素）")
+    arg_parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    arg_parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(build(args.child, args.slides, args.image_px, args.output)))
+        return
+
+    out_dir = os.path.join(config.SCRIPT_DIR, "output")
+    os.makedirs(out_dir, exist_ok=True)
+    results, paths = {}, {}
+    for mode in MODES:
+        paths[mode] = os.path.join(out_dir, f"bench_stream_{mode}.pptx")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--slides", str(args.slides),
+             "--image-px", str(args.image_px), "--output", paths[mode]],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    size = os.path.getsize(paths["save"]) / 1048576.0
+    print(f"📊 {args.slides} 页，每页一张 {args.image_px}×{args.image_px} 噪点图（文件 {size:.0f} MB）：")
+    print(f"{'方式':>10} {'峰值内存':>12} {'耗时':>10}")
+    for mode in MODES:
+        peak = results[mode]["peak_mb"]
+        peak_text = "-" if peak is None else f"{peak:.0f} MB"
+        print(f"{mode:>10} {peak_text:>12} {results[mode]['seconds']:>8.1f} s")
+    if same_content(paths["save"], paths["stream"]):
+        print("\n✅ 两种方式输出内容相同")
+    else:
+        print("\n❌ 两种方式输出内容不同")
+    for path in paths.values():
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+文本写入性能测试
+对比 python-pptx 代理对象逐项设置（原 SlideBuilder.add_textbox / ph.text 的写法）
+与 text_xml 预编译XML写入在不同段落数下的耗时，并检查两种写法生成的XML完全相同
+
+用法:
+    python bench_text_xml.py
+    python bench_text_xml.py --paragraphs 5 50 500 --repeat 20
+"""
+import time
+import argparse
+
+from lxml import etree
+from pptx import Presentation
+from pptx.util import Inches, Pt
+from pptx.dml.color import RGBColor
+from pptx.enum.text import PP_ALIGN
+from pptx.enum.shapes import PP_PLACEHOLDER
+
+import config
+import text_xml
+
+TEXTBOX_STYLE = dict(font_size=24, font_name="微软雅黑", bold=True, color=(0x33, 0x66, 0x99), align="center")
+PLACEHOLDER_FONT_SIZE = 18
+
+
+def proxy_textbox(slide, text, left, top, width, height,
+                  font_size=28, font_name="微软雅黑", bold=False, color=(0, 0, 0), align="left"):
+    """原 SlideBuilder.add_textbox 的写法"""
+    textbox = slide.shapes.add_textbox(Inches(left), Inches(top), Inches(width), Inches(height))
+    tf = textbox.text_frame
+    tf.word_wrap = True
+    tf.text = str(text)
+    for paragraph in tf.paragraphs:
+        paragraph.font.name = font_name
+        paragraph.font.size = Pt(font_size)
+        paragraph.font.bold = bold
+        paragraph.font.color.rgb = RGBColor(*color)
+        if align == "center":
+            paragraph.alignment = PP_ALIGN.CENTER
+        elif align == "right":
+            paragraph.alignment = PP_ALIGN.RIGHT
+        else:
+            paragraph.alignment = PP_ALIGN.LEFT
+    return textbox
+
+
+def proxy_placeholder(ph, text, font_size=None):
+    """原 ph.text = ... 及 create_text_slides 中逐个设置字号的写法"""
+    ph.text = text
+    if font_size is not None:
+        for paragraph in ph.text_frame.paragraphs:
+            for run in paragraph.runs:
+                run.font.size = Pt(font_size)
+
+
+def fast_textbox(slide, text, left, top, width, height, **style):
+    return text_xml.add_textbox(slide, text, Inches(left), Inches(top), Inches(width), Inches(height), **style)
+
+
+def sample_text(paragraphs):
+    """模拟讲义内容：长短不一的段落，夹带段内换行、控制字符和需要转义的字符"""
+    lines = []
+    for i in range(paragraphs):
+        line = f"{i + 1}. 已知函数 f(x) = x² + 2x，当 x < {i} & y > 0 时，求 f(x) 的最小值"
+        if i % 7 == 3:
+            line += "\v（提示：配方）"
+        if i % 11 == 5:
+            line += "\x0b\x01"
+        lines.append(line if i % 13 != 6 else "")
+    return "\n".join(lines)
+
+
+def new_slide(prs, layout_index):
+    return prs.slides.add_slide(prs.slide_layouts[layout_index])
+
+
+def body_placeholder(slide):
+    """取第一个正文占位符"""
+    for ph in slide.placeholders:
+        if ph.placeholder_format.type == PP_PLACEHOLDER.BODY:
+            return ph
+    raise ValueError("布局中没有正文占位符")
+
+
+def timed(func, repeat):
+    """执行 repeat 次，返回 (最后一次的结果, 平均每次毫秒数)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def xml_of(element):
+    return etree.tostring(element, encoding="unicode")
+
+
+def bench(paragraphs, repeat, layout_index):
+    """
+    返回:
+        {"textbox": (原写法毫秒, 快速写法毫秒), "placeholder": (...)}
+    """
+    prs = Presentation(config.MASTER_TEMPLATE)
+    text = sample_text(paragraphs)
+    results = {}
+
+    # 文本框：每次在新幻灯片上添加，比较形状XML
+    slide_a, slide_b = new_slide(prs, layout_index), new_slide(prs, layout_index)
+    _, base = timed(lambda: proxy_textbox(slide_a, text, 1, 1, 8, 5, **TEXTBOX_STYLE), repeat)
+    _, fast = timed(lambda: fast_textbox(slide_b, text, 1, 1, 8, 5, **TEXTBOX_STYLE), repeat)
+    assert xml_of(slide_a.shapes._spTree) == xml_of(slide_b.shapes._spTree), "文本框XML不一致"
+    results["textbox"] = (base, fast)
+
+    # 占位符：反复替换同一占位符的文字，比较 txBody
+    ph_a = body_placeholder(new_slide(prs, layout_index))
+    ph_b = body_placeholder(new_slide(prs, layout_index))
+    _, base = timed(lambda: proxy_placeholder(ph_a, text, PLACEHOLDER_FONT_SIZE), repeat)
+    _, fast = timed(lambda: text_xml.set_text(ph_b, text, PLACEHOLDER_FONT_SIZE), repeat)
+    assert xml_of(ph_a._element.txBody) == xml_of(ph_b._element.txBody), "占位符XML不一致"
+    results["placeholder"] = (base, fast)
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="文本写入性能测试")
+    arg_parser.add_argument("--paragraphs", type=int, nargs="+", default=[5, 50, 500],
+                            help="每个文本框/占位符的段落数")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="每种写法的重复次数")
+    arg_parser.add_argument("--layout", type=int, default=10, help="使用的布局索引（需含正文占位符）")
+    args = arg_parser.parse_args()
+
+    rows = []
+    for paragraphs in args.paragraphs:
+        results = bench(paragraphs, args.repeat, args.layout)
+        rows.append((paragraphs, results))
+        print(f"✅ {paragraphs} 段: 两种写法生成的XML一致")
+
+    print(f"\n📊 平均每次写入耗时（重复 {args.repeat} 次）：")
+    print(f"{'段落数':>8} {'对象':>12} {'python-pptx':>14} {'text_xml':>14} {'加速':>8}")
+    for paragraphs, results in rows:
+        for kind, (base, fast) in results.items():
+            print(f"{paragraphs:>8} {kind:>12} {base:>11.3f} ms {fast:>11.3f} ms {base / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
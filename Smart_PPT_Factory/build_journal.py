@@ -0,0 +1,161 @@
+"""
+讲义构建检查点日志
+记录每个已完成的AI产物（精简文本、知识类型、图片、解析后的JSON），
+构建中途失败时重新运行可从检查点恢复，只补发缺失的调用
+"""
+import os
+import io
+import re
+import json
+import shutil
+import hashlib
+import threading
+
+import config
+
+
+def fingerprint(*parts):
+    """计算输入指纹，输入变化后旧检查点自动失效"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """计算文件内容的SHA1"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildJournal:
+    """
+    单个讲义的检查点日志
+
+    日志以JSON Lines形式追加写入，每条记录写入后立即落盘；
+    图片单独保存为文件，记录中只保存文件名。
+    """
+
+    def __init__(self, deck_id, root=None):
+        self.deck_id = deck_id
+        self.dir = os.path.join(root or config.BUILD_JOURNAL_DIR, deck_id)
+        self.path = os.path.join(self.dir, "journal.jsonl")
+        self._entries = {}
+        self.reused = 0
+        self.recorded = 0
+        # 草稿优先构建时后台线程也会写入（见 draft_build.py）
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_source(cls, source_path, root=None):
+        """
+        以源文件（PDF或course.json）内容的哈希作为讲义ID
+
+        参数:
+            root: 检查点根目录，默认 config.BUILD_JOURNAL_DIR；构建时传入任务上下文的 journal_dir，
+                  并行处理同一份讲义的任务各用各的目录
+        """
+        return cls(file_digest(source_path)[:16], root)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程在写入过程中被中断，忽略不完整的最后一行
+                    continue
+                self._entries[entry["stage"]] = entry
+        if self._entries:
+            print(f"  ♻️ 发现构建检查点: {len(self._entries)} 项已完成 ({self.deck_id})")
+
+    def _append(self, entry):
+        with self._lock:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[entry["stage"]] = entry
+            self.recorded += 1
+
+    def count(self):
+        """已记录的阶段数（大于0表示在续跑中断的构建）"""
+        return len(self._entries)
+
+    def get(self, stage, fp=None):
+        """获取检查点记录，不存在或指纹不匹配时返回None"""
+        entry = self._entries.get(stage)
+        if entry is None or entry.get("fp") != fp:
+            return None
+        return entry
+
+    def record(self, stage, value, fp=None):
+        """记录一个已完成阶段的结果（需可JSON序列化）"""
+        self._append({"stage": stage, "fp": fp, "value": value})
+
+    def cached(self, stage, fp, fn):
+        """
+        从检查点读取文本类结果，缺失时调用 fn 并记录
+
+        参数:
+            stage: 阶段名称（如 "intro_text"、"kp_type_3"）
+            fp: 输入指纹
+            fn: 无参函数，返回可JSON序列化的结果
+        """
+        entry = self.get(stage, fp)
+        if entry is not None:
+            self.reused += 1
+            return entry["value"]
+        value = fn()
+        if value is not None:
+            self.record(stage, value, fp)
+        return value
+
+    def cached_image(self, stage, fp, fn):
+        """
+        从检查点读取图片，缺失时调用 fn 生成并保存
+
+        参数:
+            fn: 无参函数，返回BytesIO或None（None不记录，下次重新生成）
+
+        返回:
+            BytesIO对象或None
+        """
+        entry = self.get(stage, fp)
+        if entry is not None:
+            image_path = os.path.join(self.dir, entry["value"])
+            if os.path.exists(image_path):
+                self.reused += 1
+                with open(image_path, "rb") as f:
+                    return io.BytesIO(f.read())
+
+        image = fn()
+        if image is None:
+            return None
+
+        filename = re.sub(r"[^\w.-]", "_", stage) + ".img"
+        image_path = os.path.join(self.dir, filename)
+        os.makedirs(self.dir, exist_ok=True)
+        tmp_path = image_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, image_path)
+        self.record(stage, filename, fp)
+        image.seek(0)
+        return image
+
+    def finish(self):
+        """构建成功后删除检查点"""
+        if os.path.isdir(self.dir):
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self._entries = {}
+
+    def summary(self):
+        return f"复用检查点 {self.reused} 项，新增 {self.recorded} 项"
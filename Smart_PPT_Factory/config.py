@@ -1,5 +1,4 @@
 import os
-import time
 from dotenv import load_dotenv
 
 # 获取项目根目录
@@ -21,7 +20,8 @@ IMAGE_MODEL = "gemini-3-pro-image-preview"  # Gemini 3 Pro Image (中文支持
 
 # 路径配置 - 使用绝对路径
 JSON_PATH = os.path.join(SCRIPT_DIR, "data", "course.json")
-OUTPUT_PATH = os.path.join(SCRIPT_DIR, "output", f"Final_Courseware_{int(time.time())}.pptx")
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output")
+OUTPUT_PATH = None  # 固定输出路径；None 时每次构建按任务ID生成 output/Final_Courseware_<任务ID>.pptx（见 job_context.py）
 MASTER_TEMPLATE = os.path.join(SCRIPT_DIR, "assets", "master_template.pptx")
 ASSET_DIR = os.path.join(SCRIPT_DIR, "assets")
 PDF_DIR = os.path.join(SCRIPT_DIR, "data")
@@ -31,3 +31,91 @@ INPUT_FILE = os.path.join(SCRIPT_DIR, "data", "raw_content.txt")
 IMAGE_GENERATION_TIMEOUT = 15  # 秒
 DEFAULT_SLIDE_WIDTH = 16  # 英寸
 DEFAULT_SLIDE_HEIGHT = 9  # 英寸
+
+# 任务队列配置（批量重新生成）
+JOB_DB_PATH = os.path.join(SCRIPT_DIR, "data", "jobs.sqlite3")
+JOB_WORK_DIR = os.path.join(SCRIPT_DIR, "data", "jobs")
+JOB_LEASE_SECONDS = 600  # 任务租约时长，worker 崩溃后租约过期即可被重新领取
+JOB_MAX_ATTEMPTS = 3  # 最大尝试次数
+JOB_RETRY_BASE_DELAY = 30  # 重试退避基数（秒），按 2^n 递增
+JOB_RETRY_MAX_DELAY = 1800  # 重试退避上限（秒）
+
+# 讲义元数据索引（handout_index.py）
+HANDOUT_INDEX_PATH = os.path.join(SCRIPT_DIR, "data", "handouts.sqlite3")
+HANDOUT_DIRS = [PDF_DIR]  # 默认扫描的目录
+
+# 文本模型响应缓存（text_cache.py）：精简文本、知识类型、视觉主题等小调用跨构建复用
+TEXT_CACHE_ENABLED = True
+TEXT_CACHE_PATH = os.path.join(SCRIPT_DIR, "data", "text_cache.sqlite3")
+TEXT_CACHE_TTL_DAYS = 30  # 过期天数
+TEXT_CACHE_MAX_MB = 16  # 容量上限，超出后按最近访问时间淘汰
+
+# 构建检查点配置
+BUILD_JOURNAL_ENABLED = True
+# 未指定任务目录时使用的检查点目录（指定 work_dir 的任务使用 work_dir/journals，见 job_context.py）
+BUILD_JOURNAL_DIR = os.path.join(SCRIPT_DIR, "data", "journals")
+
+# 图片尺寸配置：按占位符尺寸和该DPI换算请求的像素尺寸（16:9页面约1920像素宽）
+IMAGE_TARGET_DPI = 144
+
+# 知识点配图复用配置：标题相似度（字符n-gram Jaccard）达到阈值时复用已有图片
+KP_IMAGE_REUSE_ENABLED = True
+KP_IMAGE_REUSE_THRESHOLD = 0.6
+KP_IMAGE_REUSE_NGRAM = 2
+KP_IMAGE_INDEX_DIR = os.path.join(SCRIPT_DIR, "data", "kp_image_index")
+
+# 学习目标图渲染方式: "local"（本地NumPy渲染，毫秒级、无网络）| "ai"（图片模型手绘风格）
+LEARNING_OBJECTIVES_RENDERER = "local"
+LEARNING_OBJECTIVES_LAYOUT = None  # "stairs" | "cards" | "timeline" | "pyramid"，None 按内容自动选择
+
+# 封面背景渲染方式: "ai"（图片模型）| "local"（本地程序化渲染，几十毫秒）| "auto"（优先AI，预算用完或失败时本地渲染）
+COVER_RENDERER = "auto"
+COVER_SUBJECT_MOTIF = True  # 本地渲染时在角落绘制学科底纹（数学网格、语文稿纸线等）
+IMAGE_API_BUDGET = None  # 每份讲义最多调用图片模型的次数，None 表示不限制
+AI_MAX_CONCURRENCY = 8  # 同时进行的模型请求上限（同步、异步接口共享）
+
+# 多进程分片构建（deck_shards.py）：知识点很多时，AI调用完成后知识点部分分进程构建再合并
+SHARD_BUILD_MIN_KNOWLEDGE_POINTS = 24  # 知识点数达到该值时分片构建，0 表示关闭
+SHARD_BUILD_WORKERS = None  # 进程数，None 表示使用全部CPU核
+
+# 流式写出（stream_writer.py）：每部分幻灯片完成后立即写入输出文件并释放XML和图片数据，降低大课件的内存峰值
+STREAM_WRITE_ENABLED = False
+
+# 草稿优先构建（draft_build.py）：先保存使用占位图的完整课件，后台生成AI图片并逐张替换，最后生成与普通构建相同的文件
+DRAFT_FIRST_ENABLED = False
+
+# 流水线预取（prefetch.py）：批量任务和 python main.py 讲义.pdf 中PDF文件名确定后立即生成封面背景和知识类型标签，与解析并行
+PREFETCH_ENABLED = True
+
+# PDF文本预处理：发给解析模型前去除页眉页脚、页码、水印
+STRIP_BOILERPLATE = True
+BOILERPLATE_MIN_RATIO = 0.5  # 同一位置的同一行出现在至少一半页面上视为重复
+BOILERPLATE_MARGIN = 0.1  # 页面上下10%范围内的页码直接去除
+
+# 本地结构预切分：按字号、粗细和标题关键词识别学习目标、考情分析等字段，识别可靠的字段不再交给模型
+SEGMENTER_ENABLED = True
+SEGMENTER_MIN_CONFIDENCE = 0.8
+
+# 思维导图检测（所有页面）
+MINDMAP_MIN_SCORE = 0.5  # 候选区域得分阈值（0-1）
+MINDMAP_VECTOR_DETECTION = True  # 没有合适的位图时查找矢量绘制的导图
+MINDMAP_CLUSTER_GAP = 8  # 矢量图形聚类间距（pt）
+MINDMAP_MIN_PATHS = 12  # 一簇至少包含的图形数
+MINDMAP_MIN_CURVE_RATIO = 0.15  # 曲线/斜线占比下限（排除表格边框）
+MINDMAP_RENDER_PIXELS = 2000  # 栅格化矢量导图时长边的目标像素
+
+# 提取图片的内容寻址图片库（按SHA256去重，多个PDF共用）
+IMAGE_STORE_DIR = os.path.join(SCRIPT_DIR, "data", "image_store")
+
+# PDF读取方式："mmap" 内存映射（大文件不整体读入内存）；"file" 由PyMuPDF直接打开文件
+PDF_INGEST_MODE = "mmap"
+PDF_STORE_LIMIT_MB = 32  # PyMuPDF 资源缓存上限，逐页处理时超过即清空
+
+# 正文排版：超出占位符的文字先在限度内缩小字号，仍放不下时拆分到同版式的续页
+TEXT_FIT_ENABLED = True
+TEXT_FIT_MIN_FONT_SCALE = 0.85  # 字号最多缩小到原来的85%
+CONTINUATION_SUFFIX = "（续）"  # 续页标题后缀
+
+# 课程数据加载
+COURSE_JSON_BACKEND = "auto"  # "auto" 安装了 orjson 时使用；"json" 始终使用标准库
+COURSE_LAZY_TEXT_MIN_CHARS = 512  # 超过该长度的正文压缩保存，访问时解压
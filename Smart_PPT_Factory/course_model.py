@@ -0,0 +1,271 @@
+"""
+课程数据模型
+course.json 加载为带 __slots__ 的数据类：加载时一次性校验并补全默认值，之后直接按属性访问；
+较长的正文以压缩形式保存，访问时才解压；安装了 orjson 时用它解析JSON
+"""
+import json
+import zlib
+from dataclasses import dataclass, field
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 缺失字段的默认值
+COURSE_DEFAULTS = {
+    "lecture_title": "本节课主题",
+    "learning_objectives": ["暂无学习目标"],
+    "class_intro": "欢迎来到本节课！",
+    "exam_analysis": "暂无考情分析",
+    "quiz_content": "请完成讲义上的测试题",
+    "homework": "完成对应练习题",
+}
+KNOWLEDGE_POINT_DEFAULTS = {
+    "content": "暂无内容",
+    "discussion": "请思考并讨论相关问题",
+}
+# 封面信息默认值（PDF文件名中解析不到的字段）
+COVER_DEFAULTS = {
+    "subject": "语文",
+    "grade": "高一",
+    "season": "寒假",
+    "teacher": "XXX老师",
+    "subtitle": "2025寒假高中小组课",
+}
+# 解析结果中没有知识点时使用的示例知识点
+PLACEHOLDER_KNOWLEDGE_POINT = {"title": "示例知识点", "content": "这是示例内容"}
+
+
+class CourseDataError(Exception):
+    """course.json 内容不符合要求"""
+
+
+# ========== 字段校验 ==========
+
+def _text(value, path, default=""):
+    """文本字段：None/空串使用默认值，数字转为文本，其他类型报错"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise CourseDataError(f"{path} 应为文本，实际为 {type(value).__name__}")
+    return str(value)
+
+
+def _text_list(value, path, default=()):
+    """文本列表：单个字符串视为只有一项"""
+    if value is None or value == [] or value == "":
+        return list(default)
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list):
+        raise CourseDataError(f"{path} 应为列表，实际为 {type(value).__name__}")
+    return [_text(item, f"{path}[{i}]") for i, item in enumerate(value)]
+
+
+def _mapping(value, path):
+    if not isinstance(value, dict):
+        raise CourseDataError(f"{path} 应为对象，实际为 {type(value).__name__}")
+    return value
+
+
+def _pack(text):
+    """较长的文本压缩保存（批量处理时成千上万份课程数据常驻内存）"""
+    if len(text) >= config.COURSE_LAZY_TEXT_MIN_CHARS:
+        return zlib.compress(text.encode("utf-8"))
+    return text
+
+
+def _packed_text(name):
+    """读取压缩保存的文本字段，访问时才解压"""
+    def getter(self):
+        value = getattr(self, name)
+        return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+    return property(getter)
+
+
+# ========== 数据类 ==========
+
+@dataclass(slots=True)
+class ImageRef:
+    """提取的图片：新版按内容哈希引用图片库，旧版记录相对项目根目录的路径"""
+    filename: str
+    is_mindmap: bool = False
+    sha256: str = ""
+    ext: str = ""
+    path: str = ""
+    page: int = 0
+    source: str = ""
+    score: float = 0.0
+
+    @classmethod
+    def from_dict(cls, raw, path):
+        raw = _mapping(raw, path)
+        sha256 = _text(raw.get("sha256"), f"{path}.sha256")
+        ext = _text(raw.get("ext"), f"{path}.ext")
+        legacy_path = _text(raw.get("path"), f"{path}.path")
+        if not sha256 and not legacy_path:
+            raise CourseDataError(f"{path} 缺少 sha256 或 path")
+        filename = _text(raw.get("filename"), f"{path}.filename", f"{sha256}.{ext}" if sha256 else "")
+        return cls(
+            filename=filename,
+            is_mindmap=bool(raw.get("is_mindmap", False)),
+            sha256=sha256,
+            ext=ext,
+            path=legacy_path,
+            page=int(raw.get("page") or 0),
+            source=_text(raw.get("source"), f"{path}.source"),
+            score=float(raw.get("score") or 0.0),
+        )
+
+    def to_dict(self):
+        keys = ("filename", "is_mindmap", "sha256", "ext", "path", "page", "source", "score")
+        return {key: getattr(self, key) for key in keys if getattr(self, key) or key == "is_mindmap"}
+
+
+@dataclass(slots=True)
+class KnowledgePoint:
+    """知识点；正文类字段通过同名属性读取（如 kp.content）"""
+    title: str
+    discussion: str = KNOWLEDGE_POINT_DEFAULTS["discussion"]
+    _content: object = KNOWLEDGE_POINT_DEFAULTS["content"]
+    _example_mother: object = ""
+    _example_variant: object = ""
+    _method: object = ""
+
+    content = _packed_text("_content")
+    example_mother = _packed_text("_example_mother")
+    example_variant = _packed_text("_example_variant")
+    method = _packed_text("_method")
+
+    @classmethod
+    def from_dict(cls, raw, index):
+        """index: 从1开始的知识点序号（缺少标题时用于生成默认标题）"""
+        path = f"knowledge_points[{index - 1}]"
+        raw = _mapping(raw, path)
+        return cls(
+            title=_text(raw.get("title"), f"{path}.title", f"知识点{index}"),
+            discussion=_text(raw.get("discussion"), f"{path}.discussion", KNOWLEDGE_POINT_DEFAULTS["discussion"]),
+            _content=_pack(_text(raw.get("content"), f"{path}.content", KNOWLEDGE_POINT_DEFAULTS["content"])),
+            _example_mother=_pack(_text(raw.get("example_mother"), f"{path}.example_mother")),
+            _example_variant=_pack(_text(raw.get("example_variant"), f"{path}.example_variant")),
+            _method=_pack(_text(raw.get("method"), f"{path}.method")),
+        )
+
+    @classmethod
+    def placeholder(cls):
+        return cls.from_dict(PLACEHOLDER_KNOWLEDGE_POINT, 1)
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "content": self.content,
+            "discussion": self.discussion,
+            "example_mother": self.example_mother or None,
+            "example_variant": self.example_variant or None,
+            "method": self.method or None,
+        }
+
+
+@dataclass(slots=True)
+class Course:
+    """一份讲义解析出的课程数据（course.json）"""
+    lecture_title: str
+    learning_objectives: list
+    knowledge_points: list
+    extracted_images: list = field(default_factory=list)
+    mindmap_pages: list = field(default_factory=list)
+    # 未识别的字段原样保留，保存时写回
+    extra: dict = field(default_factory=dict)
+    _class_intro: object = COURSE_DEFAULTS["class_intro"]
+    _exam_analysis: object = COURSE_DEFAULTS["exam_analysis"]
+    _quiz_content: object = COURSE_DEFAULTS["quiz_content"]
+    _homework: object = COURSE_DEFAULTS["homework"]
+
+    class_intro = _packed_text("_class_intro")
+    exam_analysis = _packed_text("_exam_analysis")
+    quiz_content = _packed_text("_quiz_content")
+    homework = _packed_text("_homework")
+
+    _KNOWN_FIELDS = ("lecture_title", "learning_objectives", "knowledge_points", "extracted_images",
+                     "mindmap_pages", "class_intro", "exam_analysis", "quiz_content", "homework")
+
+    @classmethod
+    def from_dict(cls, data):
+        """校验并转换解析结果，缺失字段补全默认值；内容不符合要求时抛出 CourseDataError"""
+        data = _mapping(data, "course.json")
+
+        def text(key):
+            return _text(data.get(key), key, COURSE_DEFAULTS[key])
+
+        knowledge_points = data.get("knowledge_points") or []
+        if not isinstance(knowledge_points, list):
+            raise CourseDataError(f"knowledge_points 应为列表，实际为 {type(knowledge_points).__name__}")
+        images = data.get("extracted_images") or []
+        if not isinstance(images, list):
+            raise CourseDataError(f"extracted_images 应为列表，实际为 {type(images).__name__}")
+        pages = data.get("mindmap_pages") or []
+        if not isinstance(pages, list) or not all(isinstance(p, int) for p in pages):
+            raise CourseDataError("mindmap_pages 应为页码列表")
+
+        return cls(
+            lecture_title=text("lecture_title"),
+            learning_objectives=_text_list(data.get("learning_objectives"), "learning_objectives",
+                                           COURSE_DEFAULTS["learning_objectives"]),
+            knowledge_points=[KnowledgePoint.from_dict(kp, i) for i, kp in enumerate(knowledge_points, 1)],
+            extracted_images=[ImageRef.from_dict(img, f"extracted_images[{i}]") for i, img in enumerate(images)],
+            mindmap_pages=pages,
+            extra={key: value for key, value in data.items() if key not in cls._KNOWN_FIELDS},
+            _class_intro=_pack(text("class_intro")),
+            _exam_analysis=_pack(text("exam_analysis")),
+            _quiz_content=_pack(text("quiz_content")),
+            _homework=_pack(text("homework")),
+        )
+
+    @property
+    def mindmap_images(self):
+        return [image for image in self.extracted_images if image.is_mindmap]
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data.update({
+            "lecture_title": self.lecture_title,
+            "learning_objectives": list(self.learning_objectives),
+            "class_intro": self.class_intro,
+            "exam_analysis": self.exam_analysis,
+            "knowledge_points": [kp.to_dict() for kp in self.knowledge_points],
+            "quiz_content": self.quiz_content,
+            "homework": self.homework,
+            "extracted_images": [image.to_dict() for image in self.extracted_images],
+        })
+        if self.mindmap_pages:
+            data["mindmap_pages"] = list(self.mindmap_pages)
+        return data
+
+
+# ========== 读取 ==========
+
+def loads_json(raw):
+    """解析JSON：config.COURSE_JSON_BACKEND 为 "auto" 且安装了 orjson 时使用 orjson"""
+    if orjson is not None and config.COURSE_JSON_BACKEND == "auto":
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def load_course(json_path):
+    """
+    读取并校验 course.json
+
+    返回:
+        Course 对象；文件不是合法JSON或内容不符合要求时抛出 CourseDataError
+    """
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    try:
+        data = loads_json(raw)
+    except ValueError as e:
+        # json.JSONDecodeError 和 orjson.JSONDecodeError 都是 ValueError 的子类
+        raise CourseDataError(f"不是合法的JSON: {e}")
+    return Course.from_dict(data)
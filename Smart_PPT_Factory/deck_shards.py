@@ -0,0 +1,219 @@
+"""
+多进程分片构建
+AI调用完成后，构建和序列化幻灯片是单核的纯Python计算；知识点很多的讲义（如总复习课件）
+把知识点部分按内容量切成连续的几段，每段在独立进程中用同一模板构建成一个小PPT，
+再按顺序把各分片的幻灯片部件、媒体和关系合并到主演示文稿中（相同内容的媒体只保留一份）
+"""
+import io
+import os
+import re
+import hashlib
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import PackURI
+from pptx.parts.slide import SlidePart
+
+# 幻灯片XML中引用关系ID的属性（r:embed、r:link、r:id 等）都在这个命名空间下
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NUMBERED_PARTNAME = re.compile(r"^(.*?)(\d+)(\.\w+)$")
+
+
+def empty_presentation(template):
+    """加载模板并删除预设幻灯片"""
+    prs = Presentation(template)
+    while len(prs.slides) > 0:
+        rId = prs.slides._sldIdLst[0].rId
+        prs.part.drop_rel(rId)
+        del prs.slides._sldIdLst[0]
+    return prs
+
+
+class DeckMerger:
+    """
+    把其他PPT（同一模板生成）的幻灯片追加到主演示文稿
+    版式按部件名对应到主演示文稿的版式；图片等媒体按SHA1去重，新媒体按主演示文稿现有编号续排，
+    幻灯片中的关系ID按新建的关系重新映射
+    """
+
+    def __init__(self, prs, appender):
+        """appender: 主演示文稿的 SlideAppender（与 SlideBuilder 共用，保持计数器一致）"""
+        self.package = prs.part.package
+        self.appender = appender
+        self.layouts = {str(layout.part.partname): layout.part for layout in prs.slide_layouts}
+        self.media = {}
+        self.copies = {}
+        self.numbers = defaultdict(int)
+        self.reused = 0
+        for part in self.package.iter_parts():
+            partname = str(part.partname)
+            match = _NUMBERED_PARTNAME.match(partname)
+            if match:
+                self.numbers[match.group(1)] = max(self.numbers[match.group(1)], int(match.group(2)))
+            if partname.startswith("/ppt/media/"):
+                # 图片部件的SHA1有缓存（流式写出后数据已释放，见 stream_writer.py）
+                digest = getattr(part, "sha1", None) or hashlib.sha1(part.blob).hexdigest()
+                self.media[digest] = part
+
+    def _media_part(self, source):
+        """主演示文稿中与 source 内容相同的媒体部件，没有时复制一份"""
+        if source in self.copies:
+            return self.copies[source]
+        blob = source.blob
+        digest = hashlib.sha1(blob).hexdigest()
+        part = self.media.get(digest)
+        if part is not None:
+            self.reused += 1
+            self.copies[source] = part
+            return part
+
+        match = _NUMBERED_PARTNAME.match(str(source.partname))
+        if not match:
+            raise ValueError(f"无法为媒体部件编号: {source.partname}")
+        prefix, _, ext = match.groups()
+        self.numbers[prefix] += 1
+        partname = PackURI(f"{prefix}{self.numbers[prefix]}{ext}")
+        part = type(source).load(partname, source.content_type, self.package, blob)
+        self.media[digest] = self.copies[source] = part
+        return part
+
+    def append_slide(self, source_part):
+        """追加一张幻灯片（source_part 为分片中的 SlidePart，其XML元素直接移入主演示文稿）"""
+        element = source_part._element
+        slide_part = SlidePart(self.appender.next_partname(), source_part.content_type,
+                               self.package, element)
+
+        rid_map = {}
+        for rId, rel in source_part.rels.items():
+            if rel.is_external:
+                rid_map[rId] = slide_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif rel.reltype == RT.SLIDE_LAYOUT:
+                layout = self.layouts.get(str(rel.target_part.partname))
+                if layout is None:
+                    raise ValueError(f"主演示文稿中没有版式 {rel.target_part.partname}，分片须使用同一模板")
+                rid_map[rId] = slide_part.relate_to(layout, rel.reltype)
+            elif len(rel.target_part.rels) == 0:
+                # 图片、音视频等不再引用其他部件的媒体
+                rid_map[rId] = slide_part.relate_to(self._media_part(rel.target_part), rel.reltype)
+            else:
+                # 备注页、图表等自身还有关系的部件需要逐级合并，本项目不生成这类内容
+                raise ValueError(f"不支持合并的关系类型: {rel.reltype}")
+
+        for node in element.iter():
+            for name, value in node.attrib.items():
+                if name.startswith(_REL_NS) and value in rid_map:
+                    node.set(name, rid_map[value])
+
+        self.appender.append_part(slide_part)
+        return slide_part.slide
+
+    def append_deck(self, source):
+        """
+        按顺序追加 source（PPT文件路径或字节）中的全部幻灯片
+
+        返回:
+            追加的页数
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        shard = Presentation(source)
+        parts = [shard.part.related_part(sld_id.rId) for sld_id in shard.slides._sldIdLst]
+        for part in parts:
+            self.append_slide(part)
+        return len(parts)
+
+
+def split_balanced(weights, count):
+    """
+    把序列按权重切成最多 count 段连续区间，各段权重尽量接近
+
+    返回:
+        [(起点, 终点), ...] 左闭右开
+    """
+    count = max(1, min(count, len(weights)))
+    total = float(sum(weights)) or 1.0
+    ranges = []
+    start = 0
+    running = 0
+    for i, weight in enumerate(weights):
+        running += weight
+        remaining_items = len(weights) - i - 1
+        remaining_ranges = count - len(ranges) - 1
+        boundary = total * (len(ranges) + 1) / count
+        if remaining_ranges and (running >= boundary or remaining_items == remaining_ranges):
+            ranges.append((start, i + 1))
+            start = i + 1
+    ranges.append((start, len(weights)))
+    return ranges
+
+
+def _build_shard(build_section, settings, sections):
+    """
+    worker进程：用模板新建演示文稿，依次构建各段并返回PPT字节
+
+    参数:
+        build_section: 模块级函数 build_section(builder, *section) -> 页数
+        settings: 主进程任务上下文的 Settings
+        sections: build_section 的参数列表
+
+    返回:
+        (PPT字节, 每段页数列表)
+    """
+    from slide_builder import SlideBuilder
+    from job_context import JobContext, job_context
+
+    context = JobContext.create()
+    context.settings = settings
+    with job_context(context), open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        prs = empty_presentation(settings.MASTER_TEMPLATE)
+        builder = SlideBuilder(prs, context)
+        counts = [build_section(builder, *section) for section in sections]
+        buffer = io.BytesIO()
+        prs.save(buffer)
+    return buffer.getvalue(), counts
+
+
+def build_in_shards(builder, build_section, sections, weights, workers, settings, on_merged=None):
+    """
+    分进程构建多段幻灯片并按顺序合并到 builder 的演示文稿
+
+    参数:
+        builder: 主演示文稿的 SlideBuilder
+        build_section: 模块级函数 build_section(builder, *section) -> 页数（须可被子进程导入）
+        sections: 每段的参数元组列表（须可pickle）
+        weights: 每段的内容量估计，用于均衡切分
+        workers: 进程数
+        settings: 任务上下文的 Settings
+        on_merged: 每个分片合并后调用的无参函数（如流式写出已合并的幻灯片）
+
+    返回:
+        每段的页数列表；子进程构建失败时返回None（此时尚未合并任何幻灯片）
+    """
+    ranges = split_balanced(weights, workers)
+    print(f"  📦 分 {len(ranges)} 个进程构建 {len(sections)} 段幻灯片")
+    try:
+        # spawn：主进程中有模型请求的后台事件循环线程，fork 复制线程持有的锁可能死锁
+        with ProcessPoolExecutor(max_workers=len(ranges),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_build_shard, build_section, settings, sections[start:end])
+                       for start, end in ranges]
+            results = [future.result() for future in futures]
+    except Exception as e:
+        print(f"  ⚠️ 分片构建失败: {e}")
+        return None
+
+    merger = DeckMerger(builder.prs, builder.appender)
+    counts = []
+    for (start, end), (blob, shard_counts) in zip(ranges, results):
+        pages = merger.append_deck(blob)
+        counts.extend(shard_counts)
+        print(f"    ✅ 分片 {start + 1}-{end}: {pages} 页")
+        if on_merged:
+            on_merged()
+    if merger.reused:
+        print(f"    ♻️ 相同媒体去重 {merger.reused} 次")
+    return counts
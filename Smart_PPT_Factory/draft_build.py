@@ -0,0 +1,217 @@
+"""
+草稿优先构建
+先用中性占位图保存一份完整可用的课件（文字齐全），AI图片在后台线程中继续生成，
+每完成一张就替换到已保存文件中对应的媒体部件；全部完成后再用同样的结果完整构建一次，
+最终文件的内容与普通构建相同：各成员（幻灯片XML、媒体等）逐一相同，只有zip中的时间戳不同
+（相同图片去重、生成失败时保留占位符等都与普通构建一致）
+"""
+import io
+import os
+import time
+import zipfile
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PLACEHOLDER_COLOR = (236, 238, 241)
+PLACEHOLDER_SIZE = (64, 36)
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def placeholder_image(stage):
+    """
+    中性占位图（浅灰PNG）
+    像素相同，PNG文本块中写入阶段名，使每个图位的占位图内容不同、不会被 python-pptx 合并为同一个媒体部件
+    """
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+
+    info = PngInfo()
+    info.add_text("draft-stage", stage)
+    output = io.BytesIO()
+    Image.new("RGB", PLACEHOLDER_SIZE, PLACEHOLDER_COLOR).save(output, format="PNG", pnginfo=info)
+    return output.getvalue()
+
+
+def as_png(data):
+    """转为PNG字节（占位图是PNG，原位替换时保持媒体部件的扩展名和内容类型不变）"""
+    if data.startswith(_PNG_SIGNATURE):
+        return data
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def patch_media(path, replacements):
+    """
+    替换PPT文件中的媒体成员（其他成员原样保留），写入临时文件后原子改名
+
+    参数:
+        replacements: {成员名: 新内容}
+    """
+    tmp_path = f"{path}.{os.getpid()}.patch"
+    try:
+        with zipfile.ZipFile(path) as source, zipfile.ZipFile(tmp_path, "w") as target:
+            for info in source.infolist():
+                data = replacements.get(info.filename)
+                target.writestr(info, data if data is not None else source.read(info.filename))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def replace_file(src, dst, attempts=5, delay=2.0):
+    """
+    用 src 替换 dst；dst 被占用（如在 PowerPoint 中打开）时重试
+
+    返回:
+        是否替换成功
+    """
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return True
+        except PermissionError:
+            if attempt + 1 < attempts:
+                time.sleep(delay)
+    return False
+
+
+class DraftBuild:
+    """
+    草稿优先构建中AI产物的调度（由 main._build_ppt 的检查点函数调用）
+
+    草稿阶段（final=False）：
+        文本类结果照常同步获取并记录；图片类立即返回占位图，真实图片提交到单个后台线程，
+        按普通构建的调用顺序依次生成（图片复用索引、调用预算的判断与普通构建一致）
+    最终阶段（final=True）：
+        直接使用草稿阶段记录的文本结果和后台生成的图片，不再调用模型
+    """
+
+    def __init__(self):
+        self.final = False
+        self.values = {}
+        self.futures = {}
+        self.placeholders = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="draft-images")
+
+    def value(self, stage, fn):
+        """文本类结果"""
+        if stage not in self.values:
+            self.values[stage] = fn()
+        return self.values[stage]
+
+    def image(self, stage, fn):
+        """
+        图片类结果
+
+        参数:
+            fn: 无参函数，返回BytesIO或None
+
+        返回:
+            草稿阶段返回占位图，最终阶段返回生成的图片（BytesIO或None）
+        """
+        if self.final:
+            future = self.futures.get(stage)
+            if future is None:
+                return fn()
+            image = future.result()
+            return io.BytesIO(image.getvalue()) if image is not None else None
+
+        if stage not in self.futures:
+            # 后台线程沿用当前任务上下文（路径、客户端、调用预算）
+            self.futures[stage] = self._executor.submit(contextvars.copy_context().run, fn)
+        data = placeholder_image(stage)
+        self.placeholders[hashlib.sha1(data).hexdigest()] = stage
+        return io.BytesIO(data)
+
+    def _placeholder_members(self, path):
+        """已保存的草稿中各图位对应的媒体成员名 {阶段: 成员名}"""
+        members = {}
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.startswith("ppt/media/"):
+                    stage = self.placeholders.get(hashlib.sha1(archive.read(name)).hexdigest())
+                    if stage:
+                        members[stage] = name
+        return members
+
+    def upgrade(self, path):
+        """
+        等待后台图片逐张完成，替换到已保存的草稿中（同时完成的几张一起替换）
+        文件被占用导致替换失败时保留待替换的图片，下一轮再试
+        """
+        members = self._placeholder_members(path)
+        pending = {self.futures[stage]: stage for stage in members}
+        replacements = {}
+        done_count = 0
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = pending.pop(future)
+                done_count += 1
+                try:
+                    image = future.result()
+                    if image is not None:
+                        replacements[members[stage]] = as_png(image.getvalue())
+                        print(f"  🖼️ [{done_count}/{len(members)}] {stage} 已生成")
+                    else:
+                        print(f"  ⚠️ [{done_count}/{len(members)}] {stage} 未生成，保留占位图")
+                except Exception as e:
+                    print(f"  ⚠️ [{done_count}/{len(members)}] {stage} 生成失败: {e}")
+            if replacements:
+                try:
+                    patch_media(path, replacements)
+                    replacements = {}
+                except OSError as e:
+                    print(f"  ⚠️ 暂时无法更新草稿文件: {e}")
+        # 未出现在草稿中的图片（如同一图片被合并）也要等待完成，最终构建会用到
+        wait(list(self.futures.values()))
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_draft_first(build, output_path):
+    """
+    草稿优先构建
+
+    参数:
+        build: build(draft, output_path) -> 输出路径或None（一次完整构建）
+        output_path: 输出PPT路径
+
+    返回:
+        最终PPT路径，失败时返回None
+    """
+    draft = DraftBuild()
+    try:
+        start = time.perf_counter()
+        if not build(draft, output_path):
+            return None
+        print(f"\n📝 草稿已保存（{time.perf_counter() - start:.1f} 秒，可先行使用）: {output_path}")
+        print(f"⏳ 后台生成 {len(draft.futures)} 张图片，完成后逐张替换到文件中...")
+        draft.upgrade(output_path)
+
+        print("\n🔁 图片已全部生成，按普通构建流程生成最终文件...")
+        draft.final = True
+        final_path = f"{output_path}.{os.getpid()}.final"
+        try:
+            if not build(draft, final_path):
+                return None
+            if replace_file(final_path, output_path):
+                print(f"✅ 最终文件已完成（共 {time.perf_counter() - start:.1f} 秒）: {output_path}")
+                return output_path
+            root, ext = os.path.splitext(output_path)
+            fallback = f"{root}_final{ext}"
+            os.replace(final_path, fallback)
+            print(f"⚠️ {output_path} 被占用，最终文件另存为: {fallback}")
+            return fallback
+        finally:
+            if os.path.exists(final_path):
+                os.remove(final_path)
+    finally:
+        draft.close()
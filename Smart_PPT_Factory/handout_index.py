@@ -0,0 +1,310 @@
+"""
+讲义PDF元数据索引
+批量解析讲义文件名（科目_年级_学期_班型_老师.pdf），连同文件大小、修改时间、内容哈希
+保存到本地SQLite；重新扫描时只处理新增和变化的文件，批量任务按条件查询输入，不必遍历目录
+
+用法:
+    python Smart_PPT_Factory/handout_index.py scan [目录 ...]
+    python Smart_PPT_Factory/handout_index.py query --subject 语文 --grade 高一 --season 寒假
+    python Smart_PPT_Factory/handout_index.py stats
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+from contextlib import closing
+
+import config
+
+# 高中语文_高一_2025寒假_小组课_张三[_其他].pdf
+FILENAME_PATTERN = re.compile(
+    r"^(?P<subject_raw>[^_]+)_(?P<grade>[^_]+)_(?P<term>[^_]+)_(?P<class_type>[^_]+)_(?P<teacher>[^_]+)(?:_.*)?$"
+)
+_STAGE = re.compile(r"^(小学|初中|高中)")
+_TERM = re.compile(r"^(?P<year>\d{4})?\s*(?P<season>.*)$")
+
+# 可用于查询的字段
+QUERY_FIELDS = ("subject", "stage", "grade", "year", "season", "term", "class_type", "teacher")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS handouts (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    parsed INTEGER NOT NULL,
+    subject_raw TEXT,
+    stage TEXT,
+    subject TEXT,
+    grade TEXT,
+    term TEXT,
+    year INTEGER,
+    season TEXT,
+    class_type TEXT,
+    teacher TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_handouts_course ON handouts (subject, grade, season, year);
+CREATE INDEX IF NOT EXISTS idx_handouts_teacher ON handouts (teacher);
+CREATE INDEX IF NOT EXISTS idx_handouts_class_type ON handouts (class_type);
+CREATE INDEX IF NOT EXISTS idx_handouts_sha256 ON handouts (sha256);
+"""
+
+_COLUMNS = ("path", "filename", "size", "mtime_ns", "sha256", "parsed", "subject_raw", "stage", "subject",
+            "grade", "term", "year", "season", "class_type", "teacher", "indexed_at")
+
+
+def parse_handout_name(filename):
+    """
+    解析讲义文件名（不输出任何提示）
+
+    返回:
+        字段字典（subject_raw、stage、subject、grade、term、year、season、class_type、teacher），
+        不符合命名规则时返回None
+    """
+    match = FILENAME_PATTERN.match(os.path.splitext(os.path.basename(filename))[0])
+    if not match:
+        return None
+    fields = match.groupdict()
+    stage = _STAGE.match(fields["subject_raw"])
+    fields["stage"] = stage.group(1) if stage else ""
+    fields["subject"] = fields["subject_raw"][stage.end():] if stage else fields["subject_raw"]
+    term = _TERM.match(fields["term"])
+    fields["year"] = int(term.group("year")) if term.group("year") else None
+    fields["season"] = term.group("season")
+    return fields
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _walk_pdfs(root):
+    """递归列出目录下的PDF，返回 (路径, stat)；DirEntry 自带 stat 信息，不额外访问文件"""
+    stack = [root]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                yield os.path.abspath(entry.path), entry.stat()
+
+
+class HandoutIndex:
+    """讲义元数据索引，可被多个进程同时访问"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.HANDOUT_INDEX_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def scan(self, roots=None):
+        """
+        扫描目录并增量更新索引
+
+        大小和修改时间都没变的文件直接跳过（不读取内容），新增或变化的文件重新计算哈希，
+        目录下已删除的文件从索引中移除
+
+        返回:
+            统计字典 {"scanned", "added", "updated", "unchanged", "removed", "unparsed", "seconds"}
+        """
+        started = time.time()
+        roots = [os.path.abspath(r) for r in (roots or config.HANDOUT_DIRS)]
+        stats = dict.fromkeys(("scanned", "added", "updated", "unchanged", "removed", "unparsed"), 0)
+
+        with closing(self._connect()) as conn:
+            for root in roots:
+                # 路径前缀按范围查询，可以走主键索引
+                prefix = root.rstrip(os.sep) + os.sep
+                known = {
+                    row["path"]: (row["size"], row["mtime_ns"])
+                    for row in conn.execute(
+                        "SELECT path, size, mtime_ns FROM handouts WHERE path >= ? AND path < ?",
+                        (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+                    )
+                }
+                seen, rows = set(), []
+                for path, st in _walk_pdfs(root):
+                    stats["scanned"] += 1
+                    seen.add(path)
+                    previous = known.get(path)
+                    if previous == (st.st_size, st.st_mtime_ns):
+                        stats["unchanged"] += 1
+                        continue
+                    try:
+                        digest = file_sha256(path)
+                    except OSError as e:
+                        print(f"⚠️ 无法读取 {path}: {e}")
+                        continue
+                    fields = parse_handout_name(path)
+                    if fields is None:
+                        stats["unparsed"] += 1
+                        fields = {}
+                    rows.append((
+                        path, os.path.basename(path), st.st_size, st.st_mtime_ns, digest, int(bool(fields)),
+                        fields.get("subject_raw"), fields.get("stage"), fields.get("subject"),
+                        fields.get("grade"), fields.get("term"), fields.get("year"), fields.get("season"),
+                        fields.get("class_type"), fields.get("teacher"), time.time(),
+                    ))
+                    stats["updated" if previous else "added"] += 1
+
+                removed = [(path,) for path in known if path not in seen]
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO handouts ({', '.join(_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                        rows
+                    )
+                    conn.executemany("DELETE FROM handouts WHERE path = ?", removed)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                stats["removed"] += len(removed)
+
+        stats["seconds"] = time.time() - started
+        return stats
+
+    def query(self, limit=None, **filters):
+        """
+        按元数据查询讲义
+
+        参数:
+            filters: QUERY_FIELDS 中的字段，如 subject="语文", grade="高一", season="寒假"；
+                     值为列表时匹配其中任意一个
+
+        返回:
+            讲义字典列表（按路径排序）
+        """
+        clauses, params = [], []
+        for name, value in filters.items():
+            if name not in QUERY_FIELDS:
+                raise ValueError(f"不支持的查询字段: {name}")
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{name} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        sql = "SELECT * FROM handouts"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY path"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def paths(self, **filters):
+        """符合条件且文件仍然存在的讲义路径"""
+        return [row["path"] for row in self.query(**filters) if os.path.exists(row["path"])]
+
+    def lookup(self, path):
+        """按路径查找；文件大小或修改时间与索引不一致时返回None（索引已过期）"""
+        path = os.path.abspath(path)
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM handouts WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime_ns) != (row["size"], row["mtime_ns"]):
+            return None
+        return dict(row)
+
+    def stats(self):
+        """索引概况：总数、未能解析文件名的数量、重复内容数量、各科目/年级/学期的数量"""
+        with closing(self._connect()) as conn:
+            total, unparsed = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(parsed = 0), 0) FROM handouts"
+            ).fetchone()
+            duplicates = conn.execute(
+                "SELECT COALESCE(SUM(n - 1), 0) FROM (SELECT COUNT(*) AS n FROM handouts GROUP BY sha256)"
+            ).fetchone()[0]
+            groups = {
+                name: conn.execute(
+                    f"SELECT {name}, COUNT(*) FROM handouts WHERE parsed = 1 GROUP BY {name} ORDER BY 2 DESC"
+                ).fetchall()
+                for name in ("subject", "grade", "term", "class_type")
+            }
+        return {"total": total, "unparsed": unparsed, "duplicates": duplicates,
+                "groups": {name: [tuple(row) for row in rows] for name, rows in groups.items()}}
+
+
+def add_filter_arguments(arg_parser):
+    """添加按元数据筛选讲义的命令行参数（job_queue enqueue 也使用）"""
+    for name in QUERY_FIELDS:
+        kwargs = {"type": int} if name == "year" else {}
+        arg_parser.add_argument(f"--{name.replace('_', '-')}", dest=name, action="append", default=None, **kwargs)
+
+
+def filters_from_args(args):
+    return {name: getattr(args, name) for name in QUERY_FIELDS if getattr(args, name, None)}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Smart PPT Factory 讲义元数据索引")
+    arg_parser.add_argument("--db", default=None, help="索引数据库路径")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+
+    p_scan = sub.add_parser("scan", help="扫描目录并增量更新索引")
+    p_scan.add_argument("dirs", nargs="*")
+
+    p_query = sub.add_parser("query", help="按科目、年级、学期、班型、老师查询")
+    add_filter_arguments(p_query)
+    p_query.add_argument("--limit", type=int, default=None)
+    p_query.add_argument("--paths", action="store_true", help="只输出路径")
+
+    sub.add_parser("stats", help="查看索引概况")
+
+    args = arg_parser.parse_args(argv)
+    index = HandoutIndex(args.db)
+
+    if args.command == "scan":
+        stats = index.scan(args.dirs or None)
+        print(f"📚 扫描 {stats['scanned']} 个PDF（{stats['seconds']:.2f}s）：新增 {stats['added']}，"
+              f"更新 {stats['updated']}，未变 {stats['unchanged']}，移除 {stats['removed']}")
+        if stats["unparsed"]:
+            print(f"⚠️ {stats['unparsed']} 个文件名不符合 科目_年级_学期_班型_老师 格式")
+    elif args.command == "query":
+        rows = index.query(limit=args.limit, **filters_from_args(args))
+        for row in rows:
+            if args.paths:
+                print(row["path"])
+            else:
+                print(f"{row['subject_raw'] or '-'} {row['grade'] or '-'} {row['term'] or '-'} "
+                      f"{row['class_type'] or '-'} {row['teacher'] or '-'}  {row['path']}")
+        if not args.paths:
+            print(f"🔍 共 {len(rows)} 个")
+    elif args.command == "stats":
+        stats = index.stats()
+        print(f"📊 已索引 {stats['total']} 个讲义（文件名无法解析 {stats['unparsed']}，重复内容 {stats['duplicates']}）")
+        for name, rows in stats["groups"].items():
+            print(f"  - {name}: " + "、".join(f"{value} {count}" for value, count in rows[:10]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+知识点配图复用索引
+对已生成的知识点配图按标题建立相似度索引（规范化文本 + 字符n-gram），
+标题足够相似时直接复用已有图片，不再调用图片模型
+
+用法:
+    python Smart_PPT_Factory/image_reuse.py stats
+    python -m doctest Smart_PPT_Factory/image_reuse.py   # 检查标题规范化规则
+"""
+import os
+import io
+import re
+import sys
+import time
+import sqlite3
+import unicodedata
+from contextlib import closing
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kp_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    aspect TEXT NOT NULL,
+    image_file TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    reuse_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_kp_images_aspect ON kp_images (aspect);
+"""
+
+# 标题开头的列表编号，如 "一、" "1." "（2）" "知识点3："
+# 只有明确是编号时才去掉：带"知识点/考点"前缀、数字带括号，或数字后跟顿号/点/冒号
+# （"二次函数""三角函数"开头的数字是标题本身的一部分；"1.5倍"中的点是小数点）
+_NUMERAL = r"[0-9一二三四五六七八九十]+"
+_SEPARATOR = r"(?:[、．:：]|\.(?![0-9]))"
+_NUMBERING_PATTERN = re.compile(
+    rf"^(?:(?:知识点|考点)\s*(?:{_NUMERAL})?\s*{_SEPARATOR}?"
+    rf"|[（(]\s*{_NUMERAL}\s*[)）]\s*{_SEPARATOR}?"
+    rf"|{_NUMERAL}\s*{_SEPARATOR})\s*"
+)
+
+
+def normalize_title(title):
+    """
+    规范化标题：全半角统一、去掉编号、标点和空白
+
+    >>> normalize_title("二次函数"), normalize_title("三次函数")
+    ('二次函数', '三次函数')
+    >>> normalize_title("知识点3：二次函数"), normalize_title("（二）二次函数"), normalize_title("2. 二次函数")
+    ('二次函数', '二次函数', '二次函数')
+    >>> normalize_title("1.5倍角公式")
+    '15倍角公式'
+    """
+    text = unicodedata.normalize("NFKC", str(title)).lower().strip()
+    text = _NUMBERING_PATTERN.sub("", text)
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def shingles(text, n=None):
+    """字符n-gram集合，短于n的文本整体作为一个元素"""
+    n = n or config.KP_IMAGE_REUSE_NGRAM
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+class TitleImageIndex:
+    """知识点标题 → 已生成配图 的相似度索引"""
+
+    def __init__(self, index_dir=None, threshold=None):
+        self.index_dir = index_dir or config.KP_IMAGE_INDEX_DIR
+        self.threshold = config.KP_IMAGE_REUSE_THRESHOLD if threshold is None else threshold
+        self.db_path = os.path.join(self.index_dir, "index.sqlite3")
+        os.makedirs(self.index_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+        # 倒排索引: (宽高比, shingle) -> {条目ID}
+        self._postings = {}
+        self._entries = {}
+        self._load()
+
+        self.lookups = 0
+        self.hits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _load(self):
+        with closing(self._connect()) as conn:
+            stale = []
+            for row in conn.execute("SELECT id, title, normalized, aspect, image_file FROM kp_images"):
+                entry = dict(row)
+                # 规范化规则调整后，按新规则重新计算旧条目
+                normalized = normalize_title(entry["title"])
+                if normalized != entry["normalized"]:
+                    entry["normalized"] = normalized
+                    stale.append((normalized, entry["id"]))
+                self._add_entry(entry)
+            if stale:
+                conn.executemany("UPDATE kp_images SET normalized = ? WHERE id = ?", stale)
+
+    def _add_entry(self, entry):
+        entry["shingles"] = shingles(entry["normalized"])
+        self._entries[entry["id"]] = entry
+        for gram in entry["shingles"]:
+            self._postings.setdefault((entry["aspect"], gram), set()).add(entry["id"])
+
+    def find(self, title, aspect="1:1"):
+        """
+        查找最相似的已有配图
+
+        返回:
+            (条目字典, 相似度)；没有达到阈值的条目时返回 (None, 最高相似度)
+        """
+        query = shingles(normalize_title(title))
+        candidates = set()
+        for gram in query:
+            candidates |= self._postings.get((aspect, gram), set())
+
+        best, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            score = jaccard(query, entry["shingles"])
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is not None and best_score >= self.threshold:
+            return best, best_score
+        return None, best_score
+
+    def add(self, title, image, aspect="1:1"):
+        """登记一张新生成的配图"""
+        normalized = normalize_title(title)
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO kp_images (title, normalized, aspect, image_file, created_at) VALUES (?, ?, ?, '', ?)",
+                (title, normalized, aspect, time.time())
+            )
+            entry_id = cur.lastrowid
+            image_file = f"{entry_id}.img"
+            with open(os.path.join(self.index_dir, image_file), "wb") as f:
+                f.write(image.getvalue())
+            conn.execute("UPDATE kp_images SET image_file = ? WHERE id = ?", (image_file, entry_id))
+        self._add_entry({
+            "id": entry_id, "title": title, "normalized": normalized,
+            "aspect": aspect, "image_file": image_file
+        })
+
+    def get_or_generate(self, title, generate_fn, aspect="1:1"):
+        """
+        复用相似标题的配图，没有时调用 generate_fn 生成并登记
+
+        参数:
+            title: 知识点标题
+            generate_fn: 无参函数，返回BytesIO或None
+            aspect: 宽高比预设，不同比例的图片不互相复用
+
+        返回:
+            BytesIO对象或None
+        """
+        self.lookups += 1
+        entry, score = self.find(title, aspect)
+        if entry is not None:
+            image_path = os.path.join(self.index_dir, entry["image_file"])
+            if os.path.exists(image_path):
+                self.hits += 1
+                with closing(self._connect()) as conn:
+                    conn.execute("UPDATE kp_images SET reuse_count = reuse_count + 1 WHERE id = ?", (entry["id"],))
+                print(f"    ♻️ 复用相似标题的配图: 「{entry['title']}」(相似度 {score:.2f})")
+                with open(image_path, "rb") as f:
+                    return io.BytesIO(f.read())
+
+        image = generate_fn()
+        if image is not None:
+            self.add(title, image, aspect)
+            image.seek(0)
+        return image
+
+    @property
+    def reuse_rate(self):
+        return self.hits / float(self.lookups) if self.lookups else 0.0
+
+    def summary(self):
+        """本次运行的复用情况"""
+        return (f"知识点配图复用 {self.hits}/{self.lookups} 次（复用率 {self.reuse_rate:.0%}），"
+                f"节省 {self.hits} 次图片模型调用")
+
+    def totals(self):
+        """索引累计情况"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT COUNT(*), COALESCE(SUM(reuse_count), 0) FROM kp_images").fetchone()
+        images, reused = row[0], row[1]
+        lookups = images + reused
+        return {
+            "images": images,
+            "api_calls_avoided": reused,
+            "reuse_rate": reused / float(lookups) if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "stats":
+        totals = TitleImageIndex().totals()
+        print("📊 知识点配图复用索引")
+        print(f"  - 已登记配图: {totals['images']} 张")
+        print(f"  - 累计节省调用: {totals['api_calls_avoided']} 次")
+        print(f"  - 累计复用率: {totals['reuse_rate']:.0%}")
+    else:
+        print(__doc__)
@@ -0,0 +1,70 @@
+"""
+内容寻址图片库
+从PDF提取的图片按内容SHA256保存为 <root>/<hash前2位>/<hash>.<扩展名>，
+相同内容（跨PDF重复的logo、思维导图）只保存一份；course.json 中按哈希引用，
+读取时直接计算路径，无需逐个探测文件
+"""
+import os
+import uuid
+import hashlib
+
+import config
+
+
+class ImageStore:
+    """按内容哈希存取图片"""
+
+    def __init__(self, root=None):
+        self.root = root or config.IMAGE_STORE_DIR
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest, ext):
+        """图片路径（纯计算，不访问文件系统）"""
+        return os.path.join(self.root, digest[:2], f"{digest}.{ext}")
+
+    def temp_path(self, ext):
+        """图片库内的临时文件路径（与最终位置同一文件系统，可原子改名）"""
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f".incoming-{os.getpid()}-{uuid.uuid4().hex}.{ext}")
+
+    def put(self, data, ext):
+        """
+        保存图片数据，内容已存在时跳过写入
+
+        返回:
+            引用字典 {"sha256": 哈希, "ext": 扩展名, "filename": 文件名}
+        """
+        tmp_path = self.temp_path(ext.lower().lstrip("."))
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.put_file(tmp_path, ext)
+
+    def put_file(self, tmp_path, ext, chunk_size=1 << 20):
+        """
+        把已写好的临时文件移入图片库（边读边计算哈希，不整体读入内存）
+
+        返回:
+            引用字典 {"sha256": 哈希, "ext": 扩展名, "filename": 文件名}
+        """
+        ext = ext.lower().lstrip(".")
+        h = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        path = self.path(digest, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            print(f"    ♻️ 图片库中已有相同图片: {digest[:12]}")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 原子改名，并发解析同一张图片时不会读到半个文件
+            os.replace(tmp_path, path)
+        return {"sha256": digest, "ext": ext, "filename": f"{digest}.{ext}"}
+
+    def resolve(self, image_info):
+        """course.json 中的图片引用 → 文件路径"""
+        return self.path(image_info["sha256"], image_info["ext"])
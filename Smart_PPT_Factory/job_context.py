@@ -0,0 +1,184 @@
+"""
+构建任务上下文
+一次解析/生成所用的路径、模型客户端、缓存和配置覆盖都放在 JobContext 中，
+通过 contextvars 传递给 parse_content()、generate_ppt()、SlideBuilder 和 ai_image_generator，
+同一进程中的多份讲义（多线程或 asyncio 任务）各用各的上下文，互不覆盖
+"""
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import config
+from image_store import ImageStore
+
+_current = contextvars.ContextVar("job_context", default=None)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def default_client():
+    """进程共享的模型客户端（首次使用时创建）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+            _client = genai.Client(api_key=config.API_KEY)
+    return _client
+
+
+def new_job_id():
+    """任务ID：时间戳 + 随机后缀，同一秒内的多个任务也不重复"""
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+class Settings:
+    """配置覆盖：有覆盖值时使用覆盖值，否则读取 config 中的同名配置"""
+
+    def __init__(self, overrides=None):
+        self._overrides = dict(overrides or {})
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._overrides:
+            return self._overrides[name]
+        return getattr(config, name)
+
+
+@dataclass
+class JobContext:
+    """
+    一次构建的上下文
+
+    路径:
+        output_path: 输出PPT路径
+        json_path: course.json 路径
+        input_file: PDF文字提取结果（raw_content.txt）路径
+        work_dir: 中间文件目录（知识类型标签图片等）
+        journal_dir: 构建检查点根目录（见 build_journal.py）
+        debug_path: 解析模型返回的JSON无法解析时，原文保存到该文件
+    """
+    job_id: str
+    output_path: str
+    json_path: str
+    input_file: str
+    work_dir: str
+    journal_dir: str
+    debug_path: str
+    settings: Settings = field(default_factory=Settings)
+    image_store: ImageStore = field(default_factory=ImageStore)
+    client: object = None
+    # 图片模型调用预算（每份讲义单独计数）
+    image_budget: dict = field(default_factory=lambda: {"calls": 0, "exhausted": False})
+    # 本任务的相同请求合并计数 {"图片"/"文本": {"calls", "coalesced"}}（见 ai_image_generator.SingleFlight）
+    flight_stats: dict = field(default_factory=dict)
+    # 解析期间提前发起的AI调用（见 prefetch.py 与 main.start_prefetch）
+    prefetch: object = None
+    _text_cache: object = None
+
+    @classmethod
+    def create(cls, work_dir=None, output_path=None, json_path=None, job_id=None, client=None, **settings):
+        """
+        创建任务上下文
+
+        参数:
+            work_dir: 中间文件目录；提供时 course.json、raw_content.txt、构建检查点和调试文件也放在该目录，
+                      默认沿用 config 中的全局路径（命令行单次运行时 parser.py 与 main.py 共用）
+            output_path: 输出PPT路径，默认 config.OUTPUT_PATH，未设置时按任务ID生成
+            json_path: course.json 路径
+            job_id: 任务ID，默认自动生成
+            client: 模型客户端，默认进程共享的客户端
+            settings: 覆盖 config 中的同名配置（如 COVER_RENDERER="local"）
+        """
+        job_id = job_id or new_job_id()
+        settings = Settings(settings)
+        if work_dir:
+            # 检查点按任务目录隔离：并行处理同一份讲义的任务不会共用（或删除）彼此的检查点
+            default_json = os.path.join(work_dir, "course.json")
+            input_file = os.path.join(work_dir, "raw_content.txt")
+            journal_dir = os.path.join(work_dir, "journals")
+            debug_path = os.path.join(work_dir, "debug_json.txt")
+        else:
+            default_json = config.JSON_PATH
+            input_file = config.INPUT_FILE
+            journal_dir = settings.BUILD_JOURNAL_DIR
+            debug_path = os.path.join(config.SCRIPT_DIR, "data", "debug_json.txt")
+            work_dir = os.path.join(config.SCRIPT_DIR, "data", "extracted_images")
+        return cls(
+            job_id=job_id,
+            output_path=output_path or config.OUTPUT_PATH
+            or os.path.join(config.OUTPUT_DIR, f"Final_Courseware_{job_id}.pptx"),
+            json_path=json_path or default_json,
+            input_file=input_file,
+            work_dir=work_dir,
+            journal_dir=journal_dir,
+            debug_path=debug_path,
+            settings=settings,
+            client=client,
+        )
+
+    @property
+    def model_client(self):
+        return self.client or default_client()
+
+    @property
+    def text_cache(self):
+        """文本响应缓存（首次使用时打开，未启用或打开失败时为None）"""
+        if self._text_cache is None and self.settings.TEXT_CACHE_ENABLED:
+            from text_cache import TextCache
+            try:
+                self._text_cache = TextCache(self.settings.TEXT_CACHE_PATH)
+            except Exception as e:
+                print(f"  ⚠️ 文本缓存不可用: {e}")
+                self._text_cache = False
+        return self._text_cache or None
+
+
+_default_context = None
+_default_lock = threading.Lock()
+
+
+def current_context():
+    """当前任务上下文；未通过 job_context() 设置时使用进程默认上下文"""
+    context = _current.get()
+    if context is not None:
+        return context
+    global _default_context
+    with _default_lock:
+        if _default_context is None:
+            _default_context = JobContext.create()
+        return _default_context
+
+
+@contextmanager
+def job_context(context=None, **kwargs):
+    """
+    在 with 块内使用指定的任务上下文（未提供时按 kwargs 新建，参数同 JobContext.create）
+
+    用法:
+        with job_context(work_dir=..., COVER_RENDERER="local") as ctx:
+            parse_content(pdf_path)
+            generate_ppt(pdf_path=pdf_path)
+    """
+    context = context or JobContext.create(**kwargs)
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def ensure_context(**kwargs):
+    """已设置任务上下文时直接使用；否则新建一个只在 with 块内有效的上下文（参数同 JobContext.create）"""
+    context = _current.get()
+    if context is not None:
+        yield context
+    else:
+        with job_context(**kwargs) as context:
+            yield context
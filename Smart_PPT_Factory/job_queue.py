@@ -0,0 +1,438 @@
+"""
+持久化任务队列
+基于SQLite保存批量生成任务，worker进程通过租约领取任务，
+失败后按指数退避重试，进程崩溃或重启后任务不会丢失
+
+用法:
+    python Smart_PPT_Factory/job_queue.py enqueue data/*.pdf
+    python Smart_PPT_Factory/job_queue.py enqueue --subject 语文 --grade 高一 --season 寒假
+    python Smart_PPT_Factory/job_queue.py work -n 4
+    python Smart_PPT_Factory/job_queue.py status
+    python Smart_PPT_Factory/job_queue.py failed
+    python Smart_PPT_Factory/job_queue.py retry [job_id ...]
+"""
+import os
+import sys
+import time
+import random
+import socket
+import sqlite3
+import argparse
+import threading
+import traceback
+import multiprocessing
+from contextlib import closing
+
+import config
+from handout_index import HandoutIndex, add_filter_arguments, filters_from_args
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pdf_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    next_run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_duration REAL,
+    total_run_seconds REAL NOT NULL DEFAULT 0,
+    output_path TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, next_run_at);
+"""
+
+
+def retry_delay(attempts):
+    """计算第 attempts 次失败后的退避时长（秒），带 ±20% 抖动"""
+    delay = config.JOB_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0))
+    delay = min(delay, config.JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class JobQueue:
+    """SQLite任务队列，可被多个进程同时访问"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.JOB_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def enqueue(self, pdf_path, max_attempts=None):
+        """添加任务，返回任务ID"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (pdf_path, max_attempts, next_run_at, created_at) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(pdf_path), max_attempts or config.JOB_MAX_ATTEMPTS, now, now)
+            )
+            return cur.lastrowid
+
+    def claim(self, worker_id, lease_seconds=None):
+        """
+        领取一个可执行的任务
+
+        可执行的任务包括：到达重试时间的待处理任务，以及租约已过期的运行中任务
+        （说明原来的worker已崩溃）。
+
+        返回:
+            任务字典或None
+        """
+        lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # 租约过期且已用完重试次数的任务直接标记为失败
+            conn.execute(
+                """UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL,
+                       last_error = COALESCE(last_error, '') || '[租约过期，worker可能已崩溃]'
+                   WHERE status = ? AND lease_expires_at <= ? AND attempts >= max_attempts""",
+                (STATUS_FAILED, now, STATUS_RUNNING, now)
+            )
+            row = conn.execute(
+                """SELECT * FROM jobs
+                   WHERE (status = ? AND next_run_at <= ?)
+                      OR (status = ? AND lease_expires_at <= ?)
+                   ORDER BY next_run_at, id LIMIT 1""",
+                (STATUS_PENDING, now, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?,
+                       lease_expires_at = ?, started_at = ?
+                   WHERE id = ?""",
+                (STATUS_RUNNING, worker_id, now + lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["attempts"] += 1
+            job["started_at"] = now
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew_lease(self, job_id, worker_id, lease_seconds=None):
+        """续租，返回是否仍持有该任务"""
+        lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + lease_seconds, job_id, worker_id, STATUS_RUNNING)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id, worker_id, output_path):
+        """
+        标记任务成功（仅当本worker仍持有租约时）
+
+        返回:
+            是否更新成功；租约已过期并被其他worker重新领取时返回False
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                """UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL,
+                       last_duration = ? - started_at, total_run_seconds = total_run_seconds + (? - started_at),
+                       output_path = ?, last_error = NULL
+                   WHERE id = ? AND lease_owner = ? AND status = ?""",
+                (STATUS_DONE, now, now, now, output_path, job_id, worker_id, STATUS_RUNNING)
+            )
+            conn.execute("COMMIT")
+            return cur.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def fail(self, job_id, worker_id, error):
+        """
+        记录一次失败：未超过最大次数则按退避时间重新排队，否则标记为失败
+        读取尝试次数和更新状态在同一个写事务中，且只在本worker仍持有租约时更新
+
+        返回:
+            新状态 ("pending" 或 "failed")；租约已被其他worker领取时返回None
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = ?",
+                (job_id, worker_id, STATUS_RUNNING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["attempts"] >= row["max_attempts"]:
+                status, next_run_at = STATUS_FAILED, now
+            else:
+                status, next_run_at = STATUS_PENDING, now + retry_delay(row["attempts"])
+            conn.execute(
+                """UPDATE jobs SET status = ?, next_run_at = ?, finished_at = ?, lease_owner = NULL,
+                       lease_expires_at = NULL, last_duration = ? - started_at,
+                       total_run_seconds = total_run_seconds + (? - started_at), last_error = ?
+                   WHERE id = ? AND lease_owner = ?""",
+                (status, next_run_at, now, now, now, str(error)[-4000:], job_id, worker_id)
+            )
+            conn.execute("COMMIT")
+            return status
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def retry_failed(self, job_ids=None):
+        """将失败任务重新放回队列（重置尝试次数），返回数量"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if job_ids:
+                marks = ",".join("?" * len(job_ids))
+                cur = conn.execute(
+                    f"UPDATE jobs SET status = ?, attempts = 0, next_run_at = ? WHERE status = ? AND id IN ({marks})",
+                    (STATUS_PENDING, now, STATUS_FAILED, *job_ids)
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = 0, next_run_at = ? WHERE status = ?",
+                    (STATUS_PENDING, now, STATUS_FAILED)
+                )
+            return cur.rowcount
+
+    def failed_jobs(self, limit=20):
+        """最近失败的任务"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY finished_at DESC LIMIT ?",
+                (STATUS_FAILED, limit)
+            ).fetchall()
+            return [dict(r) for r in rows]
+
+    def stats(self, window_seconds=3600):
+        """
+        队列统计
+
+        返回:
+            字典：各状态数量、可立即执行/等待重试的积压数、时间窗口内吞吐量与平均耗时
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            counts = {s: 0 for s in (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)}
+            for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+                counts[row["status"]] = row["n"]
+            ready = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND next_run_at <= ?",
+                (STATUS_PENDING, now)
+            ).fetchone()[0]
+            recent = conn.execute(
+                "SELECT COUNT(*), AVG(last_duration) FROM jobs WHERE status = ? AND finished_at >= ?",
+                (STATUS_DONE, now - window_seconds)
+            ).fetchone()
+            avg_all = conn.execute(
+                "SELECT AVG(last_duration) FROM jobs WHERE status = ?", (STATUS_DONE,)
+            ).fetchone()[0]
+        return {
+            "counts": counts,
+            "backlog_ready": ready,
+            "backlog_delayed": counts[STATUS_PENDING] - ready,
+            "window_seconds": window_seconds,
+            "done_in_window": recent[0],
+            "throughput_per_hour": recent[0] * 3600.0 / window_seconds,
+            "avg_duration_window": recent[1],
+            "avg_duration_all": avg_all,
+        }
+
+
+def run_job(job):
+    """执行一个任务：解析PDF → 生成PPT，返回输出路径"""
+    import main as ppt_main
+    from job_context import job_context
+
+    work_dir = os.path.join(config.JOB_WORK_DIR, str(job["id"]))
+    os.makedirs(work_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(job["pdf_path"]))[0]
+    output_path = os.path.join(config.OUTPUT_DIR, f"{stem}_job{job['id']}.pptx")
+
+    # 中间文件和输出路径都放在任务上下文里，同一进程并行执行多个任务也互不干扰
+    with job_context(work_dir=work_dir, output_path=output_path, job_id=f"job{job['id']}"):
+        result = ppt_main.build_from_pdf(job["pdf_path"])
+    if not result:
+        raise RuntimeError("PPT生成失败")
+    return result
+
+
+def _heartbeat(queue, job_id, worker_id, stop_event):
+    """后台续租，直到任务结束"""
+    interval = max(config.JOB_LEASE_SECONDS / 3.0, 1.0)
+    while not stop_event.wait(interval):
+        if not queue.renew_lease(job_id, worker_id):
+            print(f"⚠️ 任务 {job_id} 的租约已丢失")
+            return
+
+
+def worker_loop(db_path=None, poll_interval=2.0, exit_when_idle=False):
+    """worker主循环：不断领取并执行任务"""
+    queue = JobQueue(db_path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 worker {worker_id} 已启动")
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if exit_when_idle:
+                print(f"👷 worker {worker_id} 队列已空，退出")
+                return
+            time.sleep(poll_interval)
+            continue
+
+        print(f"\n▶️ 任务 {job['id']} (第{job['attempts']}次): {job['pdf_path']}")
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(queue, job["id"], worker_id, stop_event), daemon=True
+        )
+        heartbeat.start()
+        try:
+            output_path = run_job(job)
+        except BaseException as e:
+            stop_event.set()
+            error = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            status = queue.fail(job["id"], worker_id, error)
+            if status is None:
+                print(f"⚠️ 任务 {job['id']} 失败: {e}（租约已被其他worker领取，不再更新状态）")
+            else:
+                print(f"❌ 任务 {job['id']} 失败: {e}（状态: {status}）")
+            if isinstance(e, KeyboardInterrupt):
+                raise
+        else:
+            stop_event.set()
+            if queue.complete(job["id"], worker_id, output_path):
+                print(f"✅ 任务 {job['id']} 完成: {output_path}")
+            else:
+                print(f"⚠️ 任务 {job['id']} 已生成 {output_path}，但租约已被其他worker领取，不再更新状态")
+
+
+def run_workers(num_workers=1, db_path=None, exit_when_idle=False):
+    """启动多个worker进程"""
+    if num_workers <= 1:
+        worker_loop(db_path, exit_when_idle=exit_when_idle)
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(db_path,), kwargs={"exit_when_idle": exit_when_idle})
+        for _ in range(num_workers)
+    ]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def print_status(queue):
+    stats = queue.stats()
+    counts = stats["counts"]
+    print("📊 任务队列状态")
+    print(f"  - 待处理: {counts[STATUS_PENDING]} (可执行 {stats['backlog_ready']}, 等待重试 {stats['backlog_delayed']})")
+    print(f"  - 运行中: {counts[STATUS_RUNNING]}")
+    print(f"  - 已完成: {counts[STATUS_DONE]}")
+    print(f"  - 已失败: {counts[STATUS_FAILED]}")
+    print(f"  - 最近{stats['window_seconds'] // 60}分钟完成: {stats['done_in_window']} 个"
+          f"（{stats['throughput_per_hour']:.1f} 个/小时）")
+    print(f"  - 平均耗时: 最近 {_format_seconds(stats['avg_duration_window'])}，"
+          f"全部 {_format_seconds(stats['avg_duration_all'])}")
+
+
+def print_failed(queue, limit):
+    jobs = queue.failed_jobs(limit)
+    if not jobs:
+        print("✅ 没有失败的任务")
+        return
+    for job in jobs:
+        last_line = (job["last_error"] or "").strip().splitlines()[-1:] or [""]
+        print(f"❌ [{job['id']}] {job['pdf_path']}  尝试 {job['attempts']}/{job['max_attempts']}")
+        print(f"     {last_line[0]}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Smart PPT Factory 批量任务队列")
+    arg_parser.add_argument("--db", default=None, help="队列数据库路径")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+
+    p_enqueue = sub.add_parser("enqueue", help="添加PDF任务（指定文件，或按讲义索引筛选）")
+    p_enqueue.add_argument("pdfs", nargs="*")
+    add_filter_arguments(p_enqueue)
+    p_enqueue.add_argument("--max-attempts", type=int, default=None)
+
+    p_work = sub.add_parser("work", help="启动worker")
+    p_work.add_argument("-n", "--workers", type=int, default=1)
+    p_work.add_argument("--exit-when-idle", action="store_true", help="队列为空时退出")
+
+    sub.add_parser("status", help="查看吞吐量和积压")
+
+    p_failed = sub.add_parser("failed", help="查看失败任务")
+    p_failed.add_argument("--limit", type=int, default=20)
+
+    p_retry = sub.add_parser("retry", help="重新执行失败任务")
+    p_retry.add_argument("job_ids", nargs="*", type=int)
+
+    args = arg_parser.parse_args(argv)
+    queue = JobQueue(args.db)
+
+    if args.command == "enqueue":
+        pdfs = list(args.pdfs)
+        filters = filters_from_args(args)
+        if filters:
+            # 从讲义索引中选取，不遍历目录（先运行 handout_index.py scan）
+            pdfs += HandoutIndex().paths(**filters)
+        if not pdfs:
+            print("⚠️ 没有要添加的PDF（未指定文件，或索引中没有符合条件的讲义）")
+        for pdf in pdfs:
+            job_id = queue.enqueue(pdf, args.max_attempts)
+            print(f"➕ 任务 {job_id}: {pdf}")
+    elif args.command == "work":
+        run_workers(args.workers, args.db, args.exit_when_idle)
+    elif args.command == "status":
+        print_status(queue)
+    elif args.command == "failed":
+        print_failed(queue, args.limit)
+    elif args.command == "retry":
+        count = queue.retry_failed(args.job_ids)
+        print(f"🔁 已重新排队 {count} 个任务")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,690 @@
+"""
+本地图片渲染模块
+不调用任何模型，使用NumPy合成渐变和形状、PIL绘制文字，毫秒级生成确定性的配图
+"""
+import io
+import zlib
+import struct
+import functools
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# 候选字体（Windows / macOS / Linux），按顺序查找第一个可用的
+FONT_CANDIDATES = {
+    True: [
+        "msyhbd.ttc", "simhei.ttf",
+        "/System/Library/Fonts/PingFang.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+        "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    ],
+    False: [
+        "msyh.ttc", "simhei.ttf",
+        "/System/Library/Fonts/PingFang.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    ],
+}
+
+LEVEL_KEYWORDS = ["识记", "理解", "操作", "运用", "迁移", "分析", "综合", "评价"]
+LEVEL_COLORS = {
+    "识记": ("#7ED7C1", "#5BC0BE"),
+    "理解": ("#00A896", "#028090"),
+    "操作": ("#F39C12", "#E67E22"),
+    "运用": ("#E74C3C", "#C0392B"),
+    "迁移": ("#9B59B6", "#8E44AD"),
+    "分析": ("#3498DB", "#2980B9"),
+    "综合": ("#1ABC9C", "#16A085"),
+    "评价": ("#E67E22", "#D35400"),
+}
+DEFAULT_LEVEL_COLORS = ("#00A896", "#028090")
+
+OBJECTIVE_LAYOUTS = ("stairs", "cards", "timeline", "pyramid")
+
+# 设计稿尺寸，布局坐标按此尺寸编写后整体缩放
+DESIGN_WIDTH, DESIGN_HEIGHT = 1920, 1080
+
+
+# ========== 字体 ==========
+
+@functools.lru_cache(maxsize=None)
+def _find_font_path(bold):
+    """查找可用字体文件（每个进程只查找一次）"""
+    for candidate in FONT_CANDIDATES[bold]:
+        try:
+            ImageFont.truetype(candidate, 12)
+            return candidate
+        except OSError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def get_font(size, bold=False):
+    """按 (字号, 粗细) 缓存字体对象"""
+    path = _find_font_path(bold)
+    if path:
+        return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 的默认字体不支持字号
+        return ImageFont.load_default()
+
+
+# ========== NumPy 合成工具 ==========
+
+def hex_to_rgb(color):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _rgb(color):
+    return np.array(hex_to_rgb(color) if isinstance(color, str) else color, np.float32)
+
+
+def gradient(height, width, color_start, color_end, horizontal=False):
+    """线性渐变，返回 (3, h, w) float32 只读视图（沿一个轴广播，不实际展开）"""
+    start, end = _rgb(color_start), _rgb(color_end)
+    steps = width if horizontal else height
+    t = np.linspace(0.0, 1.0, max(steps, 1), dtype=np.float32)
+    t = t[None, None, :] if horizontal else t[None, :, None]
+    start, end = start[:, None, None], end[:, None, None]
+    return np.broadcast_to(start * (1.0 - t) + end * t, (3, height, width))
+
+
+def _px(value):
+    """像素尺寸取整，至少为1（目标很多、画布很小时布局算出的尺寸可能为0或负数）"""
+    return max(int(value), 1)
+
+
+def _fit(ratio):
+    """字号缩放比例：空间不足时按比例缩小，不放大"""
+    return min(1.0, max(ratio, 0.05))
+
+
+def _frozen(array):
+    """缓存的遮罩设为只读，避免被调用方原地修改"""
+    array.setflags(write=False)
+    return array
+
+
+@functools.lru_cache(maxsize=128)
+def rounded_rect_mask(height, width, radius):
+    """圆角矩形覆盖率（抗锯齿），返回只读 (h, w) float32，按尺寸缓存"""
+    height, width = _px(height), _px(width)
+    radius = max(0.0, min(radius, height / 2.0, width / 2.0))
+    if radius <= 0:
+        return _frozen(np.ones((height, width), np.float32))
+    yy = np.arange(height, dtype=np.float32)[:, None] + 0.5
+    xx = np.arange(width, dtype=np.float32)[None, :] + 0.5
+    dx = np.maximum(np.maximum(radius - xx, xx - (width - radius)), 0.0)
+    dy = np.maximum(np.maximum(radius - yy, yy - (height - radius)), 0.0)
+    return _frozen(np.clip(radius + 0.5 - np.sqrt(dx * dx + dy * dy), 0.0, 1.0))
+
+
+def circle_mask(diameter):
+    return rounded_rect_mask(diameter, diameter, diameter / 2.0)
+
+
+@functools.lru_cache(maxsize=64)
+def trapezoid_mask(height, width, top_width, bottom_width):
+    """居中的等腰梯形覆盖率，返回只读 (h, w) float32，按尺寸缓存"""
+    height, width = _px(height), _px(width)
+    yy = np.arange(height, dtype=np.float32)[:, None] + 0.5
+    xx = np.arange(width, dtype=np.float32)[None, :] + 0.5
+    row_width = top_width + (bottom_width - top_width) * (yy / height)
+    half = row_width / 2.0
+    center = width / 2.0
+    return _frozen(np.clip(half - np.abs(xx - center) + 0.5, 0.0, 1.0))
+
+
+def new_canvas(width, height):
+    """
+    透明画布：按通道分平面存储的 (4, H, W) float32，预乘alpha，RGB为0-255，alpha为0-1
+
+    通道优先的布局让每个通道的运算都在连续内存上进行。
+    """
+    return np.zeros((4, height, width), np.float32)
+
+
+def composite(canvas, x, y, height, width, color, alpha=1.0, mask=None):
+    """
+    在 canvas 的 (x, y) 处以 source-over 方式合成一个形状（原地修改）
+
+    参数:
+        canvas: new_canvas() 创建的画布
+        height, width: 形状外接矩形尺寸
+        color: 颜色（"#RRGGBB"、RGB元组，或 gradient() 返回的 (3, h, w) 数组）
+        alpha: 整体不透明度 0-1
+        mask: 可选 (h, w) 覆盖率
+    """
+    x, y = int(round(x)), int(round(y))
+    height, width = int(height), int(width)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, canvas.shape[2]), min(y + height, canvas.shape[1])
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    if isinstance(color, np.ndarray) and color.ndim == 3:
+        src = color[:, y0 - y:y1 - y, x0 - x:x1 - x]
+    else:
+        src = _rgb(color)
+    if mask is None:
+        coverage = np.float32(alpha)
+    else:
+        coverage = mask[y0 - y:y1 - y, x0 - x:x1 - x]
+        if alpha != 1.0:
+            coverage = coverage * np.float32(alpha)
+
+    # 预乘alpha：dst = src * a + dst * (1 - a)，写成 dst += (src - dst) * a 逐通道原地计算，只用一块临时数组
+    dst = canvas[:, y0:y1, x0:x1]
+    scratch = np.empty(dst.shape[1:], np.float32)
+    for channel in range(3):
+        np.subtract(src[channel], dst[channel], out=scratch)
+        scratch *= coverage
+        dst[channel] += scratch
+    np.subtract(1.0, dst[3], out=scratch)
+    scratch *= coverage
+    dst[3] += scratch
+
+
+def to_image(canvas):
+    """预乘alpha画布转为PIL RGBA图片（由PIL的 RGBa→RGBA 转换去预乘）"""
+    # 合成是凸组合，预乘后的RGB不超过 255*alpha、alpha不超过1，无需再裁剪
+    planes = [Image.fromarray(channel.astype(np.uint8), "L") for channel in canvas[:3]]
+    planes.append(Image.fromarray((canvas[3] * 255.0 + 0.5).astype(np.uint8), "L"))
+    return Image.merge("RGBa", planes).convert("RGBA")
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def to_png(canvas, compress_level=1):
+    """
+    画布转PNG（编码速度优先）
+
+    PIL的PNG编码器逐行尝试全部五种滤波器，对透明留白很多的大图较慢；
+    这里不做滤波，整张图交给 zlib 低级别压缩，文件大小相近、编码快数倍
+    """
+    img = canvas if isinstance(canvas, Image.Image) else to_image(canvas)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    width, height = img.size
+    channels = len(img.mode)
+    rows = np.zeros((height, 1 + width * channels), np.uint8)  # 每行首字节为滤波类型 0
+    rows[:, 1:] = np.asarray(img).reshape(height, width * channels)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6 if channels == 4 else 2, 0, 0, 0)
+    output = io.BytesIO()
+    output.write(b"\x89PNG\r\n\x1a\n")
+    output.write(_png_chunk(b"IHDR", header))
+    output.write(_png_chunk(b"IDAT", zlib.compress(rows.data, compress_level)))
+    output.write(_png_chunk(b"IEND", b""))
+    output.seek(0)
+    return output
+
+
+def to_jpeg(img, quality=90):
+    """不透明图片转JPEG（编码比PNG快数倍，适合整页背景）"""
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    output.seek(0)
+    return output
+
+
+# ========== 文本排版 ==========
+
+def wrap_text(text, font, max_width, max_lines=None):
+    """按像素宽度逐字换行（中英文混排），超出行数时末行加省略号"""
+    lines, current = [], ""
+    for ch in text:
+        if ch == "\n":
+            lines.append(current)
+            current = ""
+            continue
+        if current and font.getlength(current + ch) > max_width:
+            lines.append(current)
+            current = ch
+        else:
+            current += ch
+    if current:
+        lines.append(current)
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1][:-1] + "…"
+    return lines
+
+
+def draw_lines(draw, lines, x, y, font, line_height, fill="white", anchor="la"):
+    for i, line in enumerate(lines):
+        draw.text((x, y + i * line_height), line, fill=fill, font=font, anchor=anchor)
+
+
+# ========== 学习目标图 ==========
+
+def parse_objective_levels(objectives):
+    """识别每个学习目标的层级关键词（默认"理解"）"""
+    levels = []
+    for obj in objectives:
+        found_level = "理解"
+        for keyword in LEVEL_KEYWORDS:
+            if keyword in obj:
+                found_level = keyword
+                break
+        levels.append(found_level)
+    return levels
+
+
+def _stable_choice(options, key):
+    """根据内容稳定地选择（同样的输入总是得到同样的布局）"""
+    return options[zlib.crc32(key.encode("utf-8")) % len(options)]
+
+
+def _circle(canvas, center_x, center_y, radius, color, border=0, border_color="#FFFFFF"):
+    """带描边的圆形"""
+    radius = int(radius)
+    if border:
+        composite(canvas, center_x - radius, center_y - radius, 2 * radius, 2 * radius,
+                  border_color, mask=circle_mask(2 * radius))
+        radius -= int(border)
+    color = gradient(2 * radius, 2 * radius, *color) if isinstance(color, tuple) else color
+    composite(canvas, center_x - radius, center_y - radius, 2 * radius, 2 * radius,
+              color, mask=circle_mask(2 * radius))
+
+
+def _layout_stairs(canvas, texts, items, width, height, s):
+    n = len(items)
+    start_y = 150 * s
+    step_height = (height - start_y - 100 * s) / n
+    card_height = _px(step_height - 30 * s)
+    step_offset = min(150 * s, (width - 900 * s) / max(n - 1, 1))
+    fit = _fit(step_height / 276.0 / s)
+
+    for i, (level, obj) in enumerate(items):
+        colors = LEVEL_COLORS.get(level, DEFAULT_LEVEL_COLORS)
+        card_x = 200 * s + i * step_offset
+        card_y = start_y + i * step_height
+        card_width = _px(width - 220 * s - card_x)
+        composite(canvas, card_x, card_y, card_height, card_width,
+                  gradient(card_height, card_width, colors[0], colors[1]), alpha=0.9,
+                  mask=rounded_rect_mask(card_height, card_width, 12 * s))
+
+        # 编号圆圈（白色描边）
+        circle_x, circle_y = card_x - 60 * s, card_y + card_height / 2
+        _circle(canvas, circle_x, circle_y, 50 * s * max(fit, 0.6), colors[0], border=max(5 * s, 1))
+
+        texts.append(("text", (circle_x, circle_y), str(i + 1), int(72 * s * fit), True, "mm"))
+        texts.append(("text", (card_x + 40 * s, card_y + 20 * s * fit), level, int(56 * s * fit), True, "la"))
+        texts.append(("wrap", (card_x + 40 * s, card_y + 85 * s * fit), obj, int(44 * s * fit),
+                      card_width - 80 * s, 2))
+
+
+def _layout_cards(canvas, texts, items, width, height, s):
+    n = len(items)
+    start_y = 200 * s
+    spacing = (height - start_y - 100 * s) / n
+    card_x = 150 * s
+    card_width = _px(width - 300 * s)
+    card_height = _px(spacing - 40 * s)
+    label_width = min(_px(200 * s), card_width)
+    radius = 20 * s
+    border = max(int(4 * s), 1)
+    inner_height, inner_width = _px(card_height - 2 * border), _px(card_width - 2 * border)
+    fit = _fit(card_height / 220.0 / s)
+    card_mask = rounded_rect_mask(card_height, card_width, radius)
+    inner_mask = rounded_rect_mask(inner_height, inner_width, radius - border)
+    label_mask = rounded_rect_mask(card_height, label_width, radius)
+
+    for i, (level, obj) in enumerate(items):
+        colors = LEVEL_COLORS.get(level, DEFAULT_LEVEL_COLORS)
+        y = start_y + i * spacing
+
+        # 阴影、白色描边、卡片主体、层级标签区域
+        composite(canvas, card_x + 8 * s, y + 8 * s, card_height, card_width, (0, 0, 0), alpha=0.2, mask=card_mask)
+        composite(canvas, card_x, y, card_height, card_width, "#FFFFFF", mask=card_mask)
+        composite(canvas, card_x + border, y + border, inner_height, inner_width, colors[0], mask=inner_mask)
+        composite(canvas, card_x, y, card_height, label_width,
+                  gradient(card_height, label_width, colors[1], colors[0]), mask=label_mask)
+
+        texts.append(("text", (card_x + label_width / 2, y + card_height * 0.32), str(i + 1),
+                      int(72 * s * fit), True, "mm"))
+        texts.append(("text", (card_x + label_width / 2, y + card_height * 0.75), level,
+                      int(48 * s * fit), True, "mm"))
+        content_x = card_x + label_width + 50 * s
+        texts.append(("wrap_center", (content_x, y + card_height / 2), obj, int(44 * s * fit),
+                      card_width - label_width - 100 * s, 2))
+
+
+def _layout_timeline(canvas, texts, items, width, height, s):
+    n = len(items)
+    line_y = height / 2
+    margin = 120 * s
+    slot = (width - 2 * margin) / n
+    line_height = max(int(10 * s), 2)
+    line_width = _px(width - 2 * margin)
+    composite(canvas, margin, line_y - line_height / 2, line_height, line_width,
+              gradient(line_height, line_width, "#B0BEC5", "#546E7A", horizontal=True))
+
+    card_width = _px(slot - 40 * s)
+    card_height = _px(height / 2 - 200 * s)
+    fit = _fit(card_width / 480.0 / s)
+    # 节点不宽于每个目标的间距
+    radius = max(min(60 * s, slot / 2 - 2 * s), 2)
+    card_mask = rounded_rect_mask(card_height, card_width, 24 * s)
+
+    for i, (level, obj) in enumerate(items):
+        colors = LEVEL_COLORS.get(level, DEFAULT_LEVEL_COLORS)
+        center_x = margin + slot * (i + 0.5)
+
+        # 节点
+        _circle(canvas, center_x, line_y, radius, colors, border=max(6 * s, 1))
+        texts.append(("text", (center_x, line_y), str(i + 1), int(radius * 64 / 60), True, "mm"))
+
+        # 上下交替放置卡片，用短竖线连接节点
+        above = i % 2 == 0
+        card_y = line_y - radius - 40 * s - card_height if above else line_y + radius + 40 * s
+        composite(canvas, center_x - card_width / 2, card_y, card_height, card_width,
+                  gradient(card_height, card_width, colors[0], colors[1]), alpha=0.92, mask=card_mask)
+        connector_top = card_y + card_height if above else line_y + radius
+        composite(canvas, center_x - 3 * s, connector_top, 40 * s, max(int(6 * s), 1), colors[1])
+
+        texts.append(("text", (center_x, card_y + 50 * s), level, int(52 * s * fit), True, "mm"))
+        texts.append(("wrap", (center_x - card_width / 2 + 30 * s, card_y + 100 * s), obj,
+                      int(40 * s * fit), card_width - 60 * s, 4))
+
+
+def _layout_pyramid(canvas, texts, items, width, height, s):
+    n = len(items)
+    top_y = 120 * s
+    bottom_y = height - 80 * s
+    layer_gap = 12 * s
+    layer_gap = min(layer_gap, (bottom_y - top_y) / n / 3)
+    layer_height = (bottom_y - top_y - layer_gap * (n - 1)) / n
+    pyramid_left = 120 * s
+    pyramid_width = int(width * 0.48)
+    apex_width = pyramid_width * 0.18
+    fit = _fit(layer_height / 250.0 / s)
+
+    # 第1个目标在最底层（最宽），依次向上
+    for i, (level, obj) in enumerate(items):
+        colors = LEVEL_COLORS.get(level, DEFAULT_LEVEL_COLORS)
+        row = n - 1 - i
+        y = top_y + row * (layer_height + layer_gap)
+        top_w = apex_width + (pyramid_width - apex_width) * (row / n)
+        bottom_w = apex_width + (pyramid_width - apex_width) * ((row + 1) / n)
+        h = _px(layer_height)
+        composite(canvas, pyramid_left, y, h, pyramid_width,
+                  gradient(h, pyramid_width, colors[0], colors[1]),
+                  mask=trapezoid_mask(h, pyramid_width, top_w, bottom_w))
+        center_y = y + layer_height / 2
+        texts.append(("text", (pyramid_left + pyramid_width / 2, center_y), f"{i + 1} {level}",
+                      int(52 * s * fit), True, "mm"))
+
+        # 右侧说明卡片 + 连接线
+        card_x = pyramid_left + pyramid_width + 60 * s
+        card_width = _px(width - card_x - 80 * s)
+        line_start = pyramid_left + (pyramid_width + (top_w + bottom_w) / 2) / 2
+        composite(canvas, line_start, center_y - 2 * s, max(int(4 * s), 1), card_x - line_start, colors[1])
+        composite(canvas, card_x, y, h, card_width, colors[0], alpha=0.16,
+                  mask=rounded_rect_mask(h, card_width, 18 * s))
+        composite(canvas, card_x, y, h, max(int(10 * s), 2), colors[1])
+        texts.append(("wrap_center", (card_x + 40 * s, center_y), obj, int(42 * s * fit),
+                      card_width - 70 * s, 3, "#333333"))
+
+
+_LAYOUT_FUNCTIONS = {
+    "stairs": _layout_stairs,
+    "cards": _layout_cards,
+    "timeline": _layout_timeline,
+    "pyramid": _layout_pyramid,
+}
+
+
+def _draw_texts(img, texts):
+    draw = ImageDraw.Draw(img)
+    for item in texts:
+        kind, (x, y), text, size = item[0], item[1], item[2], max(int(item[3]), 8)
+        if kind == "text":
+            bold, anchor = item[4], item[5]
+            draw.text((x, y), text, fill="white", font=get_font(size, bold), anchor=anchor)
+            continue
+        max_width, max_lines = item[4], item[5]
+        fill = item[6] if len(item) > 6 else "white"
+        font = get_font(size)
+        lines = wrap_text(text, font, max_width, max_lines)
+        line_height = size * 1.3
+        if kind == "wrap_center":
+            y = y - line_height * len(lines) / 2
+        draw_lines(draw, lines, x, y, font, line_height, fill=fill)
+
+
+def render_learning_objectives_image(objectives, layout=None, size=None):
+    """
+    本地渲染学习目标层级图
+
+    参数:
+        objectives: 学习目标列表
+        layout: "stairs" | "cards" | "timeline" | "pyramid"，默认按内容稳定选择
+        size: 输出像素尺寸 (宽, 高)，默认 1920x1080
+
+    返回:
+        BytesIO对象（PNG）
+    """
+    objectives = [str(obj) for obj in objectives] or ["暂无学习目标"]
+    width, height = size or (DESIGN_WIDTH, DESIGN_HEIGHT)
+    s = min(width / float(DESIGN_WIDTH), height / float(DESIGN_HEIGHT))
+    if layout not in _LAYOUT_FUNCTIONS:
+        layout = _stable_choice(OBJECTIVE_LAYOUTS, "\n".join(objectives))
+
+    items = list(zip(parse_objective_levels(objectives), objectives))
+    canvas = new_canvas(width, height)
+    texts = []
+    _LAYOUT_FUNCTIONS[layout](canvas, texts, items, width, height, s)
+
+    img = to_image(canvas)
+    _draw_texts(img, texts)
+
+    print(f"    🎨 已生成学习目标图（本地渲染，布局: {layout}）")
+    return to_png(img)
+
+
+# ========== 封面背景 ==========
+
+# 季节别名，与 ai_image_generator.SEASON_MAP 的键一致
+SEASON_ALIASES = {
+    "春": "春", "春季": "春",
+    "夏": "夏", "暑假": "夏",
+    "秋": "秋", "秋季": "秋",
+    "冬": "冬", "寒假": "冬",
+}
+
+# 季节配色：背景渐变（上、下）、角落光晕、装饰颜色、装饰形状
+SEASON_PALETTES = {
+    "春": {"background": ("#FDF6F8", "#EEF7EC"), "glow": "#F8C8D8",
+           "ornaments": ("#F4A7BB", "#F9CAD6", "#A8D5A2"), "shape": "blossom"},
+    "夏": {"background": ("#F2FAFF", "#FFF9E8"), "glow": "#FFE08A",
+           "ornaments": ("#7CC6E8", "#FFD166", "#A0E7E5"), "shape": "bubble"},
+    "秋": {"background": ("#FFF8F0", "#FBEFE3"), "glow": "#F6C28B",
+           "ornaments": ("#E9893B", "#D9553F", "#F2B134"), "shape": "leaf"},
+    "冬": {"background": ("#F5F9FD", "#E8F0F8"), "glow": "#C9DDF0",
+           "ornaments": ("#9CC3E6", "#B8D4EE", "#DDEAF6"), "shape": "snowflake"},
+    None: {"background": ("#F8F9FB", "#EEF1F5"), "glow": "#D5DEE8",
+           "ornaments": ("#B8C4D2", "#CBD5E1", "#A3B1C2"), "shape": "bubble"},
+}
+
+# 学科底纹，只出现在左上、右下两个角落
+SUBJECT_MOTIFS = {
+    "数学": "grid",
+    "物理": "rings", "地理": "rings",
+    "化学": "dots", "生物": "dots",
+    "英语": "ruled",
+    "语文": "columns", "历史": "columns", "政治": "columns",
+}
+
+# 封面中央留白区域（占宽高的比例），装饰不会进入该区域
+COVER_SAFE_AREA = (0.16, 0.18, 0.84, 0.82)
+
+
+def _sprite_grid(diameter):
+    """以精灵中心为原点的坐标网格"""
+    coords = np.arange(diameter, dtype=np.float32) + 0.5 - diameter / 2.0
+    return coords[None, :], coords[:, None]
+
+
+@functools.lru_cache(maxsize=64)
+def _ornament_sprite(shape, diameter, angle_step):
+    """
+    装饰图形覆盖率 (d, d)，按 (形状, 尺寸, 角度档位) 缓存，同一张封面的装饰只计算几次
+
+    角度量化为 12 档（每档 30°），避免每个装饰单独计算
+    """
+    xx, yy = _sprite_grid(diameter)
+    r = diameter / 2.0
+    angle = angle_step * np.pi / 6.0
+    cos_a, sin_a = np.float32(np.cos(angle)), np.float32(np.sin(angle))
+    u = xx * cos_a + yy * sin_a
+    v = -xx * sin_a + yy * cos_a
+
+    if shape == "blossom":
+        # 五瓣花：五个花瓣圆取并集，中间挖出花心
+        coverage = np.zeros((diameter, diameter), np.float32)
+        petal_r, offset = r * 0.42, r * 0.5
+        for k in range(5):
+            theta = angle + k * 2 * np.pi / 5
+            dist = np.hypot(xx - offset * np.cos(theta), yy - offset * np.sin(theta))
+            np.maximum(coverage, np.clip(petal_r - dist + 0.5, 0.0, 1.0), out=coverage)
+        center = np.clip(r * 0.16 - np.hypot(xx, yy) + 0.5, 0.0, 1.0)
+        return coverage * (1.0 - 0.6 * center)
+    if shape == "leaf":
+        # 叶片：沿主轴两端收尖的梭形，中间一条叶脉
+        length = r * 0.95
+        half_width = r * 0.42 * np.clip(1.0 - (u / length) ** 2, 0.0, 1.0)
+        coverage = np.clip(half_width - np.abs(v) + 0.5, 0.0, 1.0)
+        vein = np.clip(max(r * 0.04, 0.6) - np.abs(v) + 0.5, 0.0, 1.0) * (np.abs(u) < length * 0.8)
+        return coverage * (1.0 - 0.5 * vein)
+    if shape == "snowflake":
+        # 雪花：三条过中心的直线（六个分支）加分叉
+        thickness = max(r * 0.07, 0.8)
+        coverage = np.zeros((diameter, diameter), np.float32)
+        for k in range(3):
+            theta = angle + k * np.pi / 3
+            along = xx * np.cos(theta) + yy * np.sin(theta)
+            across = -xx * np.sin(theta) + yy * np.cos(theta)
+            spoke = np.clip(thickness - np.abs(across) + 0.5, 0.0, 1.0) * (np.abs(along) < r * 0.92)
+            # 分叉：距中心 0.55r 处与分支成 60° 的短枝
+            for sign in (1.0, -1.0):
+                for side in (1.0, -1.0):
+                    branch_along = (np.abs(along) - r * 0.55) * 0.5 + side * across * 0.866
+                    branch_across = -(np.abs(along) - r * 0.55) * 0.866 * side + across * 0.5
+                    branch = (np.clip(thickness - np.abs(branch_across) + 0.5, 0.0, 1.0)
+                              * (branch_along > 0) * (branch_along < r * 0.3) * (sign * along > 0))
+                    np.maximum(spoke, branch, out=spoke)
+            np.maximum(coverage, spoke, out=coverage)
+        return coverage
+    # bubble：中心略透明的光斑
+    dist = np.hypot(xx, yy)
+    disk = np.clip(r * 0.95 - dist + 0.5, 0.0, 1.0)
+    return disk * (0.55 + 0.45 * np.clip(dist / r, 0.0, 1.0) ** 2)
+
+
+def _edge_positions(rng, count, width, height, safe_area):
+    """在中央留白区域以外随机取点（向量化的拒绝采样）"""
+    left, top, right, bottom = safe_area
+    points = rng.random((count * 4, 2)) * np.array([width, height], np.float32)
+    inside = ((points[:, 0] > left * width) & (points[:, 0] < right * width)
+              & (points[:, 1] > top * height) & (points[:, 1] < bottom * height))
+    return points[~inside][:count]
+
+
+def _corner_glow(canvas, corner_x, corner_y, radius, color, alpha):
+    """角落的径向光晕，只计算光晕覆盖的方形区域"""
+    radius = int(radius)
+    height, width = canvas.shape[1], canvas.shape[2]
+    x0 = 0 if corner_x == 0 else width - radius
+    y0 = 0 if corner_y == 0 else height - radius
+    xx = np.arange(x0, x0 + radius, dtype=np.float32)[None, :] - corner_x
+    yy = np.arange(y0, y0 + radius, dtype=np.float32)[:, None] - corner_y
+    falloff = np.clip(1.0 - np.hypot(xx, yy) / radius, 0.0, 1.0) ** 2
+    composite(canvas, x0, y0, radius, radius, color, alpha=alpha, mask=falloff)
+
+
+def _subject_motif(canvas, motif, color, width, height, s):
+    """学科底纹：左上、右下角各一块，向中心方向淡出"""
+    region_w, region_h = int(width * 0.28), int(height * 0.34)
+    xx = np.arange(region_w, dtype=np.float32)[None, :]
+    yy = np.arange(region_h, dtype=np.float32)[:, None]
+    step = 36 * s
+    line = max(1.2 * s, 0.8)
+
+    if motif == "grid":
+        pattern = np.maximum(np.clip(line - np.abs((xx % step) - step / 2), 0.0, 1.0),
+                             np.clip(line - np.abs((yy % step) - step / 2), 0.0, 1.0))
+    elif motif == "ruled":
+        pattern = np.broadcast_to(np.clip(line - np.abs((yy % step) - step / 2), 0.0, 1.0), (region_h, region_w))
+    elif motif == "columns":
+        pattern = np.broadcast_to(np.clip(line - np.abs((xx % step) - step / 2), 0.0, 1.0), (region_h, region_w))
+    elif motif == "rings":
+        dist = np.hypot(xx, yy)
+        pattern = np.clip(line - np.abs((dist % (step * 1.5)) - step * 0.75), 0.0, 1.0)
+    else:  # dots
+        dist = np.hypot((xx % step) - step / 2, (yy % step) - step / 2)
+        pattern = np.clip(3.0 * s - dist + 0.5, 0.0, 1.0)
+
+    # 以角落为原点向外淡出，保证底纹不延伸到中央
+    fade = np.clip(1.0 - np.hypot(xx / region_w, yy / region_h), 0.0, 1.0)
+    mask = pattern * fade
+    composite(canvas, 0, 0, region_h, region_w, color, alpha=0.35, mask=mask)
+    composite(canvas, width - region_w, height - region_h, region_h, region_w, color, alpha=0.35,
+              mask=mask[::-1, ::-1])
+
+
+def render_cover_background(subject, season, size=None, motif=True):
+    """
+    本地渲染封面背景：淡雅渐变 + 角落光晕 + 仅在四周的季节装饰 + 可选学科底纹，中央留白
+
+    参数:
+        subject: 学科（决定学科底纹，见 SUBJECT_MOTIFS）
+        season: 季节（春/夏/秋/冬/寒假/暑假等，决定配色和装饰形状）
+        size: 输出像素尺寸 (宽, 高)，默认 1920x1080
+        motif: 是否绘制学科底纹
+
+    返回:
+        BytesIO对象（JPEG）
+    """
+    width, height = size or (DESIGN_WIDTH, DESIGN_HEIGHT)
+    s = min(width / float(DESIGN_WIDTH), height / float(DESIGN_HEIGHT))
+    palette = SEASON_PALETTES[SEASON_ALIASES.get(season)]
+    # 同样的学科和季节总是得到同样的封面
+    rng = np.random.default_rng(zlib.crc32(f"{subject}|{season}".encode("utf-8")))
+
+    canvas = new_canvas(width, height)
+    canvas[:3] = gradient(height, width, *palette["background"])
+    canvas[3] = 1.0
+
+    glow_radius = 0.45 * min(width, height) * 1.4
+    _corner_glow(canvas, 0, 0, glow_radius, palette["glow"], 0.45)
+    _corner_glow(canvas, width, height, glow_radius, palette["glow"], 0.45)
+
+    if motif and subject in SUBJECT_MOTIFS:
+        _subject_motif(canvas, SUBJECT_MOTIFS[subject], palette["ornaments"][0], width, height, s)
+
+    count = 34
+    positions = _edge_positions(rng, count, width, height, COVER_SAFE_AREA)
+    sizes = rng.choice(np.array([48, 72, 104], np.float32), len(positions), p=[0.5, 0.35, 0.15])
+    angles = rng.integers(0, 12, len(positions))
+    colors = rng.integers(0, len(palette["ornaments"]), len(positions))
+    alphas = rng.uniform(0.35, 0.7, len(positions))
+    for (x, y), diameter, angle, color, alpha in zip(positions, sizes, angles, colors, alphas):
+        diameter = max(int(diameter * s), 4)
+        sprite = _ornament_sprite(palette["shape"], diameter, int(angle))
+        composite(canvas, x - diameter / 2, y - diameter / 2, diameter, diameter,
+                  palette["ornaments"][color], alpha=float(alpha), mask=sprite)
+
+    img = Image.merge("RGB", [Image.fromarray(np.clip(channel, 0, 255).astype(np.uint8), "L")
+                              for channel in canvas[:3]])
+    print(f"  🎨 已生成封面背景（本地渲染，{season or '默认'}配色）")
+    return to_jpeg(img)
@@ -3,8 +3,8 @@
 完全匹配实际PPT模板的制作逻辑
 """
 import os
-import json
 from pptx import Presentation
+from pptx.util import Emu
 
 import config
 import utils
@@ -14,45 +14,62 @@ from ai_image_generator import (
     generate_intro_image,
     generate_knowledge_point_image,
     generate_learning_objectives_image,
-    simplify_intro_text,
+    generate_learning_objectives_image_local,
+    prepare_intro_slide_text,
     classify_knowledge_type,
-    generate_knowledge_type_badge
+    generate_knowledge_type_badge,
+    choose_image_request,
+    reset_image_budget,
+    KNOWLEDGE_TYPES,
+    get_text_cache,
+    image_flights,
+    text_flights
 )
 from slide_builder import SlideBuilder
+from deck_shards import build_in_shards, empty_presentation
+from stream_writer import StreamingDeckWriter
+from pdf_text import peak_rss_mb
+from draft_build import run_draft_first
+from prefetch import Prefetcher, prefetched
+from text_xml import set_text
+from build_journal import BuildJournal, fingerprint
+from image_reuse import TitleImageIndex
+from course_model import load_course, CourseDataError, KnowledgePoint, COVER_DEFAULTS
+from job_context import current_context, ensure_context
 
 
-def load_course_data():
-    """加载课程数据"""
-    if not os.path.exists(config.JSON_PATH):
-        print(f"❌ 错误: 找不到数据文件 {config.JSON_PATH}")
+def load_course_data(json_path=None):
+    """加载并校验课程数据，返回 Course 对象（失败时返回None）"""
+    json_path = json_path or current_context().json_path
+    if not os.path.exists(json_path):
+        print(f"❌ 错误: 找不到数据文件 {json_path}")
         print("请先运行: python Smart_PPT_Factory/parser.py")
         return None
     
-    with open(config.JSON_PATH, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    return data
+    try:
+        return load_course(json_path)
+    except CourseDataError as e:
+        print(f"❌ 错误: 课程数据格式不正确 {json_path}: {e}")
+        return None
 
 
-def get_cover_info():
-    """获取封面信息"""
+def find_cover_pdf():
+    """查找 PDF_DIR 中的源PDF"""
     import glob
     
-    # 尝试从PDF文件名解析
     pdfs = glob.glob(os.path.join(config.PDF_DIR, "*.pdf"))
-    if pdfs:
-        pdf_path = pdfs[0]
-        cover_info = utils.parse_filename_to_json(pdf_path)
-        return cover_info
+    return pdfs[0] if pdfs else None
+
+
+def get_cover_info(pdf_path=None):
+    """获取封面信息（文件名中没有的字段使用 COVER_DEFAULTS）"""
+    # 尝试从PDF文件名解析
+    pdf_path = pdf_path or find_cover_pdf()
+    if pdf_path:
+        return dict(COVER_DEFAULTS, **utils.parse_filename_to_json(pdf_path))
     
     # 默认信息
-    return {
-        "subject": "语文",
-        "grade": "高一",
-        "season": "寒假",
-        "teacher": "XXX老师",
-        "subtitle": "2025寒假高中小组课"
-    }
+    return dict(COVER_DEFAULTS)
 
 
 def fill_picture_placeholder(slide, image_source):
@@ -90,69 +107,223 @@ def fill_picture_placeholder(slide, image_source):
     return False
 
 
+def fill_picture_placeholder_with_text(builder, slide, text, font_size=24):
+    """
+    图片生成失败时，在图片占位符的位置改为放置文本框
+    
+    参数:
+        builder: SlideBuilder
+        slide: 幻灯片对象
+        text: 文本内容
+    """
+    for shape in slide.shapes:
+        if shape.is_placeholder and "PICTURE" in str(shape.placeholder_format.type):
+            left, top, width, height = (Emu(v).inches for v in (shape.left, shape.top, shape.width, shape.height))
+            sp = shape.element
+            sp.getparent().remove(sp)
+            builder.add_textbox(slide, text, left, top, width, height, font_size=font_size)
+            return True
+    return False
+
+
 def get_mindmap_image(data, target_type="learning_objectives"):
     """
     获取思维导图图片路径
     思维导图已在parser.py中精准提取
     
     参数:
-        data: 课程数据
+        data: 课程数据（Course）
         target_type: 目标类型 ("learning_objectives" 或 "summary")
     
     返回:
         图片路径或None
     """
-    extracted_images = data.get("extracted_images", [])
-    
-    if not extracted_images:
-        return None
-    
     # 查找标记为思维导图的图片
-    for img_info in extracted_images:
-        if img_info.get("is_mindmap", False):
-            img_path = img_info["path"]
-            
-            # 尝试多种路径方式
-            paths_to_try = [
-                img_path,  # 原始路径
-                os.path.join(config.SCRIPT_DIR, "data", "extracted_images", img_info['filename']),  # 绝对路径
-                os.path.join("data", "extracted_images", img_info['filename'])  # 相对路径
-            ]
-            
-            for path in paths_to_try:
-                if os.path.exists(path):
-                    print(f"    📊 使用提取的思维导图: {img_info['filename']}")
-                    return path
-            
-            print(f"    ⚠️ 思维导图文件不存在: {img_path}")
+    image_store = current_context().image_store
+    for img_info in data.mindmap_images:
+        if img_info.sha256:
+            # 图片库按内容哈希引用，路径直接计算
+            img_path = image_store.path(img_info.sha256, img_info.ext)
+        else:
+            # 旧版 course.json：记录的是相对项目根目录的路径
+            img_path = os.path.join(config.PROJECT_ROOT, img_info.path)
+        
+        if os.path.exists(img_path):
+            print(f"    📊 使用提取的思维导图: {img_info.filename}")
+            return img_path
+        
+        print(f"    ⚠️ 思维导图文件不存在: {img_path}")
     
     return None
 
 
-def generate_ppt():
-    """生成PPT主流程"""
+def build_knowledge_point_section(builder, i, kp, assets, slide_count=0):
+    """
+    构建一个知识点的全部幻灯片：切片标题、知识点内容（含续页）、开口说（仅第一个知识点）、经典例题
+    只做本地排版，不调用模型，可在分片构建的worker进程中执行（见 deck_shards.py）
+    
+    参数:
+        builder: SlideBuilder
+        i: 知识点序号（从1开始）
+        kp: KnowledgePoint
+        assets: 切片标题配图和类型标签图片（BytesIO），见 _build_ppt 中的 knowledge_point_assets
+        slide_count: 之前已生成的页数（用于打印页码）
+    
+    返回:
+        生成的页数
+    """
+    kp_title = kp.title
+    start_count = slide_count
+    
+    # 知识点切片标题（布局7）- 有图片占位符
+    print(f"      [{slide_count+1}] 切片标题")
+    slide = builder.create_slide(7)
+    for ph in slide.placeholders:
+        if ph.placeholder_format.type == 1:
+            set_text(ph, kp_title)
+    fill_picture_placeholder(slide, assets["title_image"])
+    slide_count += 1
+    
+    # 知识点（布局8）- 有图片占位符
+    print(f"      [{slide_count+1}] 知识点内容")
+    slides = builder.create_text_slides(8, {12: kp.content}, fixed={0: kp_title})
+    if len(slides) > 1:
+        print(f"      ↪️ 内容较长，拆分为 {len(slides)} 页")
+    
+    # 填充左下角的图片占位符（续页使用相同标签）
+    badge_image = assets["badge_image"]
+    if badge_image:
+        for slide in slides:
+            fill_picture_placeholder(slide, badge_image)
+    
+    slide_count += len(slides)
+    
+    # 开口说（布局9）- 只在第一个知识点后
+    if i == 1:
+        discussion = kp.discussion
+        print(f"      [{slide_count+1}] 开口说")
+        slides = builder.create_text_slides(9, {10: discussion})
+        slide_count += len(slides)
+    
+    # 经典例题母题（布局10）
+    example_mother = kp.example_mother
+    if example_mother:
+        print(f"      [{slide_count+1}] 经典例题（母题）")
+        slides = builder.create_text_slides(10, {10: example_mother})
+        if len(slides) > 1:
+            print(f"      ↪️ 例题较长，拆分为 {len(slides)} 页")
+        slide_count += len(slides)
+    
+    # 经典例题变式（布局11）
+    example_variant = kp.example_variant
+    method = kp.method
+    if example_variant or method:
+        print(f"      [{slide_count+1}] 经典例题（变式/方法）")
+        slides = builder.create_text_slides(11, {10: example_variant, 11: method})
+        if len(slides) > 1:
+            print(f"      ↪️ 变式/方法较长，拆分为 {len(slides)} 页")
+        slide_count += len(slides)
+    
+    return slide_count - start_count
+
+
+def start_prefetch(pdf_path):
+    """
+    流水线模式：PDF文件名确定后立即在后台生成不依赖 course.json 的图片，与PDF提取和解析并行
+    封面背景只取决于文件名中的科目、学期；三种知识类型标签与讲义内容无关，全部预先生成
+    （设置了 IMAGE_API_BUDGET 或续跑中断的构建时不预取标签，避免占用预算或重复生成）
+    
+    参数:
+        pdf_path: 源PDF路径
+    
+    返回:
+        Prefetcher（已保存到当前任务上下文，之后的 generate_ppt() 使用预取结果）
+    """
+    context = current_context()
+    settings = context.settings
+    
+    # 目标尺寸与 generate_ppt() 相同：按模板页面和标签占位符换算
+    builder = SlideBuilder(empty_presentation(settings.MASTER_TEMPLATE), context)
+    cover_size = builder.slide_pixel_size()
+    badge_size = builder.picture_target_size(builder.get_layout(8))
+    cover_info = get_cover_info(pdf_path)
+    subject, season = cover_info["subject"], cover_info["season"]
+    cover_renderer = settings.COVER_RENDERER
+    
+    journal = BuildJournal.for_source(pdf_path, context.journal_dir) if settings.BUILD_JOURNAL_ENABLED else None
+    
+    # 以上步骤都完成后才创建预取器（线程池）
+    prefetch = context.prefetch = Prefetcher()
+    reset_image_budget()
+    if not (journal and journal.get("cover_image", fingerprint(subject, season, cover_size, cover_renderer))):
+        prefetch.submit(generate_cover_image, subject, season, target_size=cover_size, renderer=cover_renderer)
+    if settings.IMAGE_API_BUDGET is None and not (journal and journal.count()):
+        for knowledge_type in KNOWLEDGE_TYPES:
+            prefetch.submit(generate_knowledge_type_badge, knowledge_type, target_size=badge_size)
+    print(f"  ⚡ 已在后台预取封面背景和知识类型标签")
+    return prefetch
+
+
+def generate_ppt(json_path=None, output_path=None, pdf_path=None, resume=True, cover_renderer=None,
+                 draft_first=None):
+    """
+    生成PPT主流程
+    路径、模型客户端、缓存和配置取自当前任务上下文（见 job_context.py）；
+    未设置上下文时为本次生成新建一个，多次调用的输出文件和中间文件互不冲突
+    
+    参数:
+        json_path: course.json 路径，默认上下文的 json_path
+        output_path: 输出PPT路径，默认上下文的 output_path
+        pdf_path: 源PDF路径（用于解析封面信息），默认在 PDF_DIR 中查找
+        resume: 是否从上次中断的检查点继续（已完成的AI调用不再重复）
+        cover_renderer: 封面背景渲染方式 "ai" | "local" | "auto"，默认 COVER_RENDERER
+        draft_first: 是否先保存使用占位图的草稿、后台生成图片后逐张替换（见 draft_build.py），
+                     默认 DRAFT_FIRST_ENABLED
+    
+    返回:
+        生成的PPT路径，失败时返回None
+    """
+    with ensure_context() as context:
+        output_path = output_path or context.output_path
+        if draft_first is None:
+            draft_first = context.settings.DRAFT_FIRST_ENABLED
+        if draft_first:
+            return run_draft_first(
+                lambda draft, path: _build_ppt(context, json_path, path, pdf_path, resume, cover_renderer, draft),
+                output_path)
+        return _build_ppt(context, json_path, output_path, pdf_path, resume, cover_renderer)
+
+
+def _build_ppt(context, json_path, output_path, pdf_path, resume, cover_renderer, draft=None):
+    settings = context.settings
+    json_path = json_path or context.json_path
+    pdf_path = pdf_path or find_cover_pdf()
+    cover_renderer = cover_renderer or settings.COVER_RENDERER
+    if context.prefetch is None:
+        # 有预取时预算已在 start_prefetch() 中重置，预取的调用也计入本次构建
+        reset_image_budget()
     print("=" * 80)
     print("🚀 启动新版PPT生成器（统一模板）")
     print("=" * 80)
     
     # 1. 加载数据
     print("\n[1/4] 加载课程数据...")
-    data = load_course_data()
+    data = load_course_data(json_path)
     if not data:
         return
     
     print(f"  ✅ 数据加载成功")
-    print(f"  - 讲义标题: {data.get('lecture_title', '未提取')}")
-    print(f"  - 学习目标: {len(data.get('learning_objectives', []))} 个")
-    print(f"  - 知识点: {len(data.get('knowledge_points', []))} 个")
+    print(f"  - 讲义标题: {data.lecture_title}")
+    print(f"  - 学习目标: {len(data.learning_objectives)} 个")
+    print(f"  - 知识点: {len(data.knowledge_points)} 个")
     
     # 2. 加载模板
     print("\n[2/4] 加载PPT模板...")
-    if not os.path.exists(config.MASTER_TEMPLATE):
-        print(f"❌ 错误: 找不到模板文件 {config.MASTER_TEMPLATE}")
+    if not os.path.exists(settings.MASTER_TEMPLATE):
+        print(f"❌ 错误: 找不到模板文件 {settings.MASTER_TEMPLATE}")
         return
     
-    prs = Presentation(config.MASTER_TEMPLATE)
+    prs = Presentation(settings.MASTER_TEMPLATE)
     print(f"  ✅ 模板加载成功")
     print(f"  - 可用布局: {len(prs.slide_layouts)} 个")
     
@@ -164,20 +335,61 @@ def generate_ppt():
             prs.part.drop_rel(rId)
             del prs.slides._sldIdLst[0]
     
+    # 检查点日志：按源PDF（没有PDF时按course.json）区分讲义
+    journal = None
+    if settings.BUILD_JOURNAL_ENABLED:
+        journal = BuildJournal.for_source(pdf_path or json_path, context.journal_dir)
+        if not resume:
+            journal.finish()
+            journal = BuildJournal.for_source(pdf_path or json_path, context.journal_dir)
+    
+    def checkpoint(stage, inputs, fn):
+        run = lambda: journal.cached(stage, fingerprint(*inputs), fn) if journal else fn()
+        return draft.value(stage, run) if draft else run()
+    
+    def checkpoint_image(stage, inputs, fn):
+        # 草稿优先构建：草稿阶段先返回占位图，真实图片在后台生成
+        run = lambda: journal.cached_image(stage, fingerprint(*inputs), fn) if journal else fn()
+        return draft.image(stage, run) if draft else run()
+    
+    # 知识点配图复用索引：相似标题直接复用已生成的图片
+    kp_image_index = TitleImageIndex() if settings.KP_IMAGE_REUSE_ENABLED else None
+    
+    def knowledge_point_image(title, target_size):
+        generate = lambda: generate_knowledge_point_image(title, "", target_size=target_size)
+        if kp_image_index is None:
+            return generate()
+        aspect = choose_image_request(target_size)[0] if target_size else "1:1"
+        return kp_image_index.get_or_generate(title, generate, aspect)
+    
     # 3. 创建幻灯片
     print("\n[3/4] 生成幻灯片...")
-    builder = SlideBuilder(prs)
-    cover_info = get_cover_info()
+    builder = SlideBuilder(prs, context)
+    cover_info = get_cover_info(pdf_path)
+    
+    # 流式写出：每部分幻灯片完成后立即写入输出文件并释放（大课件降低内存峰值）
+    writer = StreamingDeckWriter(prs, output_path) if settings.STREAM_WRITE_ENABLED else None
+    
+    def section_done():
+        if writer:
+            writer.flush()
     
     slide_count = 0
     
     # ========== 1. 封面（布局0：Cover_Layout）==========
     print("\n  📖 [1] 封面")
-    subject = cover_info.get("subject", "语文")
-    season = cover_info.get("season", "寒假")
+    subject = cover_info["subject"]
+    season = cover_info["season"]
     
     # 生成季节背景图
-    cover_bg = generate_cover_image(subject, season)
+    cover_size = builder.slide_pixel_size()
+    render_cover = lambda: prefetched(generate_cover_image, subject, season, target_size=cover_size,
+                                      renderer=cover_renderer)
+    if cover_renderer == "local":
+        # 本地渲染只需几十毫秒，不必记录检查点
+        cover_bg = render_cover()
+    else:
+        cover_bg = checkpoint_image("cover_image", (subject, season, cover_size, cover_renderer), render_cover)
     
     slide = builder.create_slide(0)
     
@@ -190,17 +402,19 @@ def generate_ppt():
     for ph in placeholders:
         idx = ph.placeholder_format.idx
         if idx == 10:
-            ph.text = f"小组课 · {season}课堂"
+            set_text(ph, f"小组课 · {season}课堂")
         elif idx == 11:
-            ph.text = subject
+            set_text(ph, subject)
         elif idx == 12:
-            ph.text = cover_info.get('subtitle', '2025寒假高中小组课')
+            set_text(ph, cover_info['subtitle'])
         elif idx == 13:
-            details = f"高中{subject}·{cover_info.get('grade', '高一')}\n主讲人：{cover_info.get('teacher', 'XXX老师')}"
-            ph.text = details
+            details = f"高中{subject}·{cover_info['grade']}\n主讲人：{cover_info['teacher']}"
+            set_text(ph, details)
     
     slide_count += 1
     
+    section_done()
+    
     # ========== 2. 课程体系（布局1）==========
     print("  📚 [2] 课程体系")
     slide = builder.create_slide(1)
@@ -210,13 +424,17 @@ def generate_ppt():
         builder.add_image(slide, course_system_img, left=2, top=2, width=12, height=6)
     slide_count += 1
     
+    section_done()
+    
     # ========== 3. 课堂引入（布局2）- 标题+图片+内容 ==========
     print("  🎬 [3] 课堂引入")
-    class_intro = data.get("class_intro", "欢迎来到本节课！")
+    class_intro = data.class_intro
     slide = builder.create_slide(2)
     
-    # 精简内容（如果太长）
-    intro_text = simplify_intro_text(class_intro, max_length=150)
+    # 一次调用同时完成内容精简（如果太长）和配图视觉主题提取
+    intro_texts = checkpoint("intro_texts", (class_intro, 150),
+                             lambda: prepare_intro_slide_text(class_intro, max_length=150))
+    intro_text = intro_texts["intro_text"]
     
     # 填充占位符 - 根据实际位置：占位符12在上面，占位符10在中间
     # 要求：标题在上面，内容在下面
@@ -224,52 +442,79 @@ def generate_ppt():
     for ph in placeholders:
         idx = ph.placeholder_format.idx
         if idx == 12:  # 最上面的文本占位符 - 标题
-            ph.text = "课堂引入"
+            set_text(ph, "课堂引入")
         elif idx == 10:  # 中间的文本占位符 - 内容
-            ph.text = intro_text
+            set_text(ph, intro_text)
     
     # 生成并填充图片
-    intro_img = generate_intro_image(class_intro)
+    intro_size = builder.picture_target_size(slide)
+    intro_img = checkpoint_image("intro_image", (class_intro, intro_texts["visual_theme"], intro_size),
+                                 lambda: generate_intro_image(class_intro, intro_texts["visual_theme"],
+                                                              target_size=intro_size))
     fill_picture_placeholder(slide, intro_img)
     slide_count += 1
     
+    section_done()
+    
     # ========== 4. 讲义标题（布局3）- 有图片占位符 ==========
     print("  📝 [4] 讲义标题")
-    lecture_title = data.get("lecture_title", "本节课主题")
+    lecture_title = data.lecture_title
     slide = builder.create_slide(3)
     
     # 填充标题占位符
     for ph in slide.placeholders:
         if ph.placeholder_format.type == 1:  # TITLE
-            ph.text = lecture_title
+            set_text(ph, lecture_title)
     
     # 生成并填充图片占位符
-    title_img = generate_lecture_title_image(lecture_title)
+    title_size = builder.picture_target_size(slide)
+    title_img = checkpoint_image("lecture_title_image", (lecture_title, title_size),
+                                 lambda: generate_lecture_title_image(lecture_title, target_size=title_size))
     fill_picture_placeholder(slide, title_img)
     slide_count += 1
     
+    section_done()
+    
     # ========== 5. 学习目标（布局4）- 标题+图片占位符 ==========
     print("  🎯 [5] 学习目标")
-    objectives = data.get("learning_objectives", ["暂无学习目标"])
+    objectives = data.learning_objectives
     slide = builder.create_slide(4)
     
     # 填充标题占位符
     for ph in slide.placeholders:
         if ph.placeholder_format.type == 1:  # TITLE
-            ph.text = "本节课学习目标"
-    
-    # 使用AI生成学习目标层级图（AI自由创作）
-    from ai_image_generator import generate_learning_objectives_image
-    objectives_img = generate_learning_objectives_image(objectives)
+            set_text(ph, "本节课学习目标")
+    
+    objectives_size = builder.picture_target_size(slide)
+    if settings.LEARNING_OBJECTIVES_RENDERER == "local":
+        # 本地渲染：无网络调用，文字清晰
+        try:
+            objectives_img = generate_learning_objectives_image_local(objectives, target_size=objectives_size)
+        except Exception as e:
+            print(f"    ⚠️ 本地渲染学习目标图失败: {e}")
+            objectives_img = None
+        style_name = "本地渲染"
+    else:
+        # 使用AI生成学习目标层级图（AI自由创作）
+        objectives_img = checkpoint_image("learning_objectives_image", (objectives, objectives_size),
+                                          lambda: generate_learning_objectives_image(objectives,
+                                                                                     target_size=objectives_size))
+        style_name = "AI创意风格"
     
     if objectives_img:
         fill_picture_placeholder(slide, objectives_img)
-        print("    ✅ 已生成学习目标层级图（AI创意风格）")
+        print(f"    ✅ 已生成学习目标层级图（{style_name}）")
     else:
-        print("    ⚠️ 学习目标图生成失败")
+        # 改为文字列出学习目标
+        fill_picture_placeholder_with_text(
+            builder, slide, "\n".join(f"{n}. {obj}" for n, obj in enumerate(objectives, 1))
+        )
+        print("    ⚠️ 学习目标图生成失败，改为文字列出")
     
     slide_count += 1
     
+    section_done()
+    
     # ========== 6. 学习目标思维导图（布局5）- 图片占位符 ==========
     print("  🗺️ [6] 学习目标思维导图")
     mindmap_img = get_mindmap_image(data, "learning_objectives")
@@ -283,127 +528,89 @@ def generate_ppt():
     
     slide_count += 1
     
+    section_done()
+    
     # ========== 7. 考情（布局6）==========
     print("  📊 [7] 考情分析")
-    exam_analysis = data.get("exam_analysis", "暂无考情分析")
-    slide = builder.create_slide(6)
+    exam_analysis = data.exam_analysis
+    slides = builder.create_text_slides(6, {11: exam_analysis}, fixed={0: "本节课考情"})
+    slide_count += len(slides)
     
-    for ph in slide.placeholders:
-        idx = ph.placeholder_format.idx
-        if idx == 0:
-            ph.text = "本节课考情"
-        elif idx == 11:
-            ph.text = exam_analysis
-    slide_count += 1
+    section_done()
     
     # ========== 知识点循环 ==========
-    knowledge_points = data.get("knowledge_points", [])
+    knowledge_points = data.knowledge_points
     
     if not knowledge_points:
         print("\n  ⚠️ 警告: 未找到知识点")
-        knowledge_points = [{
-            "title": "示例知识点",
-            "content": "这是示例内容"
-        }]
+        knowledge_points = [KnowledgePoint.placeholder()]
     
     print(f"\n  📚 知识点部分 ({len(knowledge_points)} 个知识点)")
     
-    for i, kp in enumerate(knowledge_points, 1):
-        kp_title = kp.get("title", f"知识点{i}")
-        kp_content = kp.get("content", "暂无内容")
-        
+    # 知识点配图和类型标签：生成的图片尺寸按版式中的图片占位符计算
+    kp_title_size = builder.picture_target_size(builder.get_layout(7))
+    badge_size = builder.picture_target_size(builder.get_layout(8))
+    
+    def knowledge_point_assets(i, kp):
+        """知识点部分的AI调用结果（切片标题配图、知识类型标签图片）"""
+        kp_title = kp.title
+        kp_content = kp.content
         print(f"\n    知识点 {i}: {kp_title}")
         
-        # 知识点切片标题（布局7）- 有图片占位符
-        print(f"      [{slide_count+1}] 切片标题")
-        slide = builder.create_slide(7)
-        for ph in slide.placeholders:
-            if ph.placeholder_format.type == 1:
-                ph.text = kp_title
-        # 生成并填充图片
-        kp_title_img = generate_knowledge_point_image(kp_title, "")
-        fill_picture_placeholder(slide, kp_title_img)
-        slide_count += 1
-        
-        # 知识点（布局8）- 有图片占位符
-        print(f"      [{slide_count+1}] 知识点内容")
-        slide = builder.create_slide(8)
-        for ph in slide.placeholders:
-            idx = ph.placeholder_format.idx
-            if idx == 0:
-                ph.text = kp_title
-            elif idx == 12:
-                ph.text = kp_content
+        kp_title_img = checkpoint_image(f"kp_title_image_{i}", (kp_title, kp_title_size),
+                                        lambda: knowledge_point_image(kp_title, kp_title_size))
         
         # 判断知识点类型并生成对应的标签图片
-        knowledge_type = classify_knowledge_type(kp_title, kp_content)
-        type_badge = generate_knowledge_type_badge(knowledge_type)
-        
-        # 保存标签图片到指定目录
-        badge_path = None
-        if type_badge:
-            badge_dir = os.path.join(config.SCRIPT_DIR, "data", "extracted_images")
-            os.makedirs(badge_dir, exist_ok=True)
-            badge_filename = f"knowledge_badge_{i}_{knowledge_type}.png"
-            badge_path = os.path.join(badge_dir, badge_filename)
-            
-            with open(badge_path, 'wb') as f:
-                f.write(type_badge.getvalue())
-            print(f"    💾 标签已保存: {badge_filename}")
-        
-        # 填充左下角的图片占位符
-        if badge_path and os.path.exists(badge_path):
-            fill_picture_placeholder(slide, badge_path)
-        
-        slide_count += 1
-        
-        # 开口说（布局9）- 只在第一个知识点后
-        if i == 1:
-            discussion = kp.get("discussion") or "请思考并讨论相关问题"
-            print(f"      [{slide_count+1}] 开口说")
-            slide = builder.create_slide(9)
-            for ph in slide.placeholders:
-                if ph.placeholder_format.idx == 10:
-                    ph.text = discussion
-            slide_count += 1
-        
-        # 经典例题母题（布局10）
-        example_mother = kp.get("example_mother") or ""
-        if example_mother:
-            print(f"      [{slide_count+1}] 经典例题（母题）")
-            slide = builder.create_slide(10)
-            for ph in slide.placeholders:
-                if ph.placeholder_format.idx == 10:
-                    ph.text = example_mother
-            slide_count += 1
+        knowledge_type = checkpoint(f"kp_type_{i}", (kp_title, kp_content),
+                                    lambda: classify_knowledge_type(kp_title, kp_content))
+        type_badge = checkpoint_image(f"kp_badge_{i}", (knowledge_type, badge_size),
+                                      lambda: prefetched(generate_knowledge_type_badge, knowledge_type,
+                                                         target_size=badge_size))
         
-        # 经典例题变式（布局11）
-        example_variant = kp.get("example_variant") or ""
-        method = kp.get("method") or ""
-        if example_variant or method:
-            print(f"      [{slide_count+1}] 经典例题（变式/方法）")
-            slide = builder.create_slide(11)
-            for ph in slide.placeholders:
-                idx = ph.placeholder_format.idx
-                if idx == 10:
-                    ph.text = example_variant
-                elif idx == 11:
-                    ph.text = method
-            slide_count += 1
+        return {"title_image": kp_title_img, "badge_image": type_badge}
+    
+    shard_workers = settings.SHARD_BUILD_WORKERS or os.cpu_count() or 1
+    counts = None
+    if 0 < settings.SHARD_BUILD_MIN_KNOWLEDGE_POINTS <= len(knowledge_points) and shard_workers > 1:
+        # 先完成全部AI调用，再分进程构建幻灯片
+        sections = [(i, kp, knowledge_point_assets(i, kp)) for i, kp in enumerate(knowledge_points, 1)]
+        weights = [len(kp.title) + len(kp.content) + len(kp.example_mother) + len(kp.example_variant)
+                   + len(kp.method) + 200 for kp in knowledge_points]
+        print()
+        counts = build_in_shards(builder, build_knowledge_point_section, sections, weights,
+                                 shard_workers, settings, on_merged=section_done)
+        if counts is None:
+            print("  ↪️ 改为单进程构建知识点部分")
+            for section in sections:
+                slide_count += build_knowledge_point_section(builder, *section, slide_count=slide_count)
+                section_done()
+        else:
+            slide_count += sum(counts)
+    else:
+        for i, kp in enumerate(knowledge_points, 1):
+            assets = knowledge_point_assets(i, kp)
+            slide_count += build_knowledge_point_section(builder, i, kp, assets, slide_count=slide_count)
+            section_done()
+    
+    section_done()
     
     # ========== 上台讲（布局12）- 所有知识点完成后 ==========
     print(f"\n  🎤 [{slide_count+1}] 上台讲")
     slide = builder.create_slide(12)
     for ph in slide.placeholders:
         if ph.placeholder_format.idx == 10:
-            ph.text = "请结合所学知识点，上台分享你的理解和心得"
+            set_text(ph, "请结合所学知识点，上台分享你的理解和心得")
     slide_count += 1
     
+    section_done()
+    
     # ========== 课堂总结过渡（布局13）==========
     print(f"  📋 [{slide_count+1}] 课堂总结过渡")
     slide = builder.create_slide(13)
     slide_count += 1
     
+    section_done()
+    
     # ========== 课堂总结内容（布局14）- 有图片占位符 ==========
     print(f"  📋 [{slide_count+1}] 课堂总结内容")
     slide = builder.create_slide(14)
@@ -418,28 +625,30 @@ def generate_ppt():
     
     slide_count += 1
     
+    section_done()
+    
     # ========== 出门测过渡（布局15）==========
     print(f"  ✅ [{slide_count+1}] 出门测过渡")
     slide = builder.create_slide(15)
     slide_count += 1
     
+    section_done()
+    
     # ========== 出门测计时（布局16）==========
     print(f"  ⏱️ [{slide_count+1}] 出门测计时")
-    quiz_content = data.get("quiz_content") or "请完成讲义上的测试题"
-    slide = builder.create_slide(16)
-    for ph in slide.placeholders:
-        if ph.placeholder_format.type == 1:
-            ph.text = quiz_content
-    slide_count += 1
+    quiz_content = data.quiz_content
+    slides = builder.create_text_slides(16, {0: quiz_content})
+    slide_count += len(slides)
+    
+    section_done()
     
     # ========== 作业布置（布局17）==========
     print(f"  📝 [{slide_count+1}] 作业布置")
-    homework = data.get("homework", "完成对应练习题")
-    slide = builder.create_slide(17)
-    for ph in slide.placeholders:
-        if ph.placeholder_format.idx == 10:
-            ph.text = homework
-    slide_count += 1
+    homework = data.homework
+    slides = builder.create_text_slides(17, {10: homework})
+    slide_count += len(slides)
+    
+    section_done()
     
     # ========== 告别（布局18）==========
     print(f"  👋 [{slide_count+1}] 告别")
@@ -448,15 +657,68 @@ def generate_ppt():
     
     # 4. 保存文件
     print(f"\n[4/4] 保存PPT文件...")
-    os.makedirs(os.path.dirname(config.OUTPUT_PATH), exist_ok=True)
-    prs.save(config.OUTPUT_PATH)
+    if writer:
+        writer.close()
+    else:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        prs.save(output_path)
     
     print("\n" + "=" * 80)
-    print(f"✅ PPT生成完成！")
-    print(f"📄 文件路径: {config.OUTPUT_PATH}")
+    print("📝 草稿生成完成（图片为占位图）" if draft and not draft.final else "✅ PPT生成完成！")
+    print(f"📄 文件路径: {output_path}")
     print(f"📊 总页数: {slide_count} 页")
+    if writer:
+        print(f"💾 {writer.summary()}")
+    peak_rss = peak_rss_mb()
+    if peak_rss:
+        print(f"📈 峰值内存: {peak_rss:.0f} MB")
+    if kp_image_index:
+        print(f"♻️ {kp_image_index.summary()}")
+    text_cache = get_text_cache()
+    if text_cache and text_cache.hits + text_cache.misses:
+        print(f"♻️ {text_cache.summary()}")
+    for flights in (image_flights, text_flights):
+        if flights.job_stats(context)["coalesced"]:
+            print(f"♻️ {flights.summary(context)}")
+    if context.prefetch:
+        print(f"♻️ {context.prefetch.summary()}")
+    if journal and not (draft and not draft.final):
+        print(f"♻️ {journal.summary()}")
+        # 构建完成，清除检查点（包括解析阶段记录的JSON）；草稿阶段保留，后台图片仍在写入
+        journal.finish()
     print("=" * 80)
+    
+    return output_path
+
+
+def build_from_pdf(pdf_path, output_path=None):
+    """
+    流水线构建：解析PDF并生成PPT
+    开启 PREFETCH_ENABLED 时，文件名确定后立即预取封面背景和知识类型标签，与PDF提取和解析并行
+    
+    返回:
+        生成的PPT路径，失败时返回None；解析失败时抛出 ParseError
+    """
+    import parser as pdf_parser
+    
+    with ensure_context() as context:
+        try:
+            if context.settings.PREFETCH_ENABLED:
+                start_prefetch(pdf_path)
+            pdf_parser.parse_content(pdf_path)
+            return generate_ppt(pdf_path=pdf_path, output_path=output_path)
+        finally:
+            # start_prefetch 中途失败时预取器也可能已创建
+            if context.prefetch:
+                context.prefetch.close()
+                context.prefetch = None
 
 
 if __name__ == "__main__":
-    generate_ppt()
+    import sys
+    
+    if len(sys.argv) > 1:
+        # python main.py 讲义.pdf：解析与生成一次完成（流水线预取）
+        build_from_pdf(sys.argv[1])
+    else:
+        generate_ppt()
@@ -0,0 +1,280 @@
+"""
+思维导图检测模块
+在PDF所有页面中查找思维导图：
+- 嵌入的位图：每页一次 get_image_info 批量获取位置，所有候选用NumPy统一打分
+- 矢量绘制的导图：get_drawings() 的图形按空间邻近聚类，只把命中区域按自适应DPI栅格化
+"""
+from collections import Counter
+
+import numpy as np
+import fitz  # PyMuPDF
+
+import config
+from pdf_text import release_page_memory
+
+# 可以原样写出的压缩格式
+RAW_IMAGE_FILTERS = {"DCTDecode": "jpeg", "JPXDecode": "jpx"}
+
+# 页面上下边距比例，边距内的图形（页眉页脚装饰）不参与矢量聚类
+_MARGIN = 0.08
+
+
+def _window(values, low, high, margin):
+    """区间隶属度：区间内为1，区间外按距离线性衰减，超出 margin 为0"""
+    outside = np.maximum(np.maximum(low - values, values - high), 0.0)
+    return np.clip(1.0 - outside / margin, 0.0, 1.0)
+
+
+def score_boxes(boxes, page_sizes, repeats=None, hint=None):
+    """
+    对候选区域统一打分（向量化）
+
+    参数:
+        boxes: (n, 4) 候选区域 x0, y0, x1, y1
+        page_sizes: (n, 2) 所在页面的宽、高
+        repeats: (n,) 同一图片出现的页数（重复出现的多为页眉、logo）
+        hint: (n,) 所在页面是否有"知识清单/思维导图"标题
+
+    返回:
+        (n,) 0-1 分数
+    """
+    boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+    page_sizes = np.asarray(page_sizes, np.float64).reshape(-1, 2)
+    width = boxes[:, 2] - boxes[:, 0]
+    height = boxes[:, 3] - boxes[:, 1]
+    width_ratio = width / page_sizes[:, 0]
+    area_ratio = width * height / (page_sizes[:, 0] * page_sizes[:, 1])
+    aspect = height / np.maximum(width, 1e-6)
+
+    # 导图一般横向铺满正文宽度、面积适中、不会是细长的横幅
+    score = (_window(width_ratio, 0.50, 0.95, 0.20)
+             * _window(area_ratio, 0.08, 0.60, 0.06)
+             * _window(aspect, 0.20, 1.50, 0.10))
+    if repeats is not None:
+        score = score * (np.asarray(repeats) <= 1)
+    if hint is not None:
+        score = score * (0.7 + 0.3 * np.asarray(hint, np.float64))
+    return score
+
+
+def raster_candidates(doc):
+    """
+    收集所有页面上的嵌入图片
+
+    每页只调用一次 get_image_info；不请求 xref（请求 xref 会顺带解码每张图片计算摘要），
+    重复图片按尺寸、字节数等特征识别，只有最终选中的图片才去解析 xref
+
+    返回:
+        候选字典列表（page、bbox、signature）
+    """
+    candidates = []
+    for page in doc:
+        for info in page.get_image_info():
+            candidates.append({
+                "page": page.number + 1,
+                "bbox": tuple(info["bbox"]),
+                "signature": (info["width"], info["height"], info["size"], info["bpc"], info["cs-name"]),
+                "page_size": (page.rect.width, page.rect.height),
+            })
+        release_page_memory(doc, page)
+    return candidates
+
+
+def _same_rect(a, b, tolerance=1.0):
+    """两个矩形的四个坐标都相差不到 tolerance（pt）"""
+    return max(abs(x - y) for x, y in zip(a, b)) < tolerance
+
+
+def resolve_xref(page, candidate):
+    """
+    查找候选图片的 xref 和压缩格式
+
+    返回:
+        (xref, filter)；内联图片等无法对应到 xref 时返回 (0, "")
+    """
+    width, height = candidate["signature"][:2]
+    matches = [img for img in page.get_images(full=True) if img[2] == width and img[3] == height]
+    if len(matches) > 1:
+        # 同尺寸图片不止一张时再按位置区分
+        bbox = fitz.Rect(candidate["bbox"])
+        matches = [img for img in matches
+                   if any(_same_rect(r, bbox) for r in page.get_image_rects(img[0]))]
+    if not matches:
+        return 0, ""
+    return matches[0][0], matches[0][8]
+
+
+def save_image_stream(doc, xref, image_filter, store):
+    """
+    把图片直接写入图片库
+
+    JPEG/JPEG2000 原样写出压缩流，不解码、不重新编码（压缩流会整体读入一个 bytes 对象后写出，
+    PyMuPDF 没有把流直接写入文件的接口）；其他格式由 Pixmap 在 MuPDF 内部解码并保存为PNG，
+    像素数据不经过 Python 对象
+
+    返回:
+        ImageStore 引用字典
+    """
+    smask = doc.xref_get_key(xref, "SMask")
+    if image_filter in RAW_IMAGE_FILTERS and smask[0] != "xref":
+        ext = RAW_IMAGE_FILTERS[image_filter]
+        tmp_path = store.temp_path(ext)
+        with open(tmp_path, "wb") as f:
+            f.write(doc.xref_stream_raw(xref))
+        return store.put_file(tmp_path, ext)
+
+    pix = fitz.Pixmap(doc, xref)
+    if smask[0] == "xref":
+        pix = fitz.Pixmap(pix, fitz.Pixmap(doc, int(smask[1].split()[0])))
+    if pix.colorspace and pix.colorspace.n > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    tmp_path = store.temp_path("png")
+    pix.save(tmp_path)
+    return store.put_file(tmp_path, "png")
+
+
+def _connected_components(adjacency):
+    """邻接矩阵的连通分量，返回每个节点的分量标签"""
+    n = adjacency.shape[0]
+    labels = np.arange(n)
+    while True:
+        updated = np.where(adjacency, labels[None, :], n).min(axis=1)
+        updated = np.minimum(updated, labels)
+        # 标签跳跃（指针压缩），减少迭代次数
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def vector_candidates(page, gap=None, min_paths=None, max_paths=2000):
+    """
+    把页面上的矢量图形按空间邻近聚类，返回像思维导图的区域
+
+    参数:
+        gap: 两个图形间距小于该值（pt）视为同一簇
+        min_paths: 一簇至少包含的图形数
+        max_paths: 图形过多的页面（如扫描版矢量化）直接跳过
+
+    返回:
+        候选字典列表（page、bbox、paths、curve_ratio）
+    """
+    gap = config.MINDMAP_CLUSTER_GAP if gap is None else gap
+    min_paths = config.MINDMAP_MIN_PATHS if min_paths is None else min_paths
+    page_w, page_h = page.rect.width, page.rect.height
+
+    rects, curves = [], []
+    for drawing in page.get_drawings():
+        r = drawing["rect"]
+        # 忽略整页背景、页眉页脚装饰
+        if r.width * r.height > 0.5 * page_w * page_h:
+            continue
+        if r.y1 < _MARGIN * page_h or r.y0 > (1 - _MARGIN) * page_h:
+            continue
+        items = drawing["items"]
+        # 曲线和斜线：导图连线的特征，表格只有水平/垂直线
+        curved = sum(1 for item in items if item[0] == "c"
+                     or (item[0] == "l" and abs(item[1].x - item[2].x) > 1 and abs(item[1].y - item[2].y) > 1))
+        rects.append((r.x0, r.y0, r.x1, r.y1))
+        curves.append(curved / float(max(len(items), 1)))
+
+    if len(rects) < min_paths or len(rects) > max_paths:
+        return []
+
+    boxes = np.array(rects, np.float64)
+    curves = np.array(curves)
+    grown = boxes + np.array([-gap, -gap, gap, gap])
+    adjacency = ((grown[:, None, 0] <= grown[None, :, 2]) & (grown[None, :, 0] <= grown[:, None, 2])
+                 & (grown[:, None, 1] <= grown[None, :, 3]) & (grown[None, :, 1] <= grown[:, None, 3]))
+    labels = _connected_components(adjacency)
+
+    candidates = []
+    for label, count in Counter(labels.tolist()).items():
+        if count < min_paths:
+            continue
+        members = labels == label
+        curve_ratio = float(curves[members].mean())
+        if curve_ratio < config.MINDMAP_MIN_CURVE_RATIO:
+            continue
+        cluster = boxes[members]
+        candidates.append({
+            "page": page.number + 1,
+            "bbox": (cluster[:, 0].min(), cluster[:, 1].min(), cluster[:, 2].max(), cluster[:, 3].max()),
+            "paths": count,
+            "curve_ratio": curve_ratio,
+            "page_size": (page_w, page_h),
+        })
+    return candidates
+
+
+def render_dpi(rect):
+    """自适应DPI：让裁剪区域的长边约为 config.MINDMAP_RENDER_PIXELS 像素"""
+    dpi = 72.0 * config.MINDMAP_RENDER_PIXELS / max(rect.width, rect.height, 1.0)
+    return int(min(max(dpi, 96), 300))
+
+
+def _best(candidates, hint_pages, repeats=None):
+    if not candidates:
+        return None, 0.0
+    scores = score_boxes(
+        [c["bbox"] for c in candidates],
+        [c["page_size"] for c in candidates],
+        repeats=repeats,
+        hint=[c["page"] in hint_pages for c in candidates],
+    )
+    index = int(np.argmax(scores))
+    return candidates[index], float(scores[index])
+
+
+def detect_mindmap(doc, store, hint_pages=()):
+    """
+    在整个文档中查找思维导图并保存到图片库
+
+    参数:
+        doc: 已打开的 fitz.Document
+        store: ImageStore 图片库
+        hint_pages: 有"知识清单/思维导图"标题的页码（从1开始），这些页上的候选加分
+
+    返回:
+        图片信息字典（page、sha256、ext、filename、is_mindmap、source、score），未找到时返回None
+    """
+    hint_pages = set(hint_pages)
+    min_score = config.MINDMAP_MIN_SCORE
+
+    candidates = raster_candidates(doc)
+    # 同一张图片出现在多页上的多为页眉、logo、装饰
+    signature_pages = Counter(signature for signature, _ in {(c["signature"], c["page"]) for c in candidates})
+    repeats = [signature_pages[c["signature"]] for c in candidates]
+    best, score = _best(candidates, hint_pages, repeats)
+    source = "raster"
+
+    if score < min_score and config.MINDMAP_VECTOR_DETECTION:
+        # 没有合适的位图时再查找矢量导图：优先看有提示标题的页面
+        pages = sorted(range(1, doc.page_count + 1), key=lambda p: p not in hint_pages)
+        for page_num in pages:
+            page = doc[page_num - 1]
+            vector_best, vector_score = _best(vector_candidates(page), hint_pages)
+            release_page_memory(doc, page)
+            if vector_score > score:
+                best, score, source = vector_best, vector_score, "vector"
+            if score >= min_score and page_num in hint_pages:
+                break
+
+    print(f"    候选位图 {len(candidates)} 张，最佳得分 {score:.2f}（{source}）")
+    if best is None or score < min_score:
+        return None
+
+    page = doc[best["page"] - 1]
+    xref, image_filter = resolve_xref(page, best) if source == "raster" else (0, "")
+    if xref:
+        image_ref = save_image_stream(doc, xref, image_filter, store)
+    else:
+        # 矢量导图或内联图片：只栅格化导图所在区域
+        clip = (fitz.Rect(best["bbox"]) + (-4, -4, 4, 4)) & page.rect  # 留出线宽
+        dpi = render_dpi(clip)
+        tmp_path = store.temp_path("png")
+        page.get_pixmap(clip=clip, dpi=dpi).save(tmp_path)
+        image_ref = store.put_file(tmp_path, "png")
+        print(f"    🖼️ 栅格化第{best['page']}页导图区域（{dpi} DPI）")
+
+    return dict(image_ref, page=best["page"], is_mindmap=True, source=source, score=round(score, 3))
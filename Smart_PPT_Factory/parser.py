@@ -1,137 +1,112 @@
 import os
 import json
 import glob
-from google import genai
 from google.genai import types
-import fitz  # PyMuPDF
 import config
+from build_journal import BuildJournal, fingerprint
+from pdf_text import (page_lines, strip_boilerplate, lines_to_text, estimate_tokens,
+                      open_pdf, release_page_memory, reset_peak_rss, peak_rss_mb)
+from segmenter import segment_document, heading_pages, model_source_text
+from mindmap_detector import detect_mindmap
+from image_store import ImageStore
+from job_context import current_context
 
 # 配置区
 MODEL_NAME = "gemini-2.0-flash-exp"  # 使用Gemini 2.0 Flash进行内容提取
 PDF_FILE = "Smart_PPT_Factory/data/高中语文_高一_2025寒假_小组课_张三.pdf"  # 当前要处理的PDF
 DEFAULT_PDF = "Smart_PPT_Factory/data/source.pdf"
-INPUT_FILE = config.INPUT_FILE
-OUTPUT_FILE = config.JSON_PATH
-IMAGE_OUTPUT_DIR = "Smart_PPT_Factory/data/extracted_images"
 
-client = genai.Client(api_key=config.API_KEY)
 
-def extract_pdf_content_and_images():
-    """提取PDF文字和图片（思维导图）"""
-    target_pdf = None
+class ParseError(Exception):
+    """解析流程失败（PDF提取失败、模型返回无效JSON等）"""
+
+
+def find_source_pdf():
+    """查找默认要处理的PDF"""
     if os.path.exists(PDF_FILE):
-        target_pdf = PDF_FILE
-    elif os.path.exists(DEFAULT_PDF):
-        target_pdf = DEFAULT_PDF
-    else:
-        # 尝试查找任何 PDF
-        pdfs = glob.glob("Smart_PPT_Factory/data/*.pdf")
-        if pdfs:
-            target_pdf = pdfs[0]
-    
+        return PDF_FILE
+    if os.path.exists(DEFAULT_PDF):
+        return DEFAULT_PDF
+    # 尝试查找任何 PDF
+    pdfs = glob.glob("Smart_PPT_Factory/data/*.pdf")
+    return pdfs[0] if pdfs else None
+
+
+def extract_pdf_content_and_images(pdf_path=None, text_file=None, image_dir=None):
+    """
+    提取PDF文字和图片（思维导图）
+
+    参数:
+        pdf_path: PDF路径，默认自动查找
+        text_file: 文字内容输出路径，默认当前任务上下文的 input_file
+        image_dir: 图片库目录，默认当前任务上下文的图片库（按内容哈希保存，多个PDF共用）
+
+    返回:
+        (是否成功, 提取的图片列表, 每页的 (文字行列表, 页面高度))，文字行已去除页眉页脚
+    """
+    context = current_context()
+    text_file = text_file or context.input_file
+    store = ImageStore(image_dir) if image_dir else context.image_store
+
+    target_pdf = pdf_path
+    if target_pdf is None:
+        target_pdf = find_source_pdf()
+    elif not os.path.exists(target_pdf):
+        target_pdf = None
+
     if not target_pdf:
         print("❌ 未找到PDF文件")
-        return False, []
+        return False, [], []
     
     print(f"📄 发现 PDF 文件: {target_pdf}")
     print("正在提取文字和思维导图...")
     
     try:
-        doc = fitz.open(target_pdf)
-        text_content = ""
-        extracted_images = []
-        mindmap_image = None
+        reset_peak_rss()
+        with open_pdf(target_pdf) as doc:
+            text_content = ""
+            extracted_images = []
         
-        # 创建图片输出目录
-        os.makedirs(IMAGE_OUTPUT_DIR, exist_ok=True)
+            # 提取带位置的文字行（用于识别页眉页脚、章节标题）
+            pages = []
+            for page in doc:
+                pages.append((page_lines(page), page.rect.height))
+                release_page_memory(doc, page)
         
-        # 提取文字和图片
-        for page_num, page in enumerate(doc, 1):
-            # 提取文字
-            text_content += f"\n=== 第 {page_num} 页 ===\n"
-            text_content += page.get_text() + "\n"
-            
-            # 只从第一页提取思维导图
-            if page_num == 1:
-                print(f"\n  🔍 分析第1页，寻找思维导图...")
-                
-                # 获取页面尺寸
-                page_rect = page.rect
-                page_width = page_rect.width
-                page_height = page_rect.height
-                
-                # 提取图片及其位置信息
-                image_list = page.get_images(full=True)
-                
-                for img_index, img in enumerate(image_list):
-                    xref = img[0]
-                    
-                    # 获取图片在页面上的位置
-                    img_rects = page.get_image_rects(xref)
-                    
-                    if img_rects:
-                        img_rect = img_rects[0]  # 取第一个位置
-                        
-                        # 计算图片的相对位置和大小
-                        img_width = img_rect.width
-                        img_height = img_rect.height
-                        img_x = img_rect.x0
-                        img_y = img_rect.y0
-                        
-                        # 计算图片面积占页面的比例
-                        img_area = img_width * img_height
-                        page_area = page_width * page_height
-                        area_ratio = img_area / page_area
-                        
-                        # 判断是否为思维导图：
-                        # 1. 位置在页面中间（y坐标在页面35%-70%之间）
-                        # 2. 宽度较大（占页面宽度的50%-95%）
-                        # 3. 面积适中（占页面面积的8%-25%）
-                        y_ratio = img_y / page_height
-                        width_ratio = img_width / page_width
-                        
-                        is_mindmap = (
-                            0.35 <= y_ratio <= 0.70 and
-                            0.50 <= width_ratio <= 0.95 and
-                            0.08 <= area_ratio <= 0.25
-                        )
-                        
-                        print(f"    图片{img_index+1}: 位置Y={y_ratio:.2f}, 宽度比={width_ratio:.2f}, 面积比={area_ratio:.2f}", end="")
-                        
-                        if is_mindmap:
-                            print(" ✅ [思维导图]")
-                            
-                            # 提取图片
-                            base_image = doc.extract_image(xref)
-                            image_bytes = base_image["image"]
-                            image_ext = base_image["ext"]
-                            
-                            # 保存为思维导图
-                            mindmap_filename = f"mindmap.{image_ext}"
-                            mindmap_path = os.path.join(IMAGE_OUTPUT_DIR, mindmap_filename)
-                            
-                            with open(mindmap_path, "wb") as img_file:
-                                img_file.write(image_bytes)
-                            
-                            mindmap_image = {
-                                "page": 1,
-                                "filename": mindmap_filename,
-                                "path": mindmap_path,
-                                "is_mindmap": True
-                            }
-                            
-                            print(f"    💾 保存思维导图: {mindmap_filename}")
-                        else:
-                            print(" ⏭️ [跳过]")
+            raw_chars = sum(len(line["text"]) + 1 for lines, _ in pages for line in lines)
+            if context.settings.STRIP_BOILERPLATE:
+                page_texts, stats = strip_boilerplate(pages)
+                removed = "、".join(f"{reason} {count} 行" for reason, count in stats["removed_lines"].items())
+                print(f"\n🧹 去除页眉页脚: {removed or '未发现重复内容'}")
+                if stats["removed_chars"]:
+                    print(f"  - 减少 {stats['removed_chars']} 字符（约 {stats['removed_tokens']} tokens，"
+                          f"占原文 {stats['removed_chars'] / float(max(raw_chars, 1)):.1%}）")
+                    print(f"  - 示例: {stats['samples']}")
+            else:
+                page_texts = [lines for lines, _ in pages]
         
-        doc.close()
+            text_pages = list(zip(page_texts, [height for _, height in pages]))
+            for page_num, lines in enumerate(page_texts, 1):
+                text_content += f"\n=== 第 {page_num} 页 ===\n"
+                text_content += lines_to_text(lines) + "\n"
+        
+            # 在所有页面中查找思维导图，"知识清单"等标题所在页优先
+            hint_pages = heading_pages(text_pages, "mindmap")
+            print(f"\n  🔍 查找思维导图（提示页: {hint_pages or '无'}）...")
+            mindmap_image = detect_mindmap(doc, store, hint_pages)
+            if mindmap_image:
+                print(f"    💾 保存思维导图: {mindmap_image['filename']}（第{mindmap_image['page']}页）")
         
         # 保存文字内容
-        with open(INPUT_FILE, "w", encoding="utf-8") as f:
+        with open(text_file, "w", encoding="utf-8") as f:
             f.write(text_content)
         
         print(f"\n✅ PDF 提取成功！")
-        print(f"  - 文字内容已保存至: {INPUT_FILE}")
+        print(f"  - 文字内容已保存至: {text_file}")
+        peak_rss = peak_rss_mb()
+        if peak_rss:
+            print(f"  - 📈 峰值内存: {peak_rss:.0f} MB（{config.PDF_INGEST_MODE} 方式读取，"
+                  f"文件 {os.path.getsize(target_pdf) / 1048576.0:.1f} MB）")
         
         if mindmap_image:
             extracted_images.append(mindmap_image)
@@ -139,35 +114,104 @@ def extract_pdf_content_and_images():
         else:
             print(f"  ⚠️ 未找到思维导图（将使用AI生成）")
         
-        return True, extracted_images
+        return True, extracted_images, text_pages
         
     except Exception as e:
         print(f"❌ PDF 提取失败: {e}")
         import traceback
         traceback.print_exc()
-        return False, []
+        return False, [], []
 
-def parse_content():
-    """解析PDF内容并生成结构化JSON"""
-    # 第一步：提取PDF文字和图片
-    success, extracted_images = extract_pdf_content_and_images()
+def request_course_json(prompt):
+    """调用模型提取结构化内容，返回解析后的字典；返回无效JSON时抛出 ParseError"""
+    print(f"\n🤖 正在调用 {MODEL_NAME} 进行深度解析...")
+    print("⏳ 这可能需要1-2分钟，请耐心等待...")
     
-    if not success:
-        print("❌ PDF提取失败，无法继续")
-        return
+    response = current_context().model_client.models.generate_content(
+        model=MODEL_NAME,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            temperature=0.1  # 降低温度以获得更准确的提取
+        )
+    )
+    
+    # 清理 LLM 可能返回的 Markdown 标记
+    json_content = response.text.strip()
+    
+    print(f"\n🔧 清理JSON格式...")
+    print(f"  原始长度: {len(json_content)} 字符")
+    print(f"  开头: {json_content[:50]}")
+    
+    # 1. 移除开头的 ```json
+    if json_content.startswith("```json"):
+        json_content = json_content[7:].strip()
+        print(f"  ✅ 移除开头的 ```json")
+    elif json_content.startswith("```"):
+        json_content = json_content[3:].strip()
+        print(f"  ✅ 移除开头的 ```")
+    
+    # 2. 移除结尾的 ```
+    if json_content.endswith("```"):
+        json_content = json_content[:-3].strip()
+        print(f"  ✅ 移除结尾的 ```")
+    
+    # 3. 移除 JSON 结尾后的额外文本
+    last_brace_index = json_content.rfind("}")
+    if last_brace_index != -1 and last_brace_index < len(json_content) - 1:
+        json_content = json_content[:last_brace_index+1]
+        print(f"  ✅ 移除结尾额外文本")
+    
+    print(f"  清理后长度: {len(json_content)} 字符")
+    print(f"  清理后开头: {json_content[:50]}")
 
-    if not os.path.exists(INPUT_FILE):
-        print(f"❌ 错误：未找到输入文件 {INPUT_FILE}")
-        return
+    try:
+        parsed_data = json.loads(json_content)
+        print(f"✅ JSON解析成功！")
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON 解析失败: {e}")
+        print("--- 清理后的数据 (前500字符) ---")
+        print(json_content[:500])
+        print("---------------------------")
+        # 尝试保存原始JSON以便调试
+        debug_path = current_context().debug_path
+        with open(debug_path, "w", encoding="utf-8") as f:
+            f.write(json_content)
+        print(f"完整JSON已保存到: {debug_path}")
+        raise ParseError(f"JSON 解析失败: {e}") from e
+    
+    return parsed_data
 
-    print(f"\n📖 正在读取 {INPUT_FILE} ...")
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        raw_text = f.read()
 
-    print(f"📝 文字内容长度: {len(raw_text)} 字符")
+# course.json 字段及其说明（发给模型的输出格式）
+COURSE_FIELDS = {
+    "lecture_title": "讲义标题",
+    "learning_objectives": "学习目标数组",
+    "class_intro": "课程导入",
+    "exam_analysis": "考情分析",
+    "mindmap_pages": "思维导图所在页码数组",
+    "knowledge_points": "知识点数组，每个知识点包含title, content, discussion, example_mother, example_variant, method",
+    "teaching_process": "教学过程数组",
+    "consolidation_exercises": "巩固练习数组",
+    "quiz_content": "出门测内容",
+    "homework": "课后作业",
+    "bg_keywords": "背景关键词（英文）",
+}
+
 
-    # 第二步：使用AI进行内容提取和结构化
-    prompt = f"""
+def build_prompt(fields, source_text, context=""):
+    """
+    生成解析提示词
+
+    参数:
+        fields: 需要模型输出的字段列表
+        source_text: 发给模型的讲义原文（完整原文或预切分后的相关部分）
+        context: 本地已识别的上下文信息（如讲义标题、知识点标题）
+    """
+    field_lines = "\n".join(f"- {field}: {COURSE_FIELDS[field]}" for field in fields)
+    partial = len(fields) < len(COURSE_FIELDS)
+    source_title = "讲义相关部分原文" if partial else "PDF原始内容"
+    context_block = f"\n**已知信息：**\n{context}" if context else ""
+    return f"""
 你是一个专业的教育内容提取专家。请从以下PDF讲义的原始文本中提取完整的结构化内容。
 
 **重要要求：**
@@ -178,107 +222,129 @@ def parse_content():
 5. **JSON格式规范** - 确保所有字符串中的引号、换行符都正确转义
 
 **输出格式：**
-请输出一个有效的JSON对象，包含以下字段：
-- lecture_title: 讲义标题
-- learning_objectives: 学习目标数组
-- class_intro: 课程导入
-- exam_analysis: 考情分析
-- mindmap_pages: 思维导图所在页码数组
-- knowledge_points: 知识点数组，每个知识点包含title, content, discussion, example_mother, example_variant, method
-- teaching_process: 教学过程数组
-- consolidation_exercises: 巩固练习数组
-- quiz_content: 出门测内容
-- homework: 课后作业
-- bg_keywords: 背景关键词（英文）
+请输出一个有效的JSON对象，{"只需" if partial else ""}包含以下字段：
+{field_lines}
 
 **特别注意：**
 - 所有文本内容中的双引号必须转义为 \\"
 - 所有换行符使用 \\n 表示
 - 确保JSON格式完全有效，可以被标准JSON解析器解析
-
-**PDF原始内容：**
-{raw_text}
+{context_block}
+**{source_title}：**
+{source_text}
 
 请输出完整的JSON对象，用```json和```包裹：
 """
 
-    print(f"\n🤖 正在调用 {MODEL_NAME} 进行深度解析...")
-    print("⏳ 这可能需要1-2分钟，请耐心等待...")
+
+def parse_content(pdf_path=None, output_file=None, work_dir=None):
+    """
+    解析PDF内容并生成结构化JSON
+
+    参数:
+        pdf_path: PDF路径，默认自动查找
+        output_file: course.json 输出路径，默认当前任务上下文的 json_path
+        work_dir: 中间文件目录（raw_content.txt），默认当前任务上下文的 input_file；提取的图片统一保存在图片库
+
+    返回:
+        解析后的课程数据字典；失败时抛出 ParseError
+    """
+    context = current_context()
+    settings = context.settings
+    output_file = output_file or context.json_path
+    pdf_path = pdf_path or find_source_pdf()
+    input_file = os.path.join(work_dir, "raw_content.txt") if work_dir else context.input_file
+
+    # 第一步：提取PDF文字和图片
+    success, extracted_images, pages = extract_pdf_content_and_images(pdf_path, input_file)
     
+    if not success:
+        print("❌ PDF提取失败，无法继续")
+        raise ParseError("PDF提取失败")
+
+    if not os.path.exists(input_file):
+        print(f"❌ 错误：未找到输入文件 {input_file}")
+        raise ParseError(f"未找到输入文件 {input_file}")
+
+    print(f"\n📖 正在读取 {input_file} ...")
+    with open(input_file, "r", encoding="utf-8") as f:
+        raw_text = f.read()
+
+    print(f"📝 文字内容长度: {len(raw_text)} 字符（约 {estimate_tokens(raw_text)} tokens）")
+
+    # 第二步：本地预切分，能可靠识别的字段不再交给模型
+    local_fields = {}
+    source_text = raw_text
+    prompt_context = ""
+    if settings.SEGMENTER_ENABLED and pages:
+        segments = segment_document(pages)
+        local_fields = {
+            field: value for field, (value, confidence) in segments["fields"].items()
+            if confidence >= settings.SEGMENTER_MIN_CONFIDENCE
+        }
+        # 巩固练习已拆出时，模型只需要看知识点部分和本地没识别出的章节
+        narrowed = model_source_text(segments, set(local_fields))
+        if narrowed:
+            source_text = narrowed
+            prompt_context = (f"讲义标题：{local_fields.get('lecture_title', '')}\n"
+                       f"知识点标题：{json.dumps(segments['knowledge_point_titles'], ensure_ascii=False)}\n")
+    
+    model_fields = [field for field in COURSE_FIELDS if field not in local_fields]
+    if local_fields:
+        print(f"\n🧩 本地识别字段: {', '.join(local_fields)}")
+        print(f"  - 交给模型整理: {', '.join(model_fields)}")
+        print(f"  - 发给模型的原文: {estimate_tokens(raw_text)} → {estimate_tokens(source_text)} tokens")
+
+    # 第三步：使用AI进行内容提取和结构化
+    prompt = build_prompt(model_fields, source_text, prompt_context)
+
+    # 解析结果按PDF记录检查点，构建中途失败重跑时不再重复这次1-2分钟的调用
+    journal = None
+    if settings.BUILD_JOURNAL_ENABLED and pdf_path:
+        journal = BuildJournal.for_source(pdf_path, context.journal_dir)
+
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.1  # 降低温度以获得更准确的提取
+        if journal:
+            parsed_data = journal.cached(
+                "parsed_json", fingerprint(MODEL_NAME, prompt),
+                lambda: request_course_json(prompt)
             )
-        )
-        
-        # 清理 LLM 可能返回的 Markdown 标记
-        json_content = response.text.strip()
-        
-        print(f"\n🔧 清理JSON格式...")
-        print(f"  原始长度: {len(json_content)} 字符")
-        print(f"  开头: {json_content[:50]}")
-        
-        # 1. 移除开头的 ```json
-        if json_content.startswith("```json"):
-            json_content = json_content[7:].strip()
-            print(f"  ✅ 移除开头的 ```json")
-        elif json_content.startswith("```"):
-            json_content = json_content[3:].strip()
-            print(f"  ✅ 移除开头的 ```")
-        
-        # 2. 移除结尾的 ```
-        if json_content.endswith("```"):
-            json_content = json_content[:-3].strip()
-            print(f"  ✅ 移除结尾的 ```")
-        
-        # 3. 移除 JSON 结尾后的额外文本
-        last_brace_index = json_content.rfind("}")
-        if last_brace_index != -1 and last_brace_index < len(json_content) - 1:
-            json_content = json_content[:last_brace_index+1]
-            print(f"  ✅ 移除结尾额外文本")
+        else:
+            parsed_data = request_course_json(prompt)
         
-        print(f"  清理后长度: {len(json_content)} 字符")
-        print(f"  清理后开头: {json_content[:50]}")
-
-        try:
-            parsed_data = json.loads(json_content)
-            print(f"✅ JSON解析成功！")
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON 解析失败: {e}")
-            print("--- 清理后的数据 (前500字符) ---")
-            print(json_content[:500])
-            print("---------------------------")
-            # 尝试保存原始JSON以便调试
-            with open("Smart_PPT_Factory/data/debug_json.txt", "w", encoding="utf-8") as f:
-                f.write(json_content)
-            print(f"完整JSON已保存到: Smart_PPT_Factory/data/debug_json.txt")
-            import sys
-            sys.exit(1)
+        # 合并本地识别的字段，按 COURSE_FIELDS 顺序输出
+        merged = dict(parsed_data)
+        merged.update(local_fields)
+        parsed_data = {field: merged[field] for field in COURSE_FIELDS if field in merged}
+        parsed_data.update({k: v for k, v in merged.items() if k not in parsed_data})
         
         # 添加提取的图片信息
         parsed_data["extracted_images"] = extracted_images
         
         # 保存结构化数据
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        with open(output_file, "w", encoding="utf-8") as f:
             json.dump(parsed_data, f, indent=2, ensure_ascii=False)
             
-        print(f"\n✅ 转换成功！结构化数据已保存至: {OUTPUT_FILE}")
+        print(f"\n✅ 转换成功！结构化数据已保存至: {output_file}")
         print(f"📊 统计信息:")
         print(f"  - 讲义标题: {parsed_data.get('lecture_title', '未提取')}")
         print(f"  - 学习目标: {len(parsed_data.get('learning_objectives', []))} 个")
         print(f"  - 知识点: {len(parsed_data.get('knowledge_points', []))} 个")
         print(f"  - 提取图片: {len(extracted_images)} 张")
         print(f"  - 思维导图页: {parsed_data.get('mindmap_pages', [])}")
+        return parsed_data
         
+    except ParseError:
+        raise
     except Exception as e:
         print(f"❌ 解析过程发生错误: {e}")
         import traceback
         traceback.print_exc()
-        import sys
-        sys.exit(1)
+        raise ParseError(f"解析过程发生错误: {e}") from e
 
 if __name__ == "__main__":
-    parse_content()
+    try:
+        parse_content()
+    except ParseError:
+        import sys
+        sys.exit(1)
@@ -0,0 +1,262 @@
+"""
+PDF文本预处理模块
+按行读取带位置的文本（get_text("dict")），识别并去除跨页重复的页眉、页脚、页码和水印，
+缩短发给解析模型的提示词；另提供内存映射方式打开PDF和峰值内存统计
+"""
+import re
+import math
+import mmap
+import sys
+import unicodedata
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+
+import fitz  # PyMuPDF
+import config
+
+# 只取文字：默认的 "dict" 输出会解码页面上的所有图片，耗时是纯文本的十几倍
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# 页码样式："3"、"- 3 -"、"第3页"、"3/23"、"第 3 页 共 23 页"、"Page 3 of 23"
+_PAGE_NUMBER_PATTERN = re.compile(
+    r"^[-—–\s]*(第\s*)?\d{1,4}\s*(页)?\s*((/|of|共)\s*\d{1,4}\s*(页)?)?[-—–\s]*$"
+    r"|^page\s*\d{1,4}(\s*of\s*\d{1,4})?$",
+    re.IGNORECASE
+)
+_DIGITS = re.compile(r"\d+")
+# open_pdf 打开的文档 → 内存回收状态（id(doc) 为键）
+_OPEN_DOCS = {}
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def page_lines(page):
+    """
+    读取页面的所有文本行
+
+    返回:
+        行字典列表，包含 text、bbox、size（最大字号）、bold（是否全部加粗）、font
+    """
+    lines = []
+    for block in page.get_text("dict", flags=TEXT_DICT_FLAGS)["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            lines.append({
+                "text": "".join(span["text"] for span in line["spans"]),
+                "bbox": tuple(line["bbox"]),
+                "size": max(span["size"] for span in spans),
+                # flags 第4位（16）表示粗体；部分字体只在字体名中体现
+                "bold": all(span["flags"] & 16 or "bold" in span["font"].lower() for span in spans),
+                "font": spans[0]["font"],
+            })
+    return lines
+
+
+def _line_key(text, mask_digits=True):
+    """跨页比较用的行指纹：全半角统一、去空白；页眉页脚中的数字统一替换（页码、日期等每页不同）"""
+    text = unicodedata.normalize("NFKC", text)
+    text = "".join(text.split())
+    return _DIGITS.sub("#", text) if mask_digits else text
+
+
+def is_page_number(text):
+    return bool(_PAGE_NUMBER_PATTERN.match(unicodedata.normalize("NFKC", text).strip()))
+
+
+def estimate_tokens(text):
+    """粗略估计token数：中日韩字符每字约1个token，其余约4个字符1个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def strip_boilerplate(pages, min_ratio=None, margin=None):
+    """
+    去除跨页重复的页眉页脚、页码和水印
+
+    参数:
+        pages: 每页的 (行列表, 页面高度)，行列表来自 page_lines()
+        min_ratio: 同一位置的同一行出现在至少该比例的页面上才视为重复，默认 config.BOILERPLATE_MIN_RATIO
+        margin: 页面上下边距比例，边距内的页码无论是否重复都会去除，默认 config.BOILERPLATE_MARGIN
+
+    返回:
+        (每页保留的行列表, 统计字典)
+    """
+    min_ratio = config.BOILERPLATE_MIN_RATIO if min_ratio is None else min_ratio
+    margin = config.BOILERPLATE_MARGIN if margin is None else margin
+
+    def line_key(line, height):
+        """
+        (行指纹, 纵向位置档)；位置按页面高度分为40档
+
+        边距内的行忽略数字差异，并登记到相邻档位以容忍轻微偏移；
+        正文区域只有文字和位置完全相同才算重复（水印），避免误删正文
+        """
+        center = (line["bbox"][1] + line["bbox"][3]) / 2.0 / height
+        in_margin = center < margin or center > 1.0 - margin
+        return _line_key(line["text"], mask_digits=in_margin), int(center * 40), in_margin
+
+    page_counts = Counter()
+    for lines, height in pages:
+        keys = set()
+        for line in lines:
+            key, band, in_margin = line_key(line, height)
+            bands = (band - 1, band, band + 1) if in_margin else (band,)
+            keys.update((key, b) for b in bands)
+        page_counts.update(keys)
+
+    margin_threshold = max(2, math.ceil(len(pages) * min_ratio))
+    # 水印一般每页都有，正文区域要求更高的重复比例
+    body_threshold = max(margin_threshold, math.ceil(len(pages) * 0.8))
+    kept_pages = []
+    removed = defaultdict(int)
+    removed_text = []
+
+    for lines, height in pages:
+        kept = []
+        for line in lines:
+            key, band, in_margin = line_key(line, height)
+            count = page_counts[(key, band)] if key and len(pages) > 1 else 0
+
+            if in_margin and is_page_number(line["text"]):
+                reason = "页码"
+            elif in_margin and count >= margin_threshold:
+                reason = "页眉页脚"
+            elif not in_margin and count >= body_threshold:
+                reason = "水印"
+            else:
+                kept.append(line)
+                continue
+            removed[reason] += 1
+            removed_text.append(line["text"])
+        kept_pages.append(kept)
+
+    removed_chars = sum(len(text) + 1 for text in removed_text)
+    stats = {
+        "removed_lines": dict(removed),
+        "removed_chars": removed_chars,
+        "removed_tokens": estimate_tokens("\n".join(removed_text)),
+        "samples": sorted(set(t.strip() for t in removed_text), key=len, reverse=True)[:5],
+    }
+    return kept_pages, stats
+
+
+def lines_to_text(lines):
+    return "\n".join(line["text"] for line in lines)
+
+
+@contextmanager
+def open_pdf(path, mode=None):
+    """
+    打开PDF文档
+
+    mmap 模式下把文件映射到内存，以 memoryview 交给 PyMuPDF（不复制文件内容），
+    页面数据由操作系统按需换入，大文件不会整体读入进程内存
+
+    参数:
+        path: PDF路径
+        mode: "mmap" 或 "file"，默认 config.PDF_INGEST_MODE
+    """
+    mode = mode or config.PDF_INGEST_MODE
+    if mode != "mmap":
+        doc = fitz.open(path)
+        _OPEN_DOCS[id(doc)] = {"mapping": None, "seen": set(), "bytes": 0}
+        try:
+            yield doc
+        finally:
+            _OPEN_DOCS.pop(id(doc), None)
+            doc.close()
+        return
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            doc = fitz.open(stream=view, filetype="pdf")
+            _OPEN_DOCS[id(doc)] = {"mapping": mapped, "seen": set(), "bytes": 0}
+            try:
+                yield doc
+            finally:
+                _OPEN_DOCS.pop(id(doc), None)
+                doc.close()
+        finally:
+            # 先释放 memoryview，否则 mmap 无法关闭
+            view.release()
+            mapped.close()
+
+
+def _stream_length(doc, xref):
+    """对象流的压缩后长度（读取字典，不解码）"""
+    kind, value = doc.xref_get_key(xref, "Length")
+    if kind == "xref":
+        value = doc.xref_object(int(value.split()[0])).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def release_page_memory(doc, page):
+    """
+    逐页处理（open_pdf 打开的文档）时每页调用一次，控制峰值内存
+
+    MuPDF 会缓存页面上加载过的图片，处理过的页面越多占用越大；新遇到的图片累计超过
+    config.PDF_STORE_LIMIT_MB 时清空缓存（不每页清空：字体等跨页复用的资源重新加载代价很高）。
+    mmap 方式下同时归还已读过的文件页
+    """
+    state = _OPEN_DOCS.get(id(doc))
+    if state is None:
+        return
+    for image in page.get_images():
+        xref = image[0]
+        if xref not in state["seen"]:
+            state["seen"].add(xref)
+            state["bytes"] += _stream_length(doc, xref)
+    if state["bytes"] > config.PDF_STORE_LIMIT_MB * 1048576:
+        fitz.TOOLS.store_shrink(100)
+        state["seen"].clear()
+        state["bytes"] = 0
+    if state["mapping"] is not None and hasattr(mmap, "MADV_DONTNEED"):
+        # 只读共享映射，丢弃后再访问会从文件重新读入
+        state["mapping"].madvise(mmap.MADV_DONTNEED)
+
+
+def reset_peak_rss():
+    """重置进程峰值内存统计（仅Linux支持，其他系统忽略）"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    进程峰值内存（MB）：优先读 /proc/self/status 的 VmHWM（可被 reset_peak_rss 重置），
+    否则用 getrusage；Windows 上没有 resource 模块，改用 psutil
+
+    返回:
+        浮点数；无法获取时返回None（Windows 上需要安装 psutil）
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1048576.0
+
+    # Linux 上 ru_maxrss 单位为KB，macOS 为字节
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1048576.0 if sys.platform == "darwin" else maxrss / 1024.0
@@ -0,0 +1,58 @@
+"""
+预取
+PDF文件名确定后就能发起的AI调用（封面背景、知识类型标签）不必等解析模型返回：
+在后台线程中提前执行并保存结果，generate_ppt() 中参数完全相同的调用直接使用预取结果
+"""
+import io
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from job_context import current_context
+
+
+def _call_key(fn, args, kwargs):
+    return (fn, args, tuple(sorted(kwargs.items())))
+
+
+class Prefetcher:
+    """一个任务的预取调用（保存在 JobContext.prefetch 中）"""
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._futures = {}
+        self.hits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """在后台执行 fn(*args, **kwargs)（沿用当前任务上下文）"""
+        key = _call_key(fn, args, kwargs)
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def get(self, fn, args, kwargs):
+        """参数相同的预取调用的 Future，没有预取时返回None"""
+        return self._futures.get(_call_key(fn, args, kwargs))
+
+    def close(self):
+        """取消尚未开始的预取（已开始的调用在后台自然结束）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        return f"预取 {len(self._futures)} 项，命中 {self.hits} 次"
+
+
+def prefetched(fn, *args, **kwargs):
+    """
+    调用 fn(*args, **kwargs)；当前任务已预取参数相同的调用时等待并使用其结果
+
+    返回:
+        fn 的结果（BytesIO 结果每次返回一份副本，同一张标签图片可以用在多页）
+    """
+    prefetch = current_context().prefetch
+    future = prefetch.get(fn, args, kwargs) if prefetch else None
+    if future is None or future.cancelled():
+        return fn(*args, **kwargs)
+    result = future.result()
+    prefetch.hits += 1
+    if isinstance(result, io.BytesIO):
+        return io.BytesIO(result.getvalue())
+    return result
@@ -0,0 +1,274 @@
+"""
+讲义结构预切分模块
+根据字号、粗细和标题关键词把讲义切分为候选章节（学习目标、考情分析、课堂引入、知识点等），
+能可靠识别的字段直接本地填充，只把需要模型整理的部分交给解析模型
+"""
+import re
+from collections import Counter
+
+# 标题关键词 → 章节类型（按顺序匹配）
+HEADING_PATTERNS = [
+    ("learning_objectives", re.compile(r"^学习目标$")),
+    ("mindmap", re.compile(r"^(知识清单|思维导图|知识框架|知识体系)$")),
+    ("exam_analysis", re.compile(r"^【?考情分析】?$")),
+    ("class_intro", re.compile(r"^【?(课堂引入|课程导入|课堂导入|情境导入)】?$")),
+    ("knowledge_point", re.compile(r"^知识点\s*[0-9一二三四五六七八九十]+")),
+    ("notes", re.compile(r"^知识笔记$")),
+    ("examples", re.compile(r"^(经典例题|典型例题|例题精讲)$")),
+    ("example_item", re.compile(r"^例\s*\d+(-\d+)?$")),
+    ("consolidation", re.compile(r"^(巩固练习|课堂练习|当堂练习)$")),
+    ("exercise_item", re.compile(r"^练\s*\d+(-\d+)?$")),
+    ("quiz", re.compile(r"^【?(出门测|课堂检测|当堂检测)】?$")),
+    ("homework", re.compile(r"^【?(课后作业|课后练习|作业布置)】?$")),
+    ("teacher_note", re.compile(r"^教法备注$")),
+    ("answers", re.compile(r"^【?(填空答案|参考答案|答案)】?$")),
+]
+
+# 知识点章节内部的小节，不会结束知识点
+KNOWLEDGE_POINT_PARTS = {"notes", "examples", "example_item", "consolidation", "exercise_item",
+                         "teacher_note", "answers"}
+
+EXERCISE_PARTS = {"consolidation", "exercise_item"}
+
+_TITLE_NUMBERING = re.compile(r"^\d+\s*[|｜丨]?\s*")
+_KP_TITLE = re.compile(r"^知识点\s*[0-9一二三四五六七八九十]+\s*[—\-－:：、.]*\s*")
+_OBJECTIVE_MARKER = re.compile(r"^目标\s*\d+$")
+_OBJECTIVE_LEVEL = re.compile(r"^[★☆✩✭✰\s]+\S{0,4}$")
+_LIST_ITEM = re.compile(r"^\s*(\d+|[①②③④⑤⑥⑦⑧⑨⑩])\s*[.、．)）]?\s*")
+
+
+def body_font_size(pages):
+    """正文字号：按字符数加权出现最多的字号"""
+    sizes = Counter()
+    for lines, _ in pages:
+        for line in lines:
+            sizes[round(line["size"], 1)] += len(line["text"].strip())
+    return sizes.most_common(1)[0][0] if sizes else 10.5
+
+
+def classify_heading(line, body_size):
+    """
+    判断一行是否为章节标题
+
+    返回:
+        (章节类型, 置信度)；不是标题时返回 (None, 0)
+    """
+    text = line["text"].strip()
+    if not text or len(text) > 40:
+        return None, 0.0
+    for kind, pattern in HEADING_PATTERNS:
+        if pattern.match(text):
+            # 关键词 + 加粗/大字号/【】 三者之一即可确认
+            if line["bold"] or line["size"] >= body_size * 1.08:
+                return kind, 0.95
+            if text.startswith("【"):
+                return kind, 0.85
+            return kind, 0.5
+    return None, 0.0
+
+
+def split_sections(pages, body_size):
+    """
+    按标题把全文切分为章节
+
+    返回:
+        章节列表，每个章节包含 kind、heading、page、confidence、lines
+    """
+    sections = [{"kind": "preamble", "heading": "", "page": 1, "confidence": 1.0, "lines": []}]
+    for page_num, (lines, _) in enumerate(pages, 1):
+        for line in lines:
+            kind, confidence = classify_heading(line, body_size)
+            if kind and confidence >= 0.8:
+                sections.append({
+                    "kind": kind, "heading": line["text"].strip(), "page": page_num,
+                    "confidence": confidence, "lines": []
+                })
+            else:
+                sections[-1]["lines"].append(line)
+    return sections
+
+
+def heading_pages(pages, kind):
+    """某类章节标题所在的页码（从1开始）"""
+    body_size = body_font_size(pages)
+    found = set()
+    for page_num, (lines, _) in enumerate(pages, 1):
+        for line in lines:
+            line_kind, confidence = classify_heading(line, body_size)
+            if line_kind == kind and confidence >= 0.8:
+                found.add(page_num)
+    return sorted(found)
+
+
+def join_lines(lines):
+    """合并同一段落中因排版折行的行：上一行排到行尾时直接拼接，否则换行"""
+    if not lines:
+        return ""
+    right_edge = max(line["bbox"][2] for line in lines)
+    text = lines[0]["text"].strip()
+    for prev, line in zip(lines, lines[1:]):
+        separator = "" if prev["bbox"][2] >= right_edge - 15 else "\n"
+        text += separator + line["text"].strip()
+    return text
+
+
+def _section_text(section):
+    return join_lines(section["lines"])
+
+
+def extract_title(pages, body_size):
+    """讲义标题：第一页字号最大的一行（去掉编号）"""
+    if not pages or not pages[0][0]:
+        return None, 0.0
+    lines = pages[0][0]
+    largest = max(line["size"] for line in lines)
+    if largest < body_size * 1.3:
+        return None, 0.0
+    title = next(line["text"].strip() for line in lines if line["size"] == largest)
+    title = _TITLE_NUMBERING.sub("", title).strip()
+    return (title, 0.9) if title else (None, 0.0)
+
+
+def extract_objectives(section):
+    """
+    学习目标：优先按 "目标N" 行分组（表格式排版，目标文字可能跨行），
+    其次按编号列表拆分
+
+    返回:
+        (目标列表, 置信度)
+    """
+    lines = section["lines"]
+    markers = [line for line in lines if _OBJECTIVE_MARKER.match(line["text"].strip())]
+    if markers:
+        centers = [(m["bbox"][1] + m["bbox"][3]) / 2.0 for m in markers]
+        bounds = [(a + b) / 2.0 for a, b in zip(centers, centers[1:])]
+        rows = [[] for _ in markers]
+        for line in lines:
+            text = line["text"].strip()
+            if line in markers or _OBJECTIVE_LEVEL.match(text):
+                continue
+            center = (line["bbox"][1] + line["bbox"][3]) / 2.0
+            rows[sum(center > b for b in bounds)].append(line)
+        objectives = ["".join(line["text"].strip() for line in sorted(row, key=lambda l: l["bbox"][1]))
+                      for row in rows]
+        if all(objectives):
+            return objectives, 0.95
+        return [obj for obj in objectives if obj], 0.5
+
+    items = []
+    for line in lines:
+        text = line["text"].strip()
+        if _LIST_ITEM.match(text):
+            items.append(_LIST_ITEM.sub("", text))
+        elif items:
+            items[-1] += text
+    if items and all(len(item) <= 80 for item in items):
+        return items, 0.8
+    return items, 0.4
+
+
+def segment_document(pages):
+    """
+    预切分讲义
+
+    参数:
+        pages: 每页的 (行列表, 页面高度)，行列表来自 pdf_text.page_lines()（已去除页眉页脚）
+
+    返回:
+        {
+            "fields": {字段名: (值, 置信度)}  本地识别出的 course.json 字段,
+            "sections": 章节列表,
+            "knowledge_point_titles": 知识点标题列表,
+            "knowledge_point_text": 知识点部分的原文（供模型整理知识点使用）
+        }
+    """
+    body_size = body_font_size(pages)
+    sections = split_sections(pages, body_size)
+    by_kind = {}
+    for section in sections:
+        by_kind.setdefault(section["kind"], []).append(section)
+
+    fields = {}
+    title = extract_title(pages, body_size)
+    if title[0]:
+        fields["lecture_title"] = title
+
+    if "learning_objectives" in by_kind:
+        fields["learning_objectives"] = extract_objectives(by_kind["learning_objectives"][0])
+
+    for field, kind in (("exam_analysis", "exam_analysis"), ("class_intro", "class_intro"),
+                        ("quiz_content", "quiz"), ("homework", "homework")):
+        if kind in by_kind:
+            section = by_kind[kind][0]
+            text = _section_text(section)
+            fields[field] = (text, section["confidence"] if text else 0.0)
+
+    if "mindmap" in by_kind:
+        fields["mindmap_pages"] = (sorted({s["page"] for s in by_kind["mindmap"]}), 0.9)
+
+    if "exercise_item" in by_kind:
+        exercises = [f"{s['heading']}\n{_section_text(s)}" for s in by_kind["exercise_item"]]
+        fields["consolidation_exercises"] = (exercises, 0.85)
+
+    # 知识点部分：从第一个知识点标题到出门测/课后作业之前；
+    # 巩固练习已在本地拆出，不再发给模型
+    kp_lines = []
+    in_knowledge_points = False
+    for section in sections:
+        if section["kind"] == "knowledge_point":
+            in_knowledge_points = True
+        elif section["kind"] not in KNOWLEDGE_POINT_PARTS:
+            in_knowledge_points = False
+        if in_knowledge_points and section["kind"] not in EXERCISE_PARTS:
+            kp_lines.append(section["heading"])
+            kp_lines.append(_section_text(section))
+
+    return {
+        "fields": fields,
+        "sections": sections,
+        "knowledge_point_titles": [_KP_TITLE.sub("", s["heading"]).strip() for s in by_kind.get("knowledge_point", [])],
+        "knowledge_point_text": "\n".join(kp_lines),
+    }
+
+
+# 知识点以外、对应讲义中独立章节的字段 → 章节类型（讲义标题在第一个标题之前的开头部分）
+# teaching_process、bg_keywords 由模型根据知识点概括，不对应单独的章节
+SECTION_FIELDS = {
+    "lecture_title": "preamble",
+    "learning_objectives": "learning_objectives",
+    "class_intro": "class_intro",
+    "exam_analysis": "exam_analysis",
+    "mindmap_pages": "mindmap",
+    "quiz_content": "quiz",
+    "homework": "homework",
+}
+
+
+def model_source_text(segments, resolved):
+    """
+    缩减发给解析模型的原文
+
+    巩固练习已在本地拆出时，模型只需要看知识点部分，以及本地没能可靠识别的字段所在的章节
+
+    参数:
+        segments: segment_document() 的结果
+        resolved: 已在本地识别的字段名集合
+
+    返回:
+        按原文顺序拼接的文本；无法缩减时返回None（未识别的字段找不到对应章节时，只能发送全文）
+    """
+    if "consolidation_exercises" not in resolved or not segments["knowledge_point_text"]:
+        return None
+    kinds = {kind for field, kind in SECTION_FIELDS.items() if field not in resolved}
+    if kinds - {section["kind"] for section in segments["sections"]}:
+        return None
+
+    parts = []
+    knowledge_points_added = False
+    for section in segments["sections"]:
+        if section["kind"] == "knowledge_point" and not knowledge_points_added:
+            parts.append(segments["knowledge_point_text"])
+            knowledge_points_added = True
+        elif section["kind"] in kinds:
+            parts.append(f"{section['heading']}\n{_section_text(section)}".strip())
+    return "\n".join(parts)
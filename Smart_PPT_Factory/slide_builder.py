@@ -3,18 +3,88 @@
 支持无占位符布局的文本框添加和智能内容填充
 """
 import os
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN
+import re
+from pptx.util import Inches
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT, RELATIONSHIP_TARGET_MODE as RTM
+from pptx.opc.package import _Relationship
+from pptx.opc.packuri import PackURI
+from pptx.parts.slide import SlidePart
+from text_fit import box_metrics, fit_text
+import text_xml
+from job_context import current_context
+
+
+class SlideAppender:
+    """
+    批量追加幻灯片
+    python-pptx 每次 add_slide 都要扫描全部幻灯片ID和关系，访问 prs.slides 还会重命名全部幻灯片部件，
+    页数越多每页越慢；这里在内存中递增维护下一个幻灯片ID、部件名和关系ID，每页开销与已有页数无关
+    """
+    
+    MIN_SLIDE_ID = 256
+    
+    def __init__(self, prs):
+        # 只访问一次 prs.slides（会把部件名整理为 slide1..slideN）
+        slides = prs.slides
+        self.part = slides.part
+        self._sldIdLst = slides._sldIdLst
+        self._rels = self.part.rels
+        self._sync()
+    
+    def _sync(self):
+        """从现有幻灯片重新计算各计数器（初始化时，或发现有其他代码增删过幻灯片时）"""
+        ids = [int(sld_id.id) for sld_id in self._sldIdLst]
+        self._next_id = max([self.MIN_SLIDE_ID - 1] + ids) + 1
+        numbers = [0]
+        for rel in self._rels.values():
+            if rel.reltype == RT.SLIDE:
+                match = re.search(r"slide(\d+)\.xml$", str(rel.target_part.partname))
+                if match:
+                    numbers.append(int(match.group(1)))
+        self._next_number = max(numbers) + 1
+        # 与 python-pptx 相同的关系ID分配规则：优先用 rId<关系数+1>，已被占用时用其下最大的空缺编号
+        used = self._rels._rels
+        self._rid_gaps = [n for n in range(1, len(used) + 1) if f"rId{n}" not in used]
+        self._count = len(self._sldIdLst)
+    
+    def next_partname(self):
+        """下一张幻灯片的部件名"""
+        if len(self._sldIdLst) != self._count:
+            self._sync()
+        return PackURI(f"/ppt/slides/slide{self._next_number}.xml")
+    
+    def add_slide(self, layout):
+        """追加一张使用 layout 的幻灯片（与 prs.slides.add_slide 结果相同）"""
+        slide_part = SlidePart.new(self.next_partname(), self.part.package, layout.part)
+        self.append_part(slide_part)
+        slide = slide_part.slide
+        slide.shapes.clone_layout_placeholders(layout)
+        return slide
+    
+    def append_part(self, slide_part):
+        """把已创建的幻灯片部件（部件名取自 next_partname）追加到末尾"""
+        rels = self._rels._rels
+        rId = f"rId{len(rels) + 1}"
+        if rId in rels:
+            rId = f"rId{self._rid_gaps.pop()}"
+        rels[rId] = _Relationship(self._rels._base_uri, rId, RT.SLIDE, RTM.INTERNAL, slide_part)
+        self._sldIdLst._add_sldId(id=self._next_id, rId=rId)
+        
+        self._next_id += 1
+        self._next_number += 1
+        self._count += 1
 
 
 class SlideBuilder:
     """幻灯片构建器类"""
     
-    def __init__(self, prs):
+    def __init__(self, prs, context=None):
+        """context: 任务上下文（读取配置覆盖），默认当前任务上下文"""
         self.prs = prs
+        self.settings = (context or current_context()).settings
         self.slide_width = prs.slide_width
         self.slide_height = prs.slide_height
+        self.appender = SlideAppender(prs)
     
     def get_layout(self, index):
         """安全获取布局"""
@@ -25,9 +95,88 @@ class SlideBuilder:
             return self.prs.slide_layouts[1]
     
     def create_slide(self, layout_index):
-        """创建幻灯片"""
+        """创建幻灯片（按增量计数器追加，见 SlideAppender）"""
         layout = self.get_layout(layout_index)
-        return self.prs.slides.add_slide(layout)
+        return self.appender.add_slide(layout)
+
+    @staticmethod
+    def find_placeholder(slide, idx=None, ph_type=None):
+        """按 idx 或类型（如 1=TITLE）查找占位符"""
+        for ph in slide.placeholders:
+            if idx is not None and ph.placeholder_format.idx == idx:
+                return ph
+            if ph_type is not None and ph.placeholder_format.type == ph_type:
+                return ph
+        return None
+
+    def create_text_slides(self, layout_index, texts, fixed=None, title_idx=0):
+        """
+        创建正文可能超长的幻灯片：文字按占位符尺寸排版，放不下时生成同版式的续页
+
+        参数:
+            layout_index: 布局索引
+            texts: {占位符idx: 正文} 需要排版的正文
+            fixed: {占位符idx: 文字} 每页相同的文字（如标题），续页标题加 CONTINUATION_SUFFIX
+            title_idx: fixed 中作为标题的占位符idx
+
+        返回:
+            幻灯片列表（至少一张）
+        """
+        fixed = fixed or {}
+        slides = [self.create_slide(layout_index)]
+        if not self.settings.TEXT_FIT_ENABLED:
+            pages = {idx: ([str(text)], 1.0) for idx, text in texts.items()}
+        else:
+            pages = {}
+            for idx, text in texts.items():
+                ph = self.find_placeholder(slides[0], idx)
+                pages[idx] = (fit_text(text, box_metrics(ph, self.settings.MASTER_TEMPLATE),
+                                       self.settings.TEXT_FIT_MIN_FONT_SCALE)
+                              if ph is not None else ([str(text)], 1.0))
+
+        count = max([len(p) for p, _ in pages.values()] or [1])
+        for page in range(count):
+            slide = slides[0] if page == 0 else self.create_slide(layout_index)
+            if page:
+                slides.append(slide)
+            for idx, text in fixed.items():
+                ph = self.find_placeholder(slide, idx)
+                if ph is not None:
+                    suffix = self.settings.CONTINUATION_SUFFIX if page and idx == title_idx else ""
+                    text_xml.set_text(ph, f"{text}{suffix}")
+            for idx, (chunks, scale) in pages.items():
+                ph = self.find_placeholder(slide, idx)
+                if ph is None:
+                    continue
+                if page >= len(chunks):
+                    # 该字段已在前几页排完，去掉空占位符（避免显示"单击此处添加文本"）
+                    ph._element.getparent().remove(ph._element)
+                    continue
+                size = (round(box_metrics(ph, self.settings.MASTER_TEMPLATE)["font_pt"] * scale, 1)
+                        if scale < 1.0 else None)
+                text_xml.set_text(ph, chunks[page], size)
+        return slides
+
+    def emu_to_pixels(self, emu, dpi=None):
+        """EMU换算为像素（按 IMAGE_TARGET_DPI）"""
+        dpi = dpi or self.settings.IMAGE_TARGET_DPI
+        return max(1, int(round(emu / 914400.0 * dpi)))
+    
+    def slide_pixel_size(self, dpi=None):
+        """整页（全出血背景）的目标像素尺寸"""
+        return (self.emu_to_pixels(self.slide_width, dpi), self.emu_to_pixels(self.slide_height, dpi))
+    
+    def picture_target_size(self, slide, dpi=None):
+        """
+        幻灯片上第一个图片占位符的目标像素尺寸
+        
+        返回:
+            (宽, 高) 像素；没有图片占位符时返回None
+        """
+        for shape in slide.placeholders:
+            if "PICTURE" in str(shape.placeholder_format.type):
+                return (self.emu_to_pixels(shape.width, dpi), self.emu_to_pixels(shape.height, dpi))
+        return None
     
     def fill_placeholders(self, slide, **kwargs):
         """
@@ -42,32 +191,32 @@ class SlideBuilder:
             
             # 标题
             if 'title' in kwargs and ('标题' in ph_name or 'title' in ph_name):
-                ph.text = str(kwargs['title'])
+                text_xml.set_text(ph, kwargs['title'])
             
             # 副标题
             elif 'subtitle' in kwargs and ('副标题' in ph_name or 'subtitle' in ph_name):
-                ph.text = str(kwargs['subtitle'])
+                text_xml.set_text(ph, kwargs['subtitle'])
             
             # 内容/正文
             elif 'content' in kwargs and ('内容' in ph_name or 'content' in ph_name or 'object' in ph_name):
-                ph.text = str(kwargs['content'])
+                text_xml.set_text(ph, kwargs['content'])
             
             # Body
             elif 'body' in kwargs and ('正文' in ph_name or 'body' in ph_name or '文本' in ph_name):
-                ph.text = str(kwargs['body'])
+                text_xml.set_text(ph, kwargs['body'])
         
         # 如果没有匹配到，按索引填充
         if len(placeholders) > 0 and 'title' in kwargs:
-            placeholders[0].text = str(kwargs['title'])
+            text_xml.set_text(placeholders[0], kwargs['title'])
         
         if len(placeholders) > 1 and 'content' in kwargs:
-            placeholders[1].text = str(kwargs['content'])
+            text_xml.set_text(placeholders[1], kwargs['content'])
     
     def add_textbox(self, slide, text, left, top, width, height, 
                     font_size=28, font_name="微软雅黑", bold=False, 
                     color=(0, 0, 0), align="left"):
         """
-        添加文本框
+        添加文本框（按预编译的样式片段一次生成XML，见 text_xml.py）
         
         参数:
             slide: 幻灯片对象
@@ -79,29 +228,11 @@ class SlideBuilder:
             color: RGB颜色元组
             align: 对齐方式 (left/center/right)
         """
-        textbox = slide.shapes.add_textbox(
-            Inches(left), Inches(top), 
-            Inches(width), Inches(height)
+        return text_xml.add_textbox(
+            slide, text,
+            Inches(left), Inches(top), Inches(width), Inches(height),
+            font_size=font_size, font_name=font_name, bold=bold, color=color, align=align
         )
-        
-        tf = textbox.text_frame
-        tf.word_wrap = True
-        tf.text = str(text)
-        
-        for paragraph in tf.paragraphs:
-            paragraph.font.name = font_name
-            paragraph.font.size = Pt(font_size)
-            paragraph.font.bold = bold
-            paragraph.font.color.rgb = RGBColor(*color)
-            
-            if align == "center":
-                paragraph.alignment = PP_ALIGN.CENTER
-            elif align == "right":
-                paragraph.alignment = PP_ALIGN.RIGHT
-            else:
-                paragraph.alignment = PP_ALIGN.LEFT
-        
-        return textbox
     
     def add_title(self, slide, text, font_size=40):
         """添加标题（标准位置）"""
@@ -203,19 +334,19 @@ def create_cover_slide_with_master(cover_prs, cover_info, bg_image=None):
     if len(placeholders) >= 4:
         # 占位符[10]: 小组课·X季课堂
         season = cover_info.get("season", "寒假")
-        placeholders[0].text = f"小组课 · {season}课堂"
+        text_xml.set_text(placeholders[0], f"小组课 · {season}课堂")
         
         # 占位符[11]: 主科目（大字，如"语文"）
         subject = cover_info.get("subject", "语文")
-        placeholders[1].text = subject
+        text_xml.set_text(placeholders[1], subject)
         
         # 占位符[12]: 副标题（如"2025寒假高中小组课"）
         subtitle = cover_info.get("subtitle", "2025寒假高中小组课")
-        placeholders[2].text = subtitle
+        text_xml.set_text(placeholders[2], subtitle)
         
         # 占位符[13]: 详细信息（如"高中语文·高一 主讲人：XXX老师"）
         details = f"高中{subject}·{cover_info.get('grade', '高一')} 主讲人：{cover_info.get('teacher', 'XXX老师')}"
-        placeholders[3].text = details
+        text_xml.set_text(placeholders[3], details)
     
     return slide
 
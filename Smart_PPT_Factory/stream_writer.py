@@ -0,0 +1,135 @@
+"""
+流式写出PPT
+python-pptx 在 prs.save() 时才一次性序列化全部部件，构建期间每页的XML树和每张图片的数据都留在内存中，
+图片多的大课件单个进程峰值可达数百MB；这里在每部分幻灯片完成后立即把幻灯片XML、关系和新用到的媒体
+写入输出zip，然后释放XML树和图片数据，只保留部件名、内容类型、图片SHA1等索引，
+最后再写入演示文稿部件、版式母版和 [Content_Types].xml
+"""
+import os
+import weakref
+import zipfile
+
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.parts.image import ImagePart
+
+
+class _WrittenImagePart(ImagePart):
+    """已写出的图片部件：数据已释放，保留SHA1和原始尺寸（再次插入同一图片时 python-pptx 要用到）"""
+
+    @property
+    def _native_size(self):
+        return self.__dict__["written_native_size"]
+
+
+def _discard(archive, path):
+    """未正常完成时关闭并删除临时文件"""
+    try:
+        archive.close()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class StreamingDeckWriter:
+    """
+    边构建边写出的PPT写入器
+
+    用法:
+        writer = StreamingDeckWriter(prs, output_path)
+        ...创建一部分幻灯片...
+        writer.flush()  # 写出并释放此前完成的幻灯片（之后不能再修改这些幻灯片）
+        ...
+        writer.close()  # 写入其余部件，生成 output_path
+    """
+
+    def __init__(self, prs, output_path):
+        self.part = prs.part
+        self.package = prs.part.package
+        self.output_path = output_path
+        self._sldIdLst = prs.slides._sldIdLst
+        self._last = None
+        # 已写出的部件名（最后写入剩余部件时跳过）
+        self.written = set()
+        self.slides = 0
+        self.media = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        # 先写入同目录的临时文件，完成后原子改名（中途失败不会留下不完整的PPT）
+        self.tmp_path = f"{output_path}.{os.getpid()}.partial"
+        self.archive = zipfile.ZipFile(self.tmp_path, "w", compression=zipfile.ZIP_DEFLATED,
+                                       strict_timestamps=False)
+        self._cleanup = weakref.finalize(self, _discard, self.archive, self.tmp_path)
+
+    def _write(self, partname, blob):
+        self.archive.writestr(partname.membername, blob)
+
+    def _write_part(self, part):
+        self._write(part.partname, part.blob)
+        if len(part.rels):
+            self._write(part.partname.rels_uri, part.rels.xml)
+        self.written.add(str(part.partname))
+
+    def _flush_media(self, part):
+        """写出媒体并释放数据；部件对象保留（图片按SHA1去重时仍能找到，部件名也不会被重复分配）"""
+        if str(part.partname) in self.written:
+            return
+        self._write_part(part)
+        if isinstance(part, ImagePart):
+            part.sha1  # 先计算并缓存SHA1
+            part.__dict__["written_native_size"] = part._native_size
+            part.__class__ = _WrittenImagePart
+        part._blob = None
+        self.media += 1
+
+    def flush(self):
+        """
+        写出上次 flush 之后追加的全部幻灯片及其媒体，并释放它们的XML树
+
+        返回:
+            本次写出的页数
+        """
+        node = self._last.getnext() if self._last is not None else (
+            self._sldIdLst[0] if len(self._sldIdLst) else None)
+        count = 0
+        while node is not None:
+            slide_part = self.part.related_part(node.rId)
+            for rel in slide_part.rels.values():
+                if not rel.is_external and len(rel.target_part.rels) == 0:
+                    self._flush_media(rel.target_part)
+            self._write_part(slide_part)
+            # 幻灯片部件只保留部件名和关系，XML树及缓存的 Slide 对象一并释放
+            slide_part._element = None
+            slide_part.__dict__.pop("slide", None)
+            self._last = node
+            node = node.getnext()
+            count += 1
+        self.slides += count
+        return count
+
+    def close(self):
+        """
+        写出剩余幻灯片和其余部件（演示文稿、版式、母版、主题等），完成输出文件
+
+        返回:
+            输出路径
+        """
+        self.flush()
+        parts = list(self.package.iter_parts())
+        self._write(CONTENT_TYPES_URI, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        self._write(PACKAGE_URI.rels_uri, self.package._rels.xml)
+        for part in parts:
+            if str(part.partname) not in self.written:
+                self._write_part(part)
+        self.archive.close()
+        os.replace(self.tmp_path, self.output_path)
+        self._cleanup.detach()
+        return self.output_path
+
+    def abort(self):
+        """放弃输出，删除临时文件"""
+        self._cleanup()
+
+    def summary(self):
+        return f"流式写出: {self.slides} 页，{self.media} 个媒体文件"
@@ -0,0 +1,133 @@
+"""
+文本模型响应缓存
+相同的课程文本反复构建时，精简文本、知识类型、视觉主题等小调用的结果几乎不变；
+结果按 (模型, 提示词模板版本, 规范化输入) 保存到SQLite，带过期时间和容量上限，
+多个进程（批量worker）可以同时读写
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+from contextlib import closing
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses (expires_at);
+"""
+
+# 命中时最多每隔这么久更新一次访问时间（秒），避免每次读取都写库
+_TOUCH_INTERVAL = 3600
+
+
+def normalize_text(text):
+    """规范化输入：全半角统一、合并空白，排版差异不影响命中"""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).split())
+
+
+def cache_key(model, template_version, *parts):
+    """缓存键：模型、提示词模板版本和规范化后的输入"""
+    payload = json.dumps([model, template_version] + [normalize_text(p) for p in parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TextCache:
+    """文本模型响应的持久化缓存（值为可JSON序列化的小对象）"""
+
+    def __init__(self, db_path=None, ttl=None, max_bytes=None):
+        self.db_path = db_path or config.TEXT_CACHE_PATH
+        self.ttl = config.TEXT_CACHE_TTL_DAYS * 86400 if ttl is None else ttl
+        self.max_bytes = config.TEXT_CACHE_MAX_MB * 1048576 if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def get(self, key):
+        """读取缓存，不存在或已过期时返回None"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value, accessed_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > _TOUCH_INTERVAL:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, model, value, ttl=None):
+        """写入缓存；每写入一定次数检查一次容量"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload.encode("utf-8")), now, now, now + (self.ttl if ttl is None else ttl))
+            )
+        self._writes += 1
+        if self._writes % 50 == 1:
+            self.evict()
+
+    def evict(self):
+        """
+        删除过期条目；总大小超过上限时按最近访问时间淘汰到上限的90%
+
+        返回:
+            删除的条目数
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    to_free = total - int(self.max_bytes * 0.9)
+                    # 按访问时间从旧到新累加，删除到释放量达标为止（含跨过阈值的那一条）
+                    removed += conn.execute(
+                        """DELETE FROM responses WHERE key IN (
+                               SELECT key FROM (
+                                   SELECT key, SUM(size) OVER (ORDER BY accessed_at, key) - size AS freed_before
+                                   FROM responses
+                               ) WHERE freed_before < ?
+                           )""",
+                        (to_free,)
+                    ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / float(total) if total else 0.0
+        return f"文本缓存: 命中 {self.hits}/{total}（{rate:.0%}）"
@@ -0,0 +1,320 @@
+"""
+文本排版估算模块
+按占位符的EMU尺寸、继承的字号/行距/缩进估算文字排版：
+- 每种字体只建一次字宽表（65536个BMP字符，单位为em），换行时用NumPy累加字宽二分查找断点，
+  不逐字调用PIL测量
+- 超出占位符的文字按段落/行拆分到多页，由 SlideBuilder 生成同版式的续页
+"""
+import os
+import unicodedata
+import functools
+
+import numpy as np
+from lxml import etree
+from PIL import ImageFont
+
+import config
+from local_renderer import FONT_CANDIDATES
+
+EMU_PER_PT = 12700
+
+# 模板主题字体 → 字体文件（Windows / macOS / Linux），找不到时使用内置字宽
+TYPEFACE_FILES = {
+    "等线": ["Deng.ttf", "/Library/Fonts/Deng.ttf"],
+    "等线 Light": ["Dengl.ttf", "/Library/Fonts/Dengl.ttf"],
+    "微软雅黑": ["msyh.ttc"],
+    "Arial": ["arial.ttf", "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"],
+}
+
+# 内置Latin字宽（Helvetica/Arial 度量，1/1000 em），覆盖 0x20-0x7E
+_ASCII_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+# 避头尾：不能出现在行首 / 行尾的标点
+_NO_LINE_START = set("，。、；：？！）》」』】〕’”…—％‰,.;:?!)]}%")
+_NO_LINE_END = set("（《「『【〔‘“([{")
+
+# 单行行高约为字号的1.2倍（PowerPoint 单倍行距）
+_SINGLE_LINE = 1.2
+
+# (模板路径, 版式部件名, 占位符idx, 尺寸) → box_metrics() 结果
+_METRICS_CACHE = {}
+
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+
+
+# ========== 字宽表 ==========
+
+@functools.lru_cache(maxsize=1)
+def _base_widths():
+    """按 Unicode 东亚宽度划分的默认字宽：全角/宽字符、歧义字符（①、×、“”）为1em"""
+    widths = np.full(0x10000, 0.556, np.float32)
+    for code in range(0x10000):
+        kind = unicodedata.east_asian_width(chr(code))
+        if kind in ("W", "F", "A"):
+            widths[code] = 1.0
+        elif unicodedata.category(chr(code)) in ("Cc", "Mn", "Me", "Cf"):
+            widths[code] = 0.0
+    widths[0x20:0x7F] = np.array(_ASCII_WIDTHS, np.float32) / 1000.0
+    widths[0x09] = widths[0x20] * 4
+    return widths
+
+
+def _find_font_file(typeface, bold=False):
+    for candidate in TYPEFACE_FILES.get(typeface, []) + FONT_CANDIDATES[bold]:
+        try:
+            return ImageFont.truetype(candidate, 1000)
+        except OSError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=16)
+def glyph_widths(typeface, bold=False):
+    """
+    字体的字宽表（每种字体只构建一次）
+
+    有字体文件时用PIL测量 Latin、标点、全角区的实际字宽，CJK表意文字统一按"中"字宽度；
+    否则使用内置度量
+
+    返回:
+        (65536,) float32，单位 em；码位超出BMP的字符按最后一项（1em）计算
+    """
+    widths = _base_widths().copy()
+    font = _find_font_file(typeface, bold)
+    if font is not None:
+        for start, end in ((0x20, 0x250), (0x2000, 0x2070), (0x3000, 0x3040), (0xFF00, 0xFFF0)):
+            for code in range(start, end):
+                widths[code] = font.getlength(chr(code)) / 1000.0
+        ideograph = font.getlength("中") / 1000.0
+        widths[0x4E00:0xA000] = ideograph
+        widths[0x3400:0x4DC0] = ideograph
+    widths[0xFFFF] = 1.0
+    return widths
+
+
+# ========== 占位符度量 ==========
+
+def _theme_fonts(master):
+    """主题字体 {"+mn-lt": ..., "+mj-lt": ...}"""
+    for rel in master.part.rels.values():
+        if rel.reltype.endswith("/theme"):
+            theme = etree.fromstring(rel.target_part.blob)
+            fonts = {}
+            for tag, prefix in (("minorFont", "+mn-"), ("majorFont", "+mj-")):
+                node = theme.find(f".//{_A}{tag}")
+                if node is not None:
+                    for script in ("latin", "ea"):
+                        child = node.find(_A + script)
+                        fonts[prefix + ("lt" if script == "latin" else "ea")] = child.get("typeface") if child is not None else ""
+            return fonts
+    return {}
+
+
+def _style_chain(placeholder):
+    """从近到远的样式来源：占位符及其版式/母版占位符的 lstStyle，最后是母版的文字样式"""
+    chain, bodies = [], []
+    node = placeholder
+    while node is not None:
+        bodies.append(node._element.find(f".//{_A}bodyPr"))
+        chain.append(node._element.find(f".//{_A}lstStyle/{_A}lvl1pPr"))
+        node = getattr(node, "_base_placeholder", None)
+
+    master = placeholder.part.slide_layout.slide_master if hasattr(placeholder.part, "slide_layout") \
+        else placeholder.part.slide_master
+    kind = "titleStyle" if str(placeholder.placeholder_format.type).startswith(("TITLE", "CENTER_TITLE")) else "bodyStyle"
+    chain.append(master._element.find(f".//{_P}txStyles/{_P}{kind}/{_A}lvl1pPr"))
+    return [c for c in chain if c is not None], [b for b in bodies if b is not None], master
+
+
+def _first(elements, path, attr):
+    for element in elements:
+        node = element if path is None else element.find(path)
+        if node is not None and node.get(attr) is not None:
+            return node.get(attr)
+    return None
+
+
+def _spacing(chain, tag):
+    """行距/段前段后：返回 (倍数, 磅值)，其中之一为None"""
+    pct = _first(chain, f"{_A}{tag}/{_A}spcPct", "val")
+    if pct is not None:
+        return int(pct) / 100000.0, None
+    pts = _first(chain, f"{_A}{tag}/{_A}spcPts", "val")
+    if pts is not None:
+        return None, int(pts) / 100.0
+    return None, None
+
+
+def box_metrics(placeholder, template=None):
+    """
+    占位符的排版参数
+
+    参数:
+        placeholder: 幻灯片上的占位符
+        template: 演示文稿所用模板的路径；给出时按 (模板, 版式, 占位符, 尺寸) 缓存结果，
+            不同模板的同名版式不会混用（部件对象的 id() 在对象回收后可能被复用，不能作为键）
+
+    返回:
+        {"width", "height"（可用EMU）, "font_pt", "line_pct"/"line_pt", "before_pt", "after_pt",
+         "typeface", "bold"}
+    """
+    layout_ph = getattr(placeholder, "_base_placeholder", None)
+    key = None
+    if template and layout_ph is not None:
+        key = (os.path.abspath(template), str(layout_ph.part.partname), layout_ph.placeholder_format.idx,
+               placeholder.width, placeholder.height)
+        if key in _METRICS_CACHE:
+            return _METRICS_CACHE[key]
+
+    chain, bodies, master = _style_chain(placeholder)
+    insets = [int(_first(bodies, None, attr) or default)
+              for attr, default in (("lIns", 91440), ("rIns", 91440), ("tIns", 45720), ("bIns", 45720))]
+    margin = int(_first(chain, None, "marL") or 0)
+    font_pt = int(_first(chain, f"{_A}defRPr", "sz") or 1800) / 100.0
+    scale = _first(bodies, f"{_A}normAutofit", "fontScale")
+    if scale:
+        font_pt *= int(scale) / 100000.0
+    typeface = _first(chain, f"{_A}defRPr/{_A}latin", "typeface") or "+mn-lt"
+    typeface = _theme_fonts(master).get(typeface, typeface)
+    line_pct, line_pt = _spacing(chain, "lnSpc")
+    before_pct, before_pt = _spacing(chain, "spcBef")
+    after_pct, after_pt = _spacing(chain, "spcAft")
+
+    metrics = {
+        "width": max(placeholder.width - insets[0] - insets[1] - margin, EMU_PER_PT),
+        "height": max(placeholder.height - insets[2] - insets[3], EMU_PER_PT),
+        "font_pt": font_pt,
+        "line_pct": line_pct if line_pct is not None or line_pt is not None else 1.0,
+        "line_pt": line_pt,
+        "before_pt": before_pt if before_pt is not None else (before_pct or 0.0) * font_pt * _SINGLE_LINE,
+        "after_pt": after_pt if after_pt is not None else (after_pct or 0.0) * font_pt * _SINGLE_LINE,
+        "typeface": typeface,
+        "bold": _first(chain, f"{_A}defRPr", "b") == "1",
+    }
+    if key:
+        _METRICS_CACHE[key] = metrics
+    return metrics
+
+
+# ========== 换行与分页 ==========
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+def wrap_paragraph(text, widths, capacity):
+    """
+    按字宽表把一个段落折成行
+
+    参数:
+        widths: glyph_widths() 字宽表
+        capacity: 每行可容纳的宽度（em）
+
+    返回:
+        行文本列表（拼接后等于原段落）
+    """
+    if not text:
+        return [""]
+    codes = np.frombuffer(text.encode("utf-32-le"), np.uint32)
+    cumulative = np.cumsum(widths[np.minimum(codes, 0xFFFF)], dtype=np.float64)
+    n = len(text)
+    lines, start, base = [], 0, 0.0
+    while start < n:
+        end = int(np.searchsorted(cumulative, base + capacity, side="right"))
+        end = max(end, start + 1)
+        if end < n:
+            if text[end] in _NO_LINE_START:
+                # 标点悬挂在行尾（hangingPunct），不放到下一行行首
+                end += 1
+            elif end - 1 > start and text[end - 1] in _NO_LINE_END:
+                end -= 1
+            elif _is_word_char(text[end]) and _is_word_char(text[end - 1]):
+                # 英文单词不拆开：退回到单词前
+                cut = end - 1
+                while cut > start and _is_word_char(text[cut - 1]):
+                    cut -= 1
+                if cut > start:
+                    end = cut
+        lines.append(text[start:end])
+        base = cumulative[end - 1]
+        start = end
+    return lines
+
+
+def _line_height_pt(metrics, font_pt):
+    if metrics["line_pt"] is not None:
+        return metrics["line_pt"]
+    return metrics["line_pct"] * font_pt * _SINGLE_LINE
+
+
+def paginate(text, metrics, font_scale=1.0):
+    """
+    把文字按占位符容量拆分为多页
+
+    段落在页内放不下时按行拆分，且不在页底只留一行、也不把一行单独留给下一页
+
+    返回:
+        每页的文字列表（至少一页）
+    """
+    font_pt = metrics["font_pt"] * font_scale
+    widths = glyph_widths(metrics["typeface"], metrics["bold"])
+    capacity = metrics["width"] / float(font_pt * EMU_PER_PT)
+    line_h = _line_height_pt(metrics, font_pt)
+    page_h = metrics["height"] / float(EMU_PER_PT)
+    gap = (metrics["before_pt"] + metrics["after_pt"]) * font_scale
+
+    pages, current, used = [], [], 0.0
+    for paragraph in str(text).split("\n"):
+        lines = wrap_paragraph(paragraph, widths, capacity)
+        while lines:
+            space = gap if current else 0.0
+            fit = int((page_h - used - space) // line_h) if page_h - used - space >= line_h else 0
+            if fit >= len(lines):
+                current.append("".join(lines))
+                used += space + line_h * len(lines)
+                break
+            if len(lines) > 1 and fit == len(lines) - 1 and fit > 1:
+                fit -= 1  # 不把最后一行单独留给下一页
+            if fit <= 1 and current and len(lines) > 1:
+                fit = 0  # 页底只剩一行时整段移到下一页
+            if fit == 0 and not current:
+                fit = 1  # 一行都放不下的页面至少放一行，避免死循环
+            if fit:
+                current.append("".join(lines[:fit]))
+                lines = lines[fit:]
+            pages.append("\n".join(current))
+            current, used = [], 0.0
+    if current or not pages:
+        pages.append("\n".join(current))
+    return pages
+
+
+def fit_text(text, metrics, min_scale=None):
+    """
+    为占位符安排文字：能放下时原样放入；略超出时在 min_scale 范围内缩小字号；
+    仍放不下时按原字号分页
+
+    返回:
+        (每页文字列表, 字号缩放比例)
+    """
+    min_scale = config.TEXT_FIT_MIN_FONT_SCALE if min_scale is None else min_scale
+    pages = paginate(text, metrics)
+    if len(pages) == 1:
+        return pages, 1.0
+    if len(pages) > 2 or min_scale >= 1.0:
+        # 缩小15%以内的字号最多多容纳约40%，超过一页的溢出不必再尝试
+        return pages, 1.0
+    scale = 0.95
+    while scale >= min_scale - 1e-6:
+        if len(paginate(text, metrics, scale)) == 1:
+            return [str(text)], scale
+        scale -= 0.05
+    return pages, 1.0
@@ -0,0 +1,111 @@
+"""
+文本XML快速写入
+python-pptx 写文字时逐段创建代理对象，再逐项设置字体、字号、加粗、颜色、对齐，每一步都要查找或新建子元素；
+这里把段落/文字属性预编译成XML片段（按样式缓存），整段文字拼成一个字符串一次解析后挂到形状上，
+生成的XML与 python-pptx 逐项设置的结果完全相同
+"""
+import re
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
+
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.util import Pt
+
+# 与 python-pptx 相同：制表符、换行以外的控制字符写成 _xHHHH_
+_CTRL_CHARS = re.compile(r"([\x00-\x08\x0B-\x1F])")
+
+ALIGNMENTS = {"left": "l", "center": "ctr", "right": "r"}
+
+_TEXTBOX_TEMPLATE = (
+    f'<p:sp {nsdecls("p", "a", "r")}>'
+    '<p:nvSpPr><p:cNvPr id="{id}" name="TextBox {number}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+    '<p:txBody><a:bodyPr wrap="square"><a:spAutoFit/></a:bodyPr><a:lstStyle/>{paragraphs}</p:txBody>'
+    '</p:sp>'
+)
+_PARAGRAPHS_WRAPPER = f'<p:txBody {nsdecls("p", "a")}>{{paragraphs}}</p:txBody>'
+
+
+def _escape_text(text):
+    return escape(_CTRL_CHARS.sub(lambda m: "_x%04X_" % ord(m.group(1)), text))
+
+
+@lru_cache(maxsize=256)
+def paragraph_properties(align, font_name, font_size, bold, color):
+    """
+    段落属性 <a:pPr> 片段（对应 paragraph.alignment 与 paragraph.font.* 的设置结果）
+
+    参数:
+        align: "left" | "center" | "right"
+        font_name: 字体
+        font_size: 字号（磅）
+        bold: 是否加粗
+        color: RGB颜色元组
+    """
+    return (
+        f'<a:pPr algn="{ALIGNMENTS.get(align, "l")}">'
+        f'<a:defRPr sz="{Pt(font_size).centipoints}" b="{1 if bold else 0}">'
+        f'<a:solidFill><a:srgbClr val="{"%02X%02X%02X" % tuple(color)}"/></a:solidFill>'
+        f'<a:latin typeface={quoteattr(font_name)}/>'
+        '</a:defRPr></a:pPr>'
+    )
+
+
+@lru_cache(maxsize=256)
+def run_properties(font_size):
+    """文字属性 <a:rPr> 片段（对应 run.font.size 的设置结果）；font_size 为None时为空"""
+    return "" if font_size is None else f'<a:rPr sz="{Pt(font_size).centipoints}"/>'
+
+
+def paragraphs_xml(text, ppr="", rpr=""):
+    """
+    文字 → <a:p> 序列的XML（与 text_frame.text 相同：按 \\n 分段，\\v 为段内换行，不生成空的文字段）
+
+    参数:
+        ppr: 每段的 <a:pPr> 片段
+        rpr: 每个文字段的 <a:rPr> 片段
+    """
+    paragraphs = []
+    for line in str(text).split("\n"):
+        parts = []
+        for i, piece in enumerate(line.split("\v")):
+            if i:
+                parts.append("<a:br/>")
+            if piece:
+                parts.append(f"<a:r>{rpr}<a:t>{_escape_text(piece)}</a:t></a:r>")
+        body = ppr + "".join(parts)
+        paragraphs.append(f"<a:p>{body}</a:p>" if body else "<a:p/>")
+    return "".join(paragraphs)
+
+
+def set_text(shape, text, font_size=None):
+    """
+    替换形状（占位符或文本框）的全部文字，等价于 shape.text = text
+    再逐个设置 run.font.size = Pt(font_size)（font_size 为None时不设置）
+    """
+    txBody = shape._element.get_or_add_txBody()
+    for p in txBody.p_lst:
+        txBody.remove(p)
+    wrapper = parse_xml(_PARAGRAPHS_WRAPPER.format(paragraphs=paragraphs_xml(text, rpr=run_properties(font_size))))
+    txBody.extend(wrapper)
+
+
+def add_textbox(slide, text, x, y, cx, cy, font_size=28, font_name="微软雅黑", bold=False,
+                color=(0, 0, 0), align="left"):
+    """
+    一次性生成并追加文本框（位置尺寸为EMU），与 SlideBuilder 原先逐项设置的结果相同
+
+    返回:
+        文本框形状
+    """
+    shapes = slide.shapes
+    shape_id = shapes._next_shape_id
+    ppr = paragraph_properties(align, font_name, font_size, bool(bold), tuple(color))
+    sp = parse_xml(_TEXTBOX_TEMPLATE.format(
+        id=shape_id, number=shape_id - 1, x=int(x), y=int(y), cx=int(cx), cy=int(cy),
+        paragraphs=paragraphs_xml(text, ppr=ppr),
+    ))
+    shapes._spTree.insert_element_before(sp, "p:extLst")
+    return shapes._shape_factory(sp)